@@ -18,14 +18,37 @@ class Controller:
         self._path_planning_parameters = path_planning.planning_parameters.PlanningParameters(config["limits"],
                                                                                               world_map,
                                                                                               drive.model)
-        self._path_planner = path_planning.prm.Prm(self._path_planning_parameters)
-        self._path = self._path_planner.plan_path(path_planning.simple_state(0, 0, 0),
-                                            #path_planning.simple_state(12, 12, math.radians(90)))
-                                            path_planning.simple_state(12, 15, math.radians(0)))
+        # Roadmap is obtained and paths are planned in background threads,
+        # update() starts following the path once it is ready.
+        self._path_planner = path_planning.planner_service.PlannerService(self._path_planning_parameters)
+        self._path = None
+        self._path_future = self._path_planner.submit(path_planning.simple_state(0, 0, 0),
+                                                      #path_planning.simple_state(12, 12, math.radians(90)))
+                                                      path_planning.simple_state(12, 15, math.radians(0)))
+
+    def shutdown(self):
+        """ Stop background path planning without waiting for it. """
+        self._path_planner.shutdown(wait=False)
+        self._path_future = None
+
+    def _poll_path(self):
+        if self._path_future is None or not self._path_future.done():
+            return
+
+        future = self._path_future
+        self._path_future = None
+        try:
+            self._path = future.result()
+        except Exception:
+            self._logger.exception("Path planning failed")
+        else:
+            if self._path is None:
+                self._logger.info("Path not found")
 
     def update(self, current_state, delta_t):
         self.forward = 0
         self.turn = 0
+        self._poll_path()
         if self._path:
             self._path.advance(delta_t)
 
@@ -24,6 +24,10 @@ class JoystickController:
             self._joystick.init()
             self._logger.info("Using joystick " + self._joystick.get_name())
 
+    def shutdown(self):
+        if self._joystick is not None:
+            self._joystick.quit()
+
     def update(self, delta_t):
         if self._joystick is None:
             self._drive.set_command(0, 0)
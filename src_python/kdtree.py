@@ -1,4 +1,7 @@
 import math
+import heapq
+import itertools
+import numpy
 
 class KdTree:
     __slots__ = ("axis", "coord", "left", "right")
@@ -31,6 +34,74 @@ class KdTree:
     def nearest_neighbors(self, coord):
         return ((x[1], x[2]) for x in self._nearest_neighbors(self, coord, float("inf")))
 
+    def nearest(self, coord, k, max_distance = float("inf")):
+        """ Return list of at most k (coord, value) pairs nearest to coord,
+        no further than max_distance, sorted by distance.
+        Subtrees are visited best first, ordered by distance of their bounding box. """
+
+        x = coord[0]
+        y = coord[1]
+        max_squared_distance = max_distance * max_distance
+        counter = itertools.count() # Tie breaker, nodes are not comparable
+
+        ret = []
+
+        # Heap items are either subtrees with a bounding box distance
+        # (split into x and y offset), or points with exact distance (offset is None).
+        waiting = [(0, next(counter), self, (0, 0))]
+        while len(waiting) and len(ret) < k:
+            distance, _, item, offset = heapq.heappop(waiting)
+            if distance > max_squared_distance:
+                break
+
+            if offset is None:
+                ret.append(item)
+            elif isinstance(item, self.__class__):
+                q = coord[item.axis]
+                for child, edge_offset in ((item.left, q - item.coord), (item.right, item.coord - q)):
+                    child_offset = list(offset)
+                    child_offset[item.axis] = max(child_offset[item.axis], edge_offset)
+                    child_distance = child_offset[0] * child_offset[0] + child_offset[1] * child_offset[1]
+                    if child_distance <= max_squared_distance:
+                        heapq.heappush(waiting, (child_distance, next(counter), child, child_offset))
+            else:
+                for point in item:
+                    dx = point[0][0] - x
+                    dy = point[0][1] - y
+                    point_distance = dx * dx + dy * dy
+                    if point_distance <= max_squared_distance:
+                        heapq.heappush(waiting, (point_distance, next(counter), point, None))
+
+        return ret
+
+    def within_radius(self, coord, radius):
+        """ Return list of all (coord, value) pairs not further than radius from coord, in no particular order. """
+        x = coord[0]
+        y = coord[1]
+        squared_radius = radius * radius
+
+        ret = []
+        stack = [(self, 0, 0)]
+        while len(stack):
+            node, offset_x, offset_y = stack.pop()
+
+            if not isinstance(node, self.__class__):
+                for point in node:
+                    dx = point[0][0] - x
+                    dy = point[0][1] - y
+                    if dx * dx + dy * dy <= squared_radius:
+                        ret.append(point)
+                continue
+
+            q = coord[node.axis]
+            for child, edge_offset in ((node.left, q - node.coord), (node.right, node.coord - q)):
+                child_offset = [offset_x, offset_y]
+                child_offset[node.axis] = max(child_offset[node.axis], edge_offset)
+                if child_offset[0] * child_offset[0] + child_offset[1] * child_offset[1] <= squared_radius:
+                    stack.append((child, child_offset[0], child_offset[1]))
+
+        return ret
+
     @classmethod
     def _nearest_neighbors(cls, node, coord, distance_to_edge):
         if not isinstance(node, cls):
@@ -91,50 +162,64 @@ class KdTree:
                     return
 
     def build(self, data):
-        min_x = float("inf")
-        max_x = -float("inf")
-        min_y = float("inf")
-        max_y = -float("inf")
-
-        for coord, value in data:
-            x = coord[0]
-            y = coord[1]
-            min_x = min(x, min_x)
-            max_x = max(x, max_x)
-            min_y = min(y, min_y)
-            max_y = max(y, max_y)
-
-        self._build(data, min_x, max_x, min_y, max_y)
-
-    def _build(self, data, min_x, max_x, min_y, max_y):
-        if max_x - min_x > max_y - min_y:
+        data = list(data)
+        if not len(data):
+            self.axis = 0
+            self.coord = 0
+            self.left = []
+            self.right = []
+            return
+
+        # Sort the data along both axes just once, the order is then kept when
+        # splitting, so that the whole build takes O(n log n).
+        by_x = sorted(range(len(data)), key=lambda i: data[i][0][0])
+        by_y = sorted(range(len(data)), key=lambda i: data[i][0][1])
+
+        self._build(data, (by_x, by_y), [False] * len(data))
+
+    def _build(self, data, presorted, is_left):
+        """ Build the subtree from indices into data presorted along both axes.
+        is_left is a scratch list of False values, one for each item in data. """
+
+        # Bounding box is given by the first and last items of the sorted lists
+        extents = [data[indices[-1]][0][axis] - data[indices[0]][0][axis]
+                   for axis, indices in enumerate(presorted)]
+        if extents[0] > extents[1]:
             self.axis = 0
         else:
             self.axis = 1
 
-        # TODO: Don't sort along the same axis twice
         # TODO: Maybe only approximate median sampling several random nodes.
-        sorted_data = sorted(data, key=lambda x: x[0][self.axis])
-        split_index = len(data) // 2
+        sorted_indices = presorted[self.axis]
+        split_index = len(sorted_indices) // 2
 
-        left_data = sorted_data[:split_index]
-        right_data = sorted_data[split_index:]
+        left_indices = sorted_indices[:split_index]
+        right_indices = sorted_indices[split_index:]
 
-        self.coord = right_data[0][0][self.axis]
+        self.coord = data[right_indices[0]][0][self.axis]
 
-        if len(left_data) < self.split_threshold:
-            self.left = left_data
-        else:
-            self.left = self.__class__()
-            self.left.build(left_data)
+        for i in left_indices:
+            is_left[i] = True
+        other_left = [i for i in presorted[1 - self.axis] if is_left[i]]
+        other_right = [i for i in presorted[1 - self.axis] if not is_left[i]]
+        for i in left_indices:
+            is_left[i] = False
+
+        self.left = self._build_child(data, left_indices, other_left, is_left)
+        self.right = self._build_child(data, right_indices, other_right, is_left)
+
+    def _build_child(self, data, sorted_indices, other_sorted_indices, is_left):
+        if len(sorted_indices) < self.split_threshold:
+            return [data[i] for i in sorted_indices]
 
-        if len(right_data) < self.split_threshold:
-            self.right = right_data
+        if self.axis == 0:
+            presorted = (sorted_indices, other_sorted_indices)
         else:
-            self.right = self.__class__()
-            self.right.build(right_data)
+            presorted = (other_sorted_indices, sorted_indices)
 
-        # TODO: Reuse the bounding box
+        child = self.__class__()
+        child._build(data, presorted, is_left)
+        return child
 
     def rebuild(self):
         self.build(self)
@@ -173,3 +258,384 @@ class KdTree:
             level_str += '|-- '
 
         return level_str
+
+class StaticKdTree:
+    """ Kd tree over a fixed set of 2D points, stored in flat numpy arrays.
+
+    Nodes are numbered in depth first order (left child of node i is i + 1),
+    every node owns a contiguous block [start, end) of the reordered point array
+    and keeps its bounding box. Leaves hold at most leaf_size points.
+    Queries return ids of the points (indices into the original coordinate array
+    unless ids were given explicitly) and distances, both as numpy arrays. """
+
+    leaf_size = 16
+
+    # Up to this number of points, batched queries compare against all points
+    # at once instead of walking the tree.
+    brute_force_limit = 1024
+
+    def __init__(self, coords, ids = None):
+        coords = numpy.asarray(coords, dtype=numpy.double).reshape(-1, 2)
+        if ids is None:
+            ids = numpy.arange(len(coords))
+        else:
+            ids = numpy.asarray(ids)
+            if ids.shape != (len(coords),):
+                raise ValueError("There must be exactly one id for every point.")
+
+        order = numpy.arange(len(coords))
+        axis = []
+        split = []
+        right = []
+        start = []
+        end = []
+        bbox = []
+
+        # (start, end, node whose right child this is)
+        stack = [(0, len(coords), -1)] if len(coords) else []
+        while len(stack):
+            node_start, node_end, parent = stack.pop()
+            node = len(axis)
+            if parent >= 0:
+                right[parent] = node
+
+            points = coords[order[node_start:node_end]]
+            low = points.min(axis=0).tolist()
+            high = points.max(axis=0).tolist()
+
+            start.append(node_start)
+            end.append(node_end)
+            bbox.append((low[0], low[1], high[0], high[1]))
+            right.append(-1)
+
+            if node_end - node_start <= self.leaf_size:
+                axis.append(-1)
+                split.append(0)
+                continue
+
+            node_axis = int(high[1] - low[1] > high[0] - low[0])
+            mid = (node_end - node_start) // 2
+            partition = numpy.argpartition(points[:, node_axis], mid)
+            order[node_start:node_end] = order[node_start:node_end][partition]
+
+            axis.append(node_axis)
+            split.append(coords[order[node_start + mid], node_axis])
+
+            # Left child is popped first and gets index node + 1
+            stack.append((node_start + mid, node_end, node))
+            stack.append((node_start, node_start + mid, -1))
+
+        self._set_arrays(coords[order], ids[order],
+                         numpy.array(axis, dtype=numpy.int8),
+                         numpy.array(split, dtype=numpy.double),
+                         numpy.array(right, dtype=numpy.int32),
+                         numpy.array(start, dtype=numpy.int32),
+                         numpy.array(end, dtype=numpy.int32),
+                         numpy.array(bbox, dtype=numpy.double).reshape(-1, 4))
+
+    array_names = ("coords", "ids", "axis", "split", "right", "start", "end", "bbox")
+
+    @classmethod
+    def from_arrays(cls, coords, ids, axis, split, right, start, end, bbox):
+        """ Create the tree from arrays of a previously built one (attributes
+        listed in array_names), for example loaded from a file. """
+        tree = cls.__new__(cls)
+        tree._set_arrays(coords, ids, axis, split, right, start, end, bbox)
+        return tree
+
+    def _set_arrays(self, coords, ids, axis, split, right, start, end, bbox):
+        self.coords = coords
+        self.ids = ids
+        self.axis = axis
+        self.split = split
+        self.right = right
+        self.start = start
+        self.end = end
+        self.bbox = bbox
+
+        # Indexing numpy arrays element by element is slow, the traversal
+        # works on plain lists instead.
+        self._nodes = list(zip(axis.tolist(), right.tolist(), start.tolist(), end.tolist(),
+                               map(tuple, bbox.tolist())))
+
+    def __len__(self):
+        return len(self.coords)
+
+    def __iter__(self):
+        return zip(map(tuple, self.coords.tolist()), self.ids.tolist())
+
+    def query_k(self, coord, k):
+        """ Return ids and distances of k points nearest to coord, sorted by distance. """
+        indices, squared_distances = self._query_k(coord[0], coord[1], k)
+        return self.ids[indices], numpy.sqrt(squared_distances)
+
+    def nearest(self, coord, k, max_distance = float("inf")):
+        """ Like query_k, but ignores points further than max_distance. """
+        indices, squared_distances = self._query_k(coord[0], coord[1], k, max_distance * max_distance)
+        return self.ids[indices], numpy.sqrt(squared_distances)
+
+    def within_radius(self, coord, radius):
+        """ Return ids and distances of all points not further than radius
+        from coord, in no particular order. """
+        indices, squared_distances = self._within_radius(coord[0], coord[1], radius * radius)
+        return self.ids[indices], numpy.sqrt(squared_distances)
+
+    def query_k_many(self, coords, k):
+        """ Batched version of query_k.
+        Returns two arrays of shape (len(coords), min(k, len(self))). """
+        coords = numpy.asarray(coords, dtype=numpy.double).reshape(-1, 2)
+        k = max(0, min(k, len(self)))
+
+        ret_ids = numpy.empty((len(coords), k), dtype=self.ids.dtype)
+        ret_distances = numpy.empty((len(coords), k))
+
+        if k == 0:
+            pass
+        elif len(self) <= self.brute_force_limit:
+            # Limit the size of the temporary distance matrix
+            chunk = max(1, (1 << 20) // len(self))
+            for chunk_start in range(0, len(coords), chunk):
+                block = coords[chunk_start:chunk_start + chunk]
+                squared = ((block[:, numpy.newaxis, :] - self.coords[numpy.newaxis, :, :])**2).sum(axis=2)
+                if k < len(self):
+                    indices = numpy.argpartition(squared, k - 1, axis=1)[:, :k]
+                    squared = numpy.take_along_axis(squared, indices, axis=1)
+                else:
+                    indices = numpy.broadcast_to(numpy.arange(len(self)), squared.shape)
+                order = numpy.argsort(squared, axis=1, kind="stable")
+                ret_ids[chunk_start:chunk_start + len(block)] = \
+                    self.ids[numpy.take_along_axis(indices, order, axis=1)]
+                ret_distances[chunk_start:chunk_start + len(block)] = \
+                    numpy.sqrt(numpy.take_along_axis(squared, order, axis=1))
+        else:
+            for i, (x, y) in enumerate(coords.tolist()):
+                indices, squared_distances = self._query_k(x, y, k)
+                ret_ids[i] = self.ids[indices]
+                ret_distances[i] = numpy.sqrt(squared_distances)
+
+        return ret_ids, ret_distances
+
+    def _query_k(self, x, y, k, max_squared_distance = float("inf")):
+        """ Best first search for k nearest points.
+        Returns indices into self.coords and squared distances. """
+
+        best_indices = numpy.empty(0, dtype=numpy.intp)
+        best_distances = numpy.empty(0)
+
+        if k <= 0 or not len(self._nodes):
+            return best_indices, best_distances
+
+        bound = max_squared_distance
+        waiting = [(0.0, 0)]
+        while len(waiting):
+            box_distance, node = heapq.heappop(waiting)
+            if box_distance > bound:
+                break
+
+            axis, right, start, end, _ = self._nodes[node]
+
+            if axis >= 0:
+                for child in (node + 1, right):
+                    child_distance = self._box_squared_distance(self._nodes[child][4], x, y)
+                    if child_distance <= bound:
+                        heapq.heappush(waiting, (child_distance, child))
+                continue
+
+            block = self.coords[start:end]
+            dx = block[:, 0] - x
+            dy = block[:, 1] - y
+            distances = dx * dx + dy * dy
+            mask = distances <= bound
+            if not mask.all():
+                distances = distances[mask]
+                indices = numpy.arange(start, end)[mask]
+            else:
+                indices = numpy.arange(start, end)
+
+            best_indices = numpy.concatenate((best_indices, indices))
+            best_distances = numpy.concatenate((best_distances, distances))
+
+            if len(best_distances) >= k:
+                if len(best_distances) > k:
+                    keep = numpy.argpartition(best_distances, k - 1)[:k]
+                    best_indices = best_indices[keep]
+                    best_distances = best_distances[keep]
+                bound = best_distances.max()
+
+        order = numpy.argsort(best_distances, kind="stable")
+        return best_indices[order], best_distances[order]
+
+    def _within_radius(self, x, y, squared_radius):
+        """ Returns indices into self.coords and squared distances. """
+        indices = []
+        distances = []
+
+        stack = [0] if len(self._nodes) else []
+        while len(stack):
+            node = stack.pop()
+            axis, right, start, end, box = self._nodes[node]
+
+            if self._box_squared_distance(box, x, y) > squared_radius:
+                continue
+
+            if axis >= 0:
+                stack.append(right)
+                stack.append(node + 1)
+                continue
+
+            block = self.coords[start:end]
+            dx = block[:, 0] - x
+            dy = block[:, 1] - y
+            block_distances = dx * dx + dy * dy
+            mask = block_distances <= squared_radius
+            indices.append(numpy.arange(start, end)[mask])
+            distances.append(block_distances[mask])
+
+        if not len(indices):
+            return numpy.empty(0, dtype=numpy.intp), numpy.empty(0)
+        return numpy.concatenate(indices), numpy.concatenate(distances)
+
+    @staticmethod
+    def _box_squared_distance(box, x, y):
+        min_x, min_y, max_x, max_y = box
+        dx = max(min_x - x, 0, x - max_x)
+        dy = max(min_y - y, 0, y - max_y)
+        return dx * dx + dy * dy
+
+
+class IncrementalKdTree:
+    """ Kd tree with cheap insertions that stays balanced (logarithmic method).
+
+    New points go to a small unindexed buffer. When the buffer fills up it is
+    merged together with all consecutive occupied levels of static trees into
+    a single StaticKdTree, like carrying in a binary counter. Level i then always
+    holds buffer_size * 2**i points, every point takes part in O(log n) rebuilds
+    and a query visits O(log n) balanced trees. """
+
+    buffer_size = 64
+
+    def __init__(self):
+        self._coords = numpy.empty((self.buffer_size, 2))
+        self._values = []
+        self._levels = []
+        self._buffer_start = 0
+
+    @classmethod
+    def from_static(cls, tree, coords, values):
+        """ Create incremental tree containing the points of a StaticKdTree.
+        Ids of the static tree must be indices into coords and values,
+        which describe all of its points. """
+        ret = cls()
+        ret._coords = numpy.array(coords, dtype=numpy.double).reshape(-1, 2)
+        ret._values = list(values)
+        ret._buffer_start = len(ret._values)
+
+        if len(tree):
+            # Level whose capacity is enough for the tree
+            level = max(0, math.ceil(math.log2(len(tree) / cls.buffer_size)))
+            ret._levels = [None] * (level + 1)
+            ret._levels[level] = tree
+
+        return ret
+
+    def insert(self, coord, value):
+        if len(self._values) == len(self._coords):
+            # Coordinates loaded by from_static can be empty
+            grown = numpy.empty((max(2 * len(self._coords), self.buffer_size), 2))
+            grown[:len(self._values)] = self._coords[:len(self._values)]
+            self._coords = grown
+
+        self._coords[len(self._values)] = coord
+        self._values.append(value)
+
+        if len(self._values) - self._buffer_start >= self.buffer_size:
+            self._flush_buffer()
+
+    def _flush_buffer(self):
+        ids = [numpy.arange(self._buffer_start, len(self._values))]
+
+        level = 0
+        while level < len(self._levels) and self._levels[level] is not None:
+            ids.append(self._levels[level].ids)
+            self._levels[level] = None
+            level += 1
+
+        if level == len(self._levels):
+            self._levels.append(None)
+
+        ids = numpy.concatenate(ids)
+        self._levels[level] = StaticKdTree(self._coords[ids], ids)
+        self._buffer_start = len(self._values)
+
+    def nearest(self, coord, k, max_distance = float("inf")):
+        """ Return list of values of at most k points nearest to coord and
+        no further than max_distance, and array of their distances.
+        Both are sorted by distance. """
+        x = coord[0]
+        y = coord[1]
+        bound = max_distance * max_distance
+
+        ids, distances = self._buffer_within(x, y, bound)
+        best_ids = [ids]
+        best_distances = [distances]
+        count = len(distances)
+        if count >= k > 0:
+            bound = numpy.partition(distances, k - 1)[k - 1]
+
+        # Largest trees first, they are most likely to contain the neighbors
+        # and provide the tightest bound for the rest.
+        for tree in reversed(self._levels):
+            if tree is None:
+                continue
+            indices, squared_distances = tree._query_k(x, y, k, bound)
+            best_ids.append(tree.ids[indices])
+            best_distances.append(squared_distances)
+            count += len(indices)
+            if count >= k > 0 and len(indices):
+                bound = numpy.partition(numpy.concatenate(best_distances), k - 1)[k - 1]
+
+        best_ids = numpy.concatenate(best_ids)
+        best_distances = numpy.concatenate(best_distances)
+        order = numpy.argsort(best_distances, kind="stable")[:max(k, 0)]
+
+        return [self._values[i] for i in best_ids[order].tolist()], numpy.sqrt(best_distances[order])
+
+    def within_radius(self, coord, radius):
+        """ Return list of values of all points not further than radius from coord
+        and array of their distances, in no particular order. """
+        x = coord[0]
+        y = coord[1]
+        squared_radius = radius * radius
+
+        ids, distances = self._buffer_within(x, y, squared_radius)
+        all_ids = [ids]
+        all_distances = [distances]
+
+        for tree in self._levels:
+            if tree is None:
+                continue
+            indices, squared_distances = tree._within_radius(x, y, squared_radius)
+            all_ids.append(tree.ids[indices])
+            all_distances.append(squared_distances)
+
+        all_ids = numpy.concatenate(all_ids)
+        return [self._values[i] for i in all_ids.tolist()], numpy.sqrt(numpy.concatenate(all_distances))
+
+    def _buffer_within(self, x, y, squared_radius):
+        """ Return ids and squared distances of unindexed points within radius. """
+        buffer_coords = self._coords[self._buffer_start:len(self._values)]
+        dx = buffer_coords[:, 0] - x
+        dy = buffer_coords[:, 1] - y
+        distances = dx * dx + dy * dy
+        mask = distances <= squared_radius
+        return numpy.arange(self._buffer_start, len(self._values))[mask], distances[mask]
+
+    def depth(self):
+        """ Number of trees a query has to visit (not counting the buffer). """
+        return sum(1 for tree in self._levels if tree is not None)
+
+    def __len__(self):
+        return len(self._values)
+
+    def __iter__(self):
+        return zip(map(tuple, self._coords[:len(self._values)].tolist()), self._values)
@@ -29,6 +29,7 @@ logging.config.dictConfig(config['logging'])
 logger = logging.getLogger(__name__)
 logger.info("Hello!")
 
+controller = None
 try:
     gui = robotgui.Gui(config)
 
@@ -105,3 +106,6 @@ except KeyboardInterrupt:
 except:
     logger.exception("Exception in main loop, exiting")
 
+# Don't wait for background work (building a roadmap) of the controller
+if controller is not None:
+    controller.shutdown()
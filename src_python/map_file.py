@@ -0,0 +1,116 @@
+import os
+import struct
+import numpy
+
+import world_map as world_map_module
+
+# Map file layout:
+# Header (magic, format version, numbers of vertices and polygons, grid rows and
+# columns, numbers of edge buckets, bucket entries, bands and band entries,
+# grid resolution, grid limit and bucket size), followed by uncompressed
+# little endian arrays, each starting at a multiple of _alignment bytes:
+# polygon vertices, offsets of polygons into vertices, features of polygons,
+# signed distance grid and arrays of the edge buckets.
+# Loading maps the arrays to memory, so large maps get their collision checking
+# structures without rebuilding them.
+
+_magic = b"WMAP"
+# Format version, part of map cache keys
+version = 2
+_header_struct = struct.Struct("<4sIQQQQQQQQddd")
+_alignment = 64
+
+def _layout(vertex_count, polygon_count, rows, columns,
+            bucket_count, bucket_entries, band_count, band_entries):
+    """ Return list of (name, dtype, shape) of arrays stored in the file. """
+    return [("vertices", "<f8", (vertex_count, 2)),
+            ("polygon_indptr", "<i8", (polygon_count + 1,)),
+            ("polygon_features", "<i8", (polygon_count,)),
+            ("distances", "<f8", (rows, columns)),
+            ("bucket_indptr", "<i8", (bucket_count + 1,)),
+            ("bucket_indices", "<i8", (bucket_entries,)),
+            ("band_indptr", "<i8", (band_count + 1,)),
+            ("band_indices", "<i8", (band_entries,))]
+
+def _aligned(offset):
+    return -(-offset // _alignment) * _alignment
+
+def save(filename, world_map):
+    """ Save polygons of a world_map.WorldMap together with its collision checking
+    structures (built for radius 0 if they don't exist yet, see WorldMap.prepare).
+    The file is written under a temporary name and then renamed. """
+
+    grid = world_map._get_grid()
+    buckets = grid.buckets
+
+    polygon_sizes = [len(polygon) for polygon in world_map.polygons]
+    arrays = {"vertices": numpy.array([vertex for polygon in world_map.polygons for vertex in polygon],
+                                      dtype=numpy.double).reshape(-1, 2),
+              "polygon_indptr": numpy.concatenate(([0], numpy.cumsum(polygon_sizes))),
+              "polygon_features": numpy.array(world_map.features, dtype=numpy.int64),
+              "distances": grid.distances}
+    for name in world_map_module._EdgeBuckets.array_names:
+        arrays[name] = getattr(buckets, name)
+
+    counts = (len(arrays["vertices"]), len(polygon_sizes),
+              grid.distances.shape[0], grid.distances.shape[1],
+              len(buckets.bucket_indptr) - 1, len(buckets.bucket_indices),
+              len(buckets.band_indptr) - 1, len(buckets.band_indices))
+
+    tmp_filename = filename + ".tmp"
+    with open(tmp_filename, "wb") as fp:
+        fp.write(_header_struct.pack(_magic, version, *(counts +
+                                     (world_map.resolution, grid.limit, world_map.bucket_size))))
+
+        for name, dtype, shape in _layout(*counts):
+            fp.write(b"\0" * (_aligned(fp.tell()) - fp.tell()))
+            array = numpy.ascontiguousarray(arrays[name], dtype=dtype)
+            assert array.shape == shape
+            fp.write(array.tobytes())
+
+    os.replace(tmp_filename, filename)
+
+def load(filename):
+    """ Load a world_map.WorldMap from a file, with collision checking structures
+    backed by read only memory maps. Raises ValueError if the file is not a map
+    file of the current version. """
+
+    with open(filename, "rb") as fp:
+        header = fp.read(_header_struct.size)
+        file_size = os.fstat(fp.fileno()).st_size
+
+    if len(header) < _header_struct.size:
+        raise ValueError("Map file is truncated")
+    magic, file_version, *counts = _header_struct.unpack(header)
+    if magic != _magic:
+        raise ValueError("Not a map file")
+    if file_version != version:
+        raise ValueError("Unsupported map file version {}".format(file_version))
+    resolution, limit, bucket_size = counts[-3:]
+    counts = counts[:-3]
+
+    arrays = {}
+    offset = _header_struct.size
+    for name, dtype, shape in _layout(*counts):
+        offset = _aligned(offset)
+        size = int(numpy.prod(shape)) * numpy.dtype(dtype).itemsize
+        if offset + size > file_size:
+            raise ValueError("Map file is truncated")
+
+        if size:
+            arrays[name] = numpy.memmap(filename, dtype=dtype, mode="r", offset=offset, shape=shape)
+        else:
+            arrays[name] = numpy.empty(shape, dtype=dtype)
+        offset += size
+
+    vertices = arrays["vertices"].tolist()
+    indptr = arrays["polygon_indptr"].tolist()
+    polygons = [[tuple(vertex) for vertex in vertices[start:end]]
+                for start, end in zip(indptr[:-1], indptr[1:])]
+
+    world_map = world_map_module.WorldMap(polygons, resolution, arrays["polygon_features"].tolist())
+    world_map.bucket_size = bucket_size
+    world_map._grid = world_map_module._DistanceGrid.from_arrays(
+        world_map._edges(), world_map._edge_features(), resolution, limit, bucket_size, arrays["distances"],
+        [arrays[name] for name in world_map_module._EdgeBuckets.array_names])
+    return world_map
@@ -0,0 +1,248 @@
+""" Loading of obstacle polygons from GeoJSON and OpenStreetMap XML files.
+
+Coordinates are projected to a local metric frame (x east, y north, in meters)
+around an origin, by equirectangular projection, which is precise enough
+over the few hundred meters of a garden.
+Areas (polygons, closed ways, multipolygons) tagged as obstacles (with any of
+default_obstacle_tags, or of tags given to the functions) become obstacles,
+other areas, untagged ways and lines are ignored. Every area becomes one feature
+of the WorldMap: its holes and inner rings are polygons of the same feature,
+so that the even-odd rule makes them free space, while obstacles of different
+areas overlap. GeoJSON geometries that are not inside a Feature (and so have no
+tags) are always obstacles. """
+
+import hashlib
+import json
+import logging
+import math
+import os
+import xml.etree.ElementTree
+
+import map_file
+import world_map as world_map_module
+import util.simplify
+
+logger = logging.getLogger(__name__)
+
+# Mean radius of the earth in meters
+earth_radius = 6371008.8
+
+# Default distance in meters that simplification is allowed to move polygon edges
+default_tolerance = 0.05
+
+# Areas with any of these (key, value) tags are obstacles, value None matches
+# any value of the key
+default_obstacle_tags = {("building", None),
+                         ("building:part", None),
+                         ("landuse", "flowerbed"),
+                         ("landuse", "forest"),
+                         ("leisure", "swimming_pool"),
+                         ("natural", "bare_rock"),
+                         ("natural", "scrub"),
+                         ("natural", "water"),
+                         ("natural", "wetland"),
+                         ("natural", "wood"),
+                         ("water", None)}
+
+def is_obstacle(tags, obstacle_tags = default_obstacle_tags):
+    """ Decide if an area with given tags (dict) is an obstacle. """
+    return any((key, value) in obstacle_tags or (key, None) in obstacle_tags
+               for key, value in tags.items())
+
+def project(lat, lon, origin):
+    """ Return (x, y) in meters of a point given in degrees, relative to
+    origin (latitude, longitude in degrees). """
+    origin_lat, origin_lon = origin
+    return (math.radians(lon - origin_lon) * math.cos(math.radians(origin_lat)) * earth_radius,
+            math.radians(lat - origin_lat) * earth_radius)
+
+def read_geojson(filename, obstacle_tags = default_obstacle_tags):
+    """ Return list of obstacle features in a GeoJSON file. Features are lists
+    of rings (lists of (lat, lon) tuples), all rings of a (multi)polygon are
+    in one feature. """
+    with open(filename, "r") as fp:
+        data = json.load(fp)
+
+    features = []
+    def add_geometry(geometry, tags):
+        if geometry is None or (tags is not None and not is_obstacle(tags, obstacle_tags)):
+            return
+        geometry_type = geometry["type"]
+        if geometry_type == "Polygon":
+            polygons = [geometry["coordinates"]]
+        elif geometry_type == "MultiPolygon":
+            polygons = geometry["coordinates"]
+        elif geometry_type == "GeometryCollection":
+            for child in geometry["geometries"]:
+                add_geometry(child, tags)
+            return
+        else:
+            return # Points and lines are not areas
+
+        # GeoJSON positions are [longitude, latitude]
+        features.append([[(position[1], position[0]) for position in ring]
+                         for polygon in polygons
+                         for ring in polygon])
+
+    def add_object(item):
+        item_type = item["type"]
+        if item_type == "FeatureCollection":
+            for feature in item["features"]:
+                add_object(feature)
+        elif item_type == "Feature":
+            add_geometry(item["geometry"], item.get("properties") or {})
+        else:
+            add_geometry(item, None)
+
+    add_object(data)
+    return features
+
+def read_osm(filename, obstacle_tags = default_obstacle_tags):
+    """ Return list of obstacle features in an OpenStreetMap XML file. Features
+    are lists of rings (lists of (lat, lon) tuples). Areas are closed ways
+    and multipolygon relations, ways of multipolygons are joined into rings
+    of one feature. """
+    nodes = {}
+    ways = {}
+    relations = []
+
+    for _, element in xml.etree.ElementTree.iterparse(filename):
+        if element.tag == "node":
+            nodes[element.get("id")] = (float(element.get("lat")), float(element.get("lon")))
+        elif element.tag == "way":
+            ways[element.get("id")] = ([nd.get("ref") for nd in element.iter("nd")],
+                                       _tags(element))
+        elif element.tag == "relation":
+            members = [(member.get("ref"), member.get("role"))
+                       for member in element.iter("member")
+                       if member.get("type") == "way"]
+            relations.append((members, _tags(element)))
+        else:
+            continue
+        element.clear()
+
+    features = []
+    for members, tags in relations:
+        if tags.get("type") != "multipolygon" or not is_obstacle(tags, obstacle_tags):
+            continue
+        # Inner and outer rings are treated the same way, even-odd rule takes care of holes
+        features.append(_join_ways([ways[ref][0] for ref, role in members if ref in ways]))
+
+    for refs, tags in ways.values():
+        if len(refs) < 4 or refs[0] != refs[-1] or tags.get("area") == "no":
+            continue # Not an area
+        if not is_obstacle(tags, obstacle_tags):
+            continue
+        features.append([refs])
+
+    return [[[nodes[ref] for ref in ring if ref in nodes] for ring in feature]
+            for feature in features]
+
+def _tags(element):
+    return {tag.get("k"): tag.get("v") for tag in element.iter("tag")}
+
+def _join_ways(ways):
+    """ Join lists of node references into closed rings. Open ends that can't
+    be joined are closed directly. """
+    rings = []
+    open_ways = []
+    for way in ways:
+        if len(way) > 1 and way[0] == way[-1]:
+            rings.append(way)
+        elif way:
+            open_ways.append(list(way))
+
+    while open_ways:
+        ring = open_ways.pop()
+        while ring[0] != ring[-1]:
+            for i, way in enumerate(open_ways):
+                if way[0] == ring[-1]:
+                    ring.extend(way[1:])
+                elif way[-1] == ring[-1]:
+                    ring.extend(reversed(way[:-1]))
+                else:
+                    continue
+                del open_ways[i]
+                break
+            else:
+                ring.append(ring[0])
+        rings.append(ring)
+
+    return rings
+
+def to_polygons(features, origin = None, tolerance = default_tolerance):
+    """ Project rings of features (lists of rings, which are lists of (lat, lon))
+    to polygons in meters around origin (latitude, longitude; center of bounding
+    box of the rings by default) and simplify them.
+    Returns tuple (polygons, polygon features), where polygon features are indices
+    of features of the polygons. Polygons smaller than tolerance are dropped. """
+    if origin is None:
+        latitudes = [lat for feature in features for ring in feature for lat, lon in ring]
+        longitudes = [lon for feature in features for ring in feature for lat, lon in ring]
+        if not latitudes:
+            return [], []
+        origin = ((min(latitudes) + max(latitudes)) / 2, (min(longitudes) + max(longitudes)) / 2)
+
+    polygons = []
+    polygon_features = []
+    for i, feature in enumerate(features):
+        for ring in feature:
+            points = [project(lat, lon, origin) for lat, lon in ring]
+            if len(points) > 1 and points[0] == points[-1]:
+                del points[-1]
+            points = util.simplify.simplify_polygon(points, tolerance)
+            if len(points) >= 3:
+                polygons.append([tuple(point) for point in points.tolist()])
+                polygon_features.append(i)
+    return polygons, polygon_features
+
+def load(filename, origin = None, tolerance = default_tolerance, cache_directory = None,
+         resolution = 0.1, radius = 0, obstacle_tags = default_obstacle_tags):
+    """ Load a world_map.WorldMap from a GeoJSON (.geojson, .json) or OpenStreetMap
+    XML (.osm, .xml) file.
+
+    origin (latitude, longitude) is the point that becomes (0, 0) of the map,
+    defaults to center of the bounding box of all obstacles.
+    Collision checking structures are built for queries with radius up to radius.
+    Areas with any of obstacle_tags become obstacles.
+    If cache_directory is given, the processed map is kept there in a map_file,
+    keyed by hash of the source file contents and parameters, so that next loads
+    skip parsing, projection, simplification and building of the structures. """
+
+    if cache_directory is not None:
+        with open(filename, "rb") as fp:
+            digest = hashlib.sha1(fp.read())
+        digest.update(json.dumps({"version": map_file.version,
+                                  "origin": origin,
+                                  "tolerance": tolerance,
+                                  "obstacle_tags": sorted(map(list, obstacle_tags), key=json.dumps),
+                                  "resolution": resolution,
+                                  "limit": radius + world_map_module.WorldMap.distance_limit,
+                                  "bucket_size": world_map_module.WorldMap.bucket_size},
+                                 sort_keys=True).encode("utf-8"))
+        cache_filename = os.path.join(cache_directory, digest.hexdigest() + ".map")
+
+        try:
+            world_map = map_file.load(cache_filename)
+        except (FileNotFoundError, ValueError):
+            pass
+        else:
+            logger.info("Loaded cached map %s", cache_filename)
+            return world_map
+
+    extension = os.path.splitext(filename)[1].lower()
+    if extension in (".osm", ".xml"):
+        features = read_osm(filename, obstacle_tags)
+    else:
+        features = read_geojson(filename, obstacle_tags)
+
+    polygons, polygon_features = to_polygons(features, origin, tolerance)
+    world_map = world_map_module.WorldMap(polygons, resolution, polygon_features)
+    world_map.prepare(radius)
+    logger.info("Loaded map with %d polygons from %s", len(world_map.polygons), filename)
+
+    if cache_directory is not None:
+        os.makedirs(cache_directory, exist_ok=True)
+        map_file.save(cache_filename, world_map)
+
+    return world_map
@@ -1,3 +1,4 @@
 from .state import *
 from . import prm
 from . import planning_parameters
+from . import planner_service
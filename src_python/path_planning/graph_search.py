@@ -0,0 +1,60 @@
+import heapq
+import itertools
+import collections
+
+SearchStats = collections.namedtuple("SearchStats", ["cost", "expanded", "pushed"])
+
+def a_star(adjacency, start, goal, heuristic = lambda node: 0):
+    """ Find the cheapest path from start to goal.
+
+    Nodes are integers, adjacency[node] is an iterable of (neighbor, cost) pairs,
+    heuristic(node) is a lower bound on the cost from node to goal.
+    Returns tuple (path, stats), where path is a list of nodes from start to goal
+    (None if the goal is unreachable) and stats is SearchStats with cost of the
+    path and numbers of expanded and pushed nodes. """
+
+    # Dictionaries instead of arrays, so that the setup doesn't depend on the
+    # size of the graph, only on the explored part.
+    costs = {start: 0}
+    previous = {start: None}
+    closed = set()
+
+    # Heap entries are (estimated total cost, -cost so far, counter, node).
+    # Among equal estimates nodes closer to the goal (with larger cost so far) go
+    # first, remaining ties are popped in the order of pushing. The counter
+    # also keeps the heap from ever comparing the nodes themselves.
+    counter = itertools.count()
+    waiting = [(heuristic(start), 0, next(counter), start)]
+    pushed = 1
+
+    while len(waiting):
+        _, _, _, node = heapq.heappop(waiting)
+
+        if node in closed:
+            continue # Outdated entry, the node was reached more cheaply later
+
+        if node == goal:
+            path = []
+            while node is not None:
+                path.append(node)
+                node = previous[node]
+            path.reverse()
+            return path, SearchStats(costs[goal], len(closed), pushed)
+
+        closed.add(node)
+        node_cost = costs[node]
+
+        for child, cost in adjacency[node]:
+            if child in closed:
+                continue
+
+            child_cost = node_cost + cost
+            if child_cost >= costs.get(child, float("inf")):
+                continue
+
+            costs[child] = child_cost
+            previous[child] = node
+            heapq.heappush(waiting, (child_cost + heuristic(child), -child_cost, next(counter), child))
+            pushed += 1
+
+    return None, SearchStats(float("inf"), len(closed), pushed)
@@ -0,0 +1,16 @@
+import math
+
+# Heuristics for searching the roadmap.
+# Each takes planning parameters and two states and returns a lower bound on
+# the time needed to get from the first state to the second one.
+
+def euclidean(parameters, state1, state2):
+    """ Straight line distance traveled at maximal velocity. """
+    return math.hypot(state2.x - state1.x, state2.y - state1.y) / parameters.max_velocity
+
+def turning(parameters, state1, state2):
+    """ Euclidean heuristic, or time to turn to the target heading at maximal
+    angular velocity, whichever is larger. """
+    angle = abs(math.remainder(state2.heading - state1.heading, 2 * math.pi))
+    return max(euclidean(parameters, state1, state2),
+               angle / parameters.max_angular_velocity)
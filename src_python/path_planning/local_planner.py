@@ -2,6 +2,8 @@
 
 import numpy
 import math
+import bisect
+import itertools
 from . import state
 from . import path_iterator
 
@@ -14,44 +16,146 @@ _A = numpy.array([[1, 0, 0, 0,  0,  0], # x(0)
                   [0, 1, 2, 3,  4,  5], # diff(x)(1)
                   [0, 0, 2, 0,  0,  0], # diff(diff(x))(0)
                   [0, 0, 2, 6, 12, 20]]) # diff(diff(x))(1)
+_A_inv = numpy.linalg.inv(_A)
+
+# Powers of the curve parameter at the interpolation steps, multiplying
+# coefficients by this evaluates the polynomial at all steps at once.
+_interpolation_powers = numpy.vander(numpy.linspace(0, 1, _interpolation_steps + 1),
+                                     len(_A), increasing=True).T
+
+def _horner(coefficients, t):
+    """ Evaluate polynomial given by coefficients (lowest order first) at t. """
+    ret = 0
+    for c in reversed(coefficients):
+        ret = ret * t + c
+    return ret
+
+def _horner_many(coefficients, t):
+    """ Evaluate polynomials given by rows of coefficients (lowest order first),
+    each at the corresponding element of t. """
+    ret = numpy.zeros(len(t))
+    for i in range(coefficients.shape[1] - 1, -1, -1):
+        ret = ret * t + coefficients[:, i]
+    return ret
+
+def _derivative_many(coefficients):
+    return coefficients[:, 1:] * numpy.arange(1, coefficients.shape[1])
+
+def _derivative(coefficients):
+    return tuple(i * c for i, c in enumerate(coefficients) if i > 0)
+
+def _integral(coefficients):
+    return (0,) + tuple(c / (i + 1) for i, c in enumerate(coefficients))
+
+def _velocity_coefficients(velocity1, velocity2, acceleration1, acceleration2, travel_time):
+    """ Coefficients of the cubic with given values and derivatives at 0 and travel_time. """
+    t = travel_time
+    t2 = t * t
+    return (velocity1,
+            acceleration1,
+            (3 * (velocity2 - velocity1) - (2 * acceleration1 + acceleration2) * t) / t2,
+            (2 * (velocity1 - velocity2) + (acceleration1 + acceleration2) * t) / (t2 * t))
+
+def _travel_time(velocity1, velocity2, acceleration1, acceleration2, length):
+    """ Time to travel length with the cubic velocity profile, or None if impossible. """
+    a = acceleration1 - acceleration2
+    b = 6 * (velocity1 + velocity2)
+    c = -12 * length
 
-class _PathIterator(path_iterator.PathIterator):
-    # Path properties:
+    if abs(a) < epsilon:
+        if abs(b) < epsilon:
+            return None
+        travel_time = -c / b
+    else:
+        D = b * b - 4 * a * c
+        if D < 0:
+            return None
+
+        travel_time = (- b + math.sqrt(D)) / (2 * a)
+
+        #if travel_time < 0:
+        #    travel_time = c / (travel_time * a)
 
-    # self.travel_time
+    assert(travel_time > 0)
+    return travel_time
+
+class _PathIterator(path_iterator.PathIterator):
+    """ Path given by polynomial coefficients (lowest order first) of x and y
+    (functions of curve parameter), and v (function of time).
+    Curve parameter at a time is found from the distance travelled, by bisection
+    over cumulative lengths of the interpolation steps and linear interpolation
+    within the step, so moving to any time takes O(log(_interpolation_steps)). """
+
+    def __init__(self, x_coefficients, y_coefficients, v_coefficients,
+                 travel_time, interpolation_table):
+        self.travel_time = travel_time
+        self._x = tuple(x_coefficients)
+        self._dx = _derivative(self._x)
+        self._ddx = _derivative(self._dx)
+        self._y = tuple(y_coefficients)
+        self._dy = _derivative(self._y)
+        self._ddy = _derivative(self._dy)
+        self._v = tuple(v_coefficients)
+        self._dv = _derivative(self._v)
+        self._ddv = _derivative(self._dv)
+        self._iv = _integral(self._v)
+        self._interpolation_table = interpolation_table
+        self._cumulative = list(itertools.accumulate(interpolation_table, initial=0))
+        super().__init__()
 
     # Moving through the path:
 
     def reset(self):
-        self.time = 0
-        self._curve_param = 0
-        self._i = 0
-        self._last_interpolation_distance = 0
+        self.jump_to(0)
 
     def advance(self, dt):
-        self.time += dt
+        self.jump_to(self.time + dt)
 
-        if self.time > self.travel_time:
-            self.time = self.travel_time
-            self._curve_param = 1
-            self._i = len(self._interpolation_table)
-            return
-
-        remaining_distance = self._iv(self.time) - self._last_interpolation_distance
+    def jump_to(self, time):
+        self.time = min(max(time, 0), self.travel_time)
 
-        self._curve_param = 1 # This value is used when self.time == self.travel_time
-        for s in self._interpolation_table[self._i:]:
-            if remaining_distance < s:
-                self._curve_param = (self._i / _interpolation_steps) + (remaining_distance / (_interpolation_steps * s))
-                break
-            else:
-                remaining_distance -= s
-                self._i += 1
-                self._last_interpolation_distance += s
+        distance = _horner(self._iv, self.time)
+        i = max(bisect.bisect_right(self._cumulative, distance) - 1, 0)
+        if i >= _interpolation_steps:
+            self._curve_param = 1
+        else:
+            self._curve_param = (i + (distance - self._cumulative[i]) /
+                                 self._interpolation_table[i]) / _interpolation_steps
 
     def finished(self):
         return self.time >= self.travel_time
 
+    def sample(self, times):
+        """ Return states at given times as an array of path_iterator.sample_dtype,
+        evaluated in array operations, the same way as jump_to. """
+        times = numpy.clip(numpy.asarray(times, dtype=numpy.double), 0, self.travel_time)
+
+        distance = _horner(self._iv, times)
+        cumulative = numpy.array(self._cumulative)
+        table = numpy.array(self._interpolation_table)
+        i = numpy.maximum(numpy.searchsorted(cumulative, distance, side="right") - 1, 0)
+        step = numpy.minimum(i, _interpolation_steps - 1)
+        with numpy.errstate(divide="ignore", invalid="ignore"):
+            curve_param = numpy.where(i < _interpolation_steps,
+                                      (step + (distance - cumulative[step]) / table[step]) /
+                                      _interpolation_steps,
+                                      1)
+
+        dx = _horner(self._dx, curve_param)
+        dy = _horner(self._dy, curve_param)
+        ddx = _horner(self._ddx, curve_param)
+        ddy = _horner(self._ddy, curve_param)
+
+        ret = numpy.empty(len(times), dtype=path_iterator.sample_dtype)
+        ret["x"] = _horner(self._x, curve_param)
+        ret["y"] = _horner(self._y, curve_param)
+        ret["heading"] = numpy.arctan2(dy, dx)
+        ret["velocity"] = _horner(self._v, times)
+        ret["acceleration"] = _horner(self._dv, times)
+        ret["curvature"] = (dx * ddy - dy * ddx) / (dx * dx + dy * dy)**1.5
+        ret["jerk"] = _horner(self._ddv, times)
+        return ret
+
     # Accessing current state:
 
     # self.time
@@ -59,34 +163,34 @@ class _PathIterator(path_iterator.PathIterator):
 
     @property
     def x(self):
-        return self._x(self._curve_param)
+        return _horner(self._x, self._curve_param)
 
     @property
     def y(self):
-        return self._y(self._curve_param)
+        return _horner(self._y, self._curve_param)
 
     @property
     def heading(self):
-        return math.atan2(self._dy(self._curve_param), self._dx(self._curve_param))
+        return math.atan2(_horner(self._dy, self._curve_param), _horner(self._dx, self._curve_param))
 
     @property
     def velocity(self):
-        return self._v(self.time)
+        return _horner(self._v, self.time)
 
     @property
     def acceleration(self):
-        return self._dv(self.time)
+        return _horner(self._dv, self.time)
 
     @property
     def jerk(self):
-        return self._ddv(self.time)
+        return _horner(self._ddv, self.time)
 
     @property
     def curvature(self):
-        dx = self._dx(self._curve_param)
-        ddx = self._ddx(self._curve_param)
-        dy = self._dy(self._curve_param)
-        ddy = self._ddy(self._curve_param)
+        dx = _horner(self._dx, self._curve_param)
+        ddx = _horner(self._ddx, self._curve_param)
+        dy = _horner(self._dy, self._curve_param)
+        ddy = _horner(self._ddy, self._curve_param)
         length = dx * dx + dy * dy
         return (dx * ddy - dy * ddx) / (length**1.5)
 
@@ -105,87 +209,199 @@ def plan_path(state1, state2):
     diff2x = len2 * math.cos(state2.heading)
     diff2y = len2 * math.sin(state2.heading)
 
-    b = numpy.array([state1.x,
-                     state2.x,
-                     diff1x,
-                     diff2x,
-                     - state1.curvature * len1 * diff1y,
-                     - state2.curvature * len2 * diff2y])
-    x = numpy.polynomial.Polynomial(numpy.linalg.solve(_A, b))
-
-    b = numpy.array([state1.y,
-                     state2.y,
-                     diff1y,
-                     diff2y,
-                     state1.curvature * len1 * diff1x,
-                     state2.curvature * len2 * diff2x])
-    y = numpy.polynomial.Polynomial(numpy.linalg.solve(_A, b))
+    b = numpy.array([[state1.x,
+                      state2.x,
+                      diff1x,
+                      diff2x,
+                      - state1.curvature * len1 * diff1y,
+                      - state2.curvature * len2 * diff2y],
+                     [state1.y,
+                      state2.y,
+                      diff1y,
+                      diff2y,
+                      state1.curvature * len1 * diff1x,
+                      state2.curvature * len2 * diff2x]])
+    coefficients = b @ _A_inv.T
+    x, y = coefficients
 
     # Array of distances at fixed t values. Used for interpolating curve
     # parameter from distance along the curve
-    interpolation_table = []
-    length = 0
-
-    prev_x = state1.x
-    prev_y = state1.y
-    for i in range(1, _interpolation_steps + 1):
-        t = i / _interpolation_steps # Curve parameter
-        xx = x(t)
-        yy = y(t)
-        dist = math.hypot(xx - prev_x, yy - prev_y)
-        length += dist
-        interpolation_table.append(dist)
-        prev_x = xx
-        prev_y = yy
-
-    assert(len(interpolation_table) == _interpolation_steps)
-    #length = scipy.integrate.fixed_quad(lambda p: numpy.sqrt(dx(p) * dx(p) + dy(p) * dy(p)), 0, 1)[0]
-
-    a = state1.acceleration - state2.acceleration
-    b = 6 * (state1.velocity + state2.velocity)
+    points = numpy.diff(coefficients @ _interpolation_powers, axis=1)
+    interpolation_table = numpy.hypot(points[0], points[1])
+    length = interpolation_table.sum()
+
+    travel_time = _travel_time(state1.velocity, state2.velocity,
+                               state1.acceleration, state2.acceleration,
+                               length)
+    if travel_time is None:
+        return None
+
+    v = _velocity_coefficients(state1.velocity, state2.velocity,
+                               state1.acceleration, state2.acceleration,
+                               travel_time)
+
+    return _make_path_iterator(x.tolist(), y.tolist(), v, travel_time, interpolation_table.tolist())
+
+def _make_path_iterator(x_coefficients, y_coefficients, v_coefficients,
+                        travel_time, interpolation_table):
+    """ Create path iterator from polynomial coefficients (lowest order first)
+    of x and y (functions of curve parameter), and v (function of time). """
+    return _PathIterator(x_coefficients, y_coefficients, v_coefficients,
+                         travel_time, interpolation_table)
+
+
+class PathBatch:
+    """ Local paths between many pairs of states, planned at once by plan_paths.
+
+    Polynomial coefficients are stored in arrays, lowest order first, one row per path:
+    x_coefficients and y_coefficients (quintic in curve parameter from 0 to 1),
+    v_coefficients (velocity, cubic in time from 0 to travel_time).
+    Pairs without a path have travel_time set to nan.
+    Indexing gives the same path iterator as plan_path, or None. """
+
+    def __init__(self, x_coefficients, y_coefficients, v_coefficients,
+                 travel_time, interpolation_tables):
+        self.x_coefficients = x_coefficients
+        self.y_coefficients = y_coefficients
+        self.v_coefficients = v_coefficients
+        self.travel_time = travel_time
+        self.interpolation_tables = interpolation_tables
+        self._cumulative = None
+
+    def __len__(self):
+        return len(self.travel_time)
+
+    def state_arrays(self, paths, times):
+        """ Evaluate states of the paths with given indices at given times
+        (arrays of the same length, times are clamped to the travel time).
+        Returns arrays x, y, heading, velocity, acceleration, curvature, jerk. """
+        paths = numpy.asarray(paths, dtype=numpy.intp)
+        times = numpy.minimum(numpy.asarray(times, dtype=numpy.double), self.travel_time[paths])
+
+        v = self.v_coefficients[paths]
+        dv = _derivative_many(v)
+        velocity = _horner_many(v, times)
+        acceleration = _horner_many(dv, times)
+        jerk = _horner_many(_derivative_many(dv), times)
+
+        # Curve parameter is found from the distance travelled in the same way as in
+        # _PathIterator.jump_to: find the interpolation step containing the distance
+        # (bisection over cumulative step lengths) and interpolate linearly within it.
+        iv = numpy.column_stack((numpy.zeros(len(paths)), v / numpy.arange(1, v.shape[1] + 1)))
+        distance = _horner_many(iv, times)
+        cumulative = self._cumulative_lengths()
+        low = numpy.zeros(len(paths), dtype=numpy.intp)
+        high = numpy.full(len(paths), _interpolation_steps + 1, dtype=numpy.intp)
+        while (high - low > 1).any():
+            middle = (low + high) // 2
+            below = cumulative[paths, middle] <= distance
+            low = numpy.where(below, middle, low)
+            high = numpy.where(below, high, middle)
+
+        inside = low < _interpolation_steps
+        step = numpy.minimum(low, _interpolation_steps - 1)
+        with numpy.errstate(divide="ignore", invalid="ignore"):
+            curve_param = numpy.where(inside,
+                                      (step + (distance - cumulative[paths, step]) /
+                                       self.interpolation_tables[paths, step]) / _interpolation_steps,
+                                      1)
+
+        x = self.x_coefficients[paths]
+        y = self.y_coefficients[paths]
+        dx_coefficients = _derivative_many(x)
+        dy_coefficients = _derivative_many(y)
+        dx = _horner_many(dx_coefficients, curve_param)
+        dy = _horner_many(dy_coefficients, curve_param)
+        ddx = _horner_many(_derivative_many(dx_coefficients), curve_param)
+        ddy = _horner_many(_derivative_many(dy_coefficients), curve_param)
+
+        return (_horner_many(x, curve_param),
+                _horner_many(y, curve_param),
+                numpy.arctan2(dy, dx),
+                velocity,
+                acceleration,
+                (dx * ddy - dy * ddx) / (dx * dx + dy * dy)**1.5,
+                jerk)
+
+    def _cumulative_lengths(self):
+        """ Array of distances from the start of each path to the interpolation steps. """
+        if self._cumulative is None:
+            self._cumulative = numpy.zeros((len(self), _interpolation_steps + 1))
+            numpy.cumsum(self.interpolation_tables, axis=1, out=self._cumulative[:, 1:])
+        return self._cumulative
+
+    def points(self):
+        """ Return arrays x and y (one row per path) of points along the paths
+        at the interpolation steps of the curve parameter.
+        Distances between consecutive points are in interpolation_tables. """
+        return self.x_coefficients @ _interpolation_powers, self.y_coefficients @ _interpolation_powers
+
+    def __getitem__(self, i):
+        if numpy.isnan(self.travel_time[i]):
+            return None
+
+        return _make_path_iterator(self.x_coefficients[i].tolist(),
+                                   self.y_coefficients[i].tolist(),
+                                   self.v_coefficients[i].tolist(),
+                                   float(self.travel_time[i]),
+                                   self.interpolation_tables[i].tolist())
+
+def plan_paths(states_from, states_to):
+    """ Find paths from each of states_from to the corresponding state in states_to,
+    ignoring obstacles. This does the same as plan_path for every pair,
+    but in a single pass of array operations.
+    States can be sequences of State or arrays with one state per row. """
+
+    states_from = numpy.asarray(states_from, dtype=numpy.double).reshape(-1, 6)
+    states_to = numpy.asarray(states_to, dtype=numpy.double).reshape(-1, 6)
+    if states_from.shape != states_to.shape:
+        raise ValueError("There must be the same number of start and end states.")
+
+    x1, y1, heading1, velocity1, acceleration1, curvature1 = states_from.T
+    x2, y2, heading2, velocity2, acceleration2, curvature2 = states_to.T
+
+    # See plan_path for the meaning of these
+    rawdist = numpy.hypot(x2 - x1, y2 - y1)
+    len1 = 0.5 * rawdist + 0.5 * velocity1
+    len2 = 0.5 * rawdist + 0.5 * velocity2
+
+    diff1x = len1 * numpy.cos(heading1)
+    diff1y = len1 * numpy.sin(heading1)
+    diff2x = len2 * numpy.cos(heading2)
+    diff2y = len2 * numpy.sin(heading2)
+
+    b = numpy.column_stack((x1, x2, diff1x, diff2x,
+                            - curvature1 * len1 * diff1y,
+                            - curvature2 * len2 * diff2y))
+    x_coefficients = b @ _A_inv.T
+
+    b = numpy.column_stack((y1, y2, diff1y, diff2y,
+                            curvature1 * len1 * diff1x,
+                            curvature2 * len2 * diff2x))
+    y_coefficients = b @ _A_inv.T
+
+    interpolation_tables = numpy.hypot(numpy.diff(x_coefficients @ _interpolation_powers, axis=1),
+                                       numpy.diff(y_coefficients @ _interpolation_powers, axis=1))
+    length = interpolation_tables.sum(axis=1)
+
+    a = acceleration1 - acceleration2
+    b = 6 * (velocity1 + velocity2)
     c = -12 * length
 
-    if abs(a) < epsilon:
-        if abs(b) < epsilon:
-            return None
-        travel_time = -c / b
-    else:
+    with numpy.errstate(divide="ignore", invalid="ignore"):
+        linear = numpy.abs(a) < epsilon
         D = b * b - 4 * a * c
-        if D < 0:
-            return None
-
-        travel_time = (- b + math.sqrt(D)) / (2 * a)
+        travel_time = numpy.where(linear,
+                                  -c / b,
+                                  (- b + numpy.sqrt(D)) / (2 * a))
+        travel_time[linear & (numpy.abs(b) < epsilon)] = numpy.nan
+        travel_time[~linear & (D < 0)] = numpy.nan
 
-        #if travel_time < 0:
-        #    travel_time = c / (travel_time * a)
+        assert((travel_time[~numpy.isnan(travel_time)] > 0).all())
 
-    assert(travel_time > 0)
+        v_coefficients = numpy.column_stack(_velocity_coefficients(velocity1, velocity2,
+                                                                   acceleration1, acceleration2,
+                                                                   travel_time))
 
-    t = travel_time
-    t2 = t * t
-    t3 = t * t2
-    A = numpy.array([[1, 0,      0,       0], # v(0)
-                     [1, t,     t2,      t3], # v(1)
-                     [0, 1,      0,       0], # diff(v)(0)
-                     [0, 1,  2 * t,  3 * t2]]) # diff(v)(1)
-    b = numpy.array([state1.velocity,
-                     state2.velocity,
-                     state1.acceleration,
-                     state2.acceleration])
-    v = numpy.polynomial.Polynomial(numpy.linalg.solve(A, b));
-
-    it = _PathIterator()
-    it.reset()
-    it.travel_time = travel_time
-    it._x = x
-    it._dx = x.deriv()
-    it._ddx = it._dx.deriv()
-    it._y = y
-    it._dy = y.deriv()
-    it._ddy = it._dy.deriv()
-    it._v = v
-    it._dv = v.deriv()
-    it._iv = v.integ()
-    it._interpolation_table = interpolation_table
-
-    return it
+    return PathBatch(x_coefficients, y_coefficients, v_coefficients,
+                     travel_time, interpolation_tables)
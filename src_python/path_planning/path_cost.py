@@ -0,0 +1,181 @@
+import collections
+import numpy
+
+# Relative error tolerance of the cost integral
+default_tolerance = 1e-3
+
+def integrate(parameters, path_iterator, resolution = 0.1, tolerance = default_tolerance):
+    """ Return integral of parameters.state_cost over time along path_iterator,
+    divided by resolution (so it roughly equals the sum of state costs sampled
+    every resolution seconds), or None if the path is infeasible.
+
+    Feasibility is checked on states at most resolution seconds apart, in coarse
+    to fine order (end points, middle, quarters, ...), so that most infeasible
+    paths get rejected after a few evaluations. Then the robot moving between
+    the states is checked for collisions (parameters.swept_collisions).
+    The integral is then calculated by adaptive Simpson's rule over the same
+    states, refining intervals until relative error estimate is below tolerance. """
+
+    travel_time = path_iterator.travel_time
+
+    # Within each level of the coarse to fine order the times are increasing,
+    # so that the iterator mostly moves forward.
+    times = [i * resolution for i in range(_grid_size(travel_time, resolution))]
+    times.append(travel_time)
+    costs = [None] * len(times)
+    x = numpy.empty(len(times))
+    y = numpy.empty(len(times))
+
+    for i in _coarse_to_fine(len(times)):
+        path_iterator.jump_to(times[i])
+        cost = parameters.state_cost(path_iterator)
+        if cost is None:
+            return None
+        costs[i] = cost
+        x[i] = path_iterator.x
+        y[i] = path_iterator.y
+
+    if parameters.swept_collisions(x[:-1], y[:-1], x[1:], y[1:]).any():
+        return None
+
+    return _integral(times, costs, resolution, tolerance)
+
+def integrate_many(parameters, paths, indices, resolution = 0.1, tolerance = default_tolerance):
+    """ Same as integrate for paths of local_planner.PathBatch with given indices,
+    but with states evaluated in array operations (PlanningParameters.state_cost_many).
+    Returns list of costs or None for infeasible paths, in the order of indices.
+
+    First a few states evenly spread along each path are checked, only paths that
+    pass get all their states and the segments between them checked. """
+
+    ret = [None] * len(indices)
+    indices = numpy.asarray(indices, dtype=numpy.intp)
+    candidates = numpy.flatnonzero(~numpy.isnan(paths.travel_time[indices]))
+
+    # Numbers of states along the paths, including the end
+    sizes = _grid_size(paths.travel_time[indices[candidates]], resolution) + 1
+
+    samples = (sizes[:, numpy.newaxis] - 1) * numpy.arange(_coarse_samples) // (_coarse_samples - 1)
+    _, _, _, costs = _state_costs(parameters, paths,
+                            numpy.repeat(indices[candidates], _coarse_samples), samples.ravel(),
+                            resolution)
+    passed = ~numpy.isnan(costs.reshape(-1, _coarse_samples)).any(axis=1)
+    candidates = candidates[passed]
+    sizes = sizes[passed]
+
+    offsets = numpy.cumsum(sizes) - sizes
+    samples = numpy.arange(sizes.sum()) - numpy.repeat(offsets, sizes)
+    times, x, y, costs = _state_costs(parameters, paths,
+                                      numpy.repeat(indices[candidates], sizes), samples,
+                                      resolution)
+
+    # Segments between consecutive states, except for those joining two paths
+    segments = numpy.ones(max(len(times) - 1, 0), dtype=bool)
+    segments[offsets[1:] - 1] = False
+    segment_collisions = parameters.swept_collisions(x[:-1][segments], y[:-1][segments],
+                                                     x[1:][segments], y[1:][segments])
+    collisions = numpy.bincount(numpy.repeat(numpy.arange(len(candidates)), sizes - 1),
+                                weights=segment_collisions, minlength=len(candidates)) > 0
+
+    for i, candidate in enumerate(candidates.tolist()):
+        path_slice = slice(offsets[i], offsets[i] + sizes[i])
+        if collisions[i] or numpy.isnan(costs[path_slice]).any():
+            continue
+        ret[candidate] = _integral(times[path_slice].tolist(), costs[path_slice].tolist(),
+                                   resolution, tolerance)
+
+    return ret
+
+# Number of states checked along each path before checking all of them in integrate_many
+_coarse_samples = 9
+
+def _state_costs(parameters, paths, path_indices, samples, resolution):
+    """ Return arrays of times, positions and costs of states of paths (given by indices
+    into the batch) at sample indices (sample i is at time i * resolution, clamped
+    to the travel time). """
+    times = numpy.minimum(samples * resolution, paths.travel_time[path_indices])
+    x, y, heading, velocity, acceleration, curvature, jerk = paths.state_arrays(path_indices, times)
+
+    return times, x, y, parameters.state_cost_many(x, y, velocity, acceleration, curvature, jerk)
+
+def _grid_size(travel_time, resolution):
+    """ Number of multiples of resolution smaller than travel_time, works on arrays too. """
+    size = numpy.ceil(numpy.asarray(travel_time) / resolution).astype(numpy.intp)
+    return size - ((size > 0) & ((size - 1) * resolution >= travel_time))
+
+def _integral(times, costs, resolution, tolerance):
+    """ Integral of costs (lists, at least two elements) at times, divided by resolution.
+    Times are multiples of resolution, except for the last one.
+    The result is at least travel time / resolution (integral of the minimal cost),
+    path planning heuristics rely on this bound. """
+    travel_time = times[-1]
+    last = len(times) - 1
+    if last < 2:
+        integral = _trapezoid(times, costs, 0, last)
+    else:
+        # Error is estimated relative to the integral of the minimal cost (1) over
+        # the whole path, which is a lower bound of the result.
+        absolute_tolerance = tolerance * travel_time
+
+        if times[last] - times[last - 1] < resolution * (1 - 1e-9):
+            # Simpson's rule over a panel ending with a short interval gives
+            # the last cost a large negative weight, a jump in the cost there
+            # would break the result. The short interval uses trapezoid rule.
+            integral = _simpson(times, costs, 0, last - 1, absolute_tolerance) + \
+                       _trapezoid(times, costs, last - 1, last)
+        else:
+            integral = _simpson(times, costs, 0, last, absolute_tolerance)
+
+    return max(integral, travel_time) / resolution
+
+def _coarse_to_fine(n):
+    """ Iterate over indices 0 .. n - 1, first end points, then middles of intervals
+    between already visited indices, breadth first. """
+    if n == 0:
+        return
+    yield 0
+    if n == 1:
+        return
+    yield n - 1
+
+    intervals = collections.deque([(0, n - 1)])
+    while len(intervals):
+        a, b = intervals.popleft()
+        if b - a < 2:
+            continue
+        c = (a + b) // 2
+        yield c
+        intervals.append((a, c))
+        intervals.append((c, b))
+
+def _three_point(times, costs, a, b):
+    """ Integral of the quadratic going through points a, (a + b) // 2, b.
+    This is Simpson's rule, generalized for unevenly spaced points. """
+    c = (a + b) // 2
+    h1 = times[c] - times[a]
+    h2 = times[b] - times[c]
+    h = h1 + h2
+    return h / 6 * ((2 - h2 / h1) * costs[a] +
+                    h * h / (h1 * h2) * costs[c] +
+                    (2 - h1 / h2) * costs[b])
+
+def _trapezoid(times, costs, a, b):
+    return sum((times[i + 1] - times[i]) * (costs[i] + costs[i + 1]) / 2
+               for i in range(a, b))
+
+def _simpson(times, costs, a, b, tolerance, whole = None):
+    if b - a < 4:
+        # Not enough points to refine further
+        return _trapezoid(times, costs, a, b) if b - a < 2 else _three_point(times, costs, a, b)
+
+    if whole is None:
+        whole = _three_point(times, costs, a, b)
+
+    c = (a + b) // 2
+    left = _three_point(times, costs, a, c)
+    right = _three_point(times, costs, c, b)
+    if abs(left + right - whole) <= 15 * tolerance:
+        return left + right + (left + right - whole) / 15
+
+    return _simpson(times, costs, a, c, tolerance / 2, left) + \
+           _simpson(times, costs, c, b, tolerance / 2, right)
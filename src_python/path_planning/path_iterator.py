@@ -1,5 +1,10 @@
+import math
+import numpy
 from . import state
 
+# Record type of arrays returned by PathIterator.sample
+sample_dtype = numpy.dtype([(name, numpy.double) for name in state.State._fields + ("jerk",)])
+
 class PathIterator:
     """ Base class representing a path.
     The class itself can be used as state of the current point,
@@ -18,15 +23,45 @@ class PathIterator:
             self.reset()
             self.advance(time)
 
+    def state_at(self, time):
+        """ Return state at given time, without moving the current point. """
+        current_time = self.time
+        self.jump_to(time)
+        ret = self.as_state()
+        self.jump_to(current_time)
+        return ret
+
     def advance(self, dt):
         raise NotImplementedError()
 
+    def sample(self, times):
+        """ Return states at given times (clamped to the path) as an array of
+        sample_dtype, without moving the current point.
+        This implementation jumps to every time, subclasses evaluate all times
+        in array operations. """
+        times = numpy.asarray(times, dtype=numpy.double)
+        ret = numpy.empty(len(times), dtype=sample_dtype)
+
+        current_time = self.time
+        for i, t in enumerate(times.tolist()):
+            self.jump_to(t)
+            ret[i] = self.as_state() + (getattr(self, "jerk", math.nan),)
+        self.jump_to(current_time)
+
+        return ret
+
+    def sample_uniform(self, dt):
+        """ Return states every dt seconds from the start of the path,
+        including the end of the path, as an array of sample_dtype. """
+        count = math.ceil(self.travel_time / dt)
+        times = numpy.arange(count) * dt
+        if count > 0 and times[-1] >= self.travel_time:
+            times = times[:-1]
+        return self.sample(numpy.append(times, self.travel_time))
+
     def sample_intervals(self, dt):
-        self.reset()
-        while not self.finished():
-            yield (self.x, self.y)
-            self.advance(dt)
-        yield (self.x, self.y)
+        samples = self.sample_uniform(dt)
+        return zip(samples["x"].tolist(), samples["y"].tolist())
 
     def finished(self):
         """ Return True if the path is at the end. """
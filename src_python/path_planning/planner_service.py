@@ -0,0 +1,157 @@
+from . import prm
+
+import concurrent.futures
+import contextlib
+import logging
+import threading
+
+class PlannerService:
+    """ Long lived path planner answering queries in background threads.
+
+    The roadmap is obtained (loaded or built) once, in the background, and kept
+    for all queries. Queries submitted before they get processed are batched:
+    their start and goal states are added to the roadmap together
+    (Prm.add_states), then searches for the individual queries run in a thread
+    pool. Searches only read the roadmap and run concurrently, adding states,
+    region invalidation and searches of a lazy roadmap get exclusive access.
+    Results are concurrent.futures.Future objects, so that a control loop can
+    poll them without waiting. """
+
+    workers = 2
+
+    def __init__(self, planning_parameters, planner_class = prm.Prm):
+        self._logger = logging.getLogger(__name__)
+        self._executor = concurrent.futures.ThreadPoolExecutor(self.workers,
+                                                               thread_name_prefix="planner")
+        self._stop = threading.Event()
+        self._planner = self._executor.submit(planner_class, planning_parameters,
+                                              stop_event=self._stop)
+        self._roadmap_lock = _SharedLock()
+
+        # Queries waiting for the next batch, protected by _lock
+        self._lock = threading.Lock()
+        self._pending = []
+
+    def ready(self):
+        """ Return True if the roadmap is available. """
+        return self._planner.done()
+
+    def submit(self, start, goal):
+        """ Plan a path from start to goal state. Returns a future of the path
+        iterator (None if there is no path). """
+        return self.submit_many([(start, goal)])[0]
+
+    def submit_many(self, queries):
+        """ Plan paths for a sequence of (start, goal) pairs, returns list of futures. """
+        futures = []
+        with self._lock:
+            schedule = not self._pending
+            for start, goal in queries:
+                future = concurrent.futures.Future()
+                self._pending.append((start, goal, future))
+                futures.append(future)
+
+            if schedule and futures:
+                self._executor.submit(self._process_batch)
+        return futures
+
+    def invalidate_region(self, polygon):
+        """ Call Prm.invalidate_region once no search is running.
+        Returns future of its result. """
+        return self._executor.submit(self._invalidate_region, polygon)
+
+    def shutdown(self, wait = True):
+        """ Stop the worker threads. Queries that haven't started get cancelled,
+        roadmap build in progress stops soon (its future raises prm.BuildCancelled).
+        Worker threads are joined at interpreter exit even with wait = False. """
+        self._stop.set()
+        with self._lock:
+            pending, self._pending = self._pending, []
+        for _, _, future in pending:
+            future.cancel()
+        self._executor.shutdown(wait, cancel_futures=True)
+
+    def _process_batch(self):
+        with self._lock:
+            pending, self._pending = self._pending, []
+        pending = [query for query in pending if query[2].set_running_or_notify_cancel()]
+        if not pending:
+            return
+
+        try:
+            planner = self._planner.result()
+            with self._roadmap_lock.exclusive():
+                nodes = planner.add_states([state
+                                            for start, goal, future in pending
+                                            for state in (start, goal)])
+        except Exception as e:
+            for _, _, future in pending:
+                future.set_exception(e)
+            return
+
+        self._logger.info("Added states of %d queries to the roadmap", len(pending))
+
+        for i, (_, _, future) in enumerate(pending):
+            node1, node2 = nodes[2 * i], nodes[2 * i + 1]
+            if node1 is None:
+                future.set_exception(Exception("Starting position is unreachable"))
+            elif node2 is None:
+                future.set_exception(Exception("Target position is unreachable"))
+            else:
+                try:
+                    self._executor.submit(self._search, planner, node1, node2, future)
+                except RuntimeError as e: # Shut down in the meantime
+                    future.set_exception(e)
+
+    def _search(self, planner, node1, node2, future):
+        if planner.lazy:
+            lock = self._roadmap_lock.exclusive() # Searching checks and modifies edges
+        else:
+            lock = self._roadmap_lock.shared()
+
+        try:
+            with lock:
+                path = planner.plan_path_between(node1, node2)
+        except Exception as e:
+            future.set_exception(e)
+        else:
+            future.set_result(path)
+
+    def _invalidate_region(self, polygon):
+        planner = self._planner.result()
+        with self._roadmap_lock.exclusive():
+            return planner.invalidate_region(polygon)
+
+
+class _SharedLock:
+    """ Lock that can be held either by any number of shared owners,
+    or by a single exclusive owner. """
+
+    def __init__(self):
+        self._condition = threading.Condition()
+        self._shared = 0
+        self._exclusive = False
+
+    @contextlib.contextmanager
+    def shared(self):
+        with self._condition:
+            self._condition.wait_for(lambda: not self._exclusive)
+            self._shared += 1
+        try:
+            yield
+        finally:
+            with self._condition:
+                self._shared -= 1
+                self._condition.notify_all()
+
+    @contextlib.contextmanager
+    def exclusive(self):
+        with self._condition:
+            self._condition.wait_for(lambda: not self._exclusive and not self._shared)
+            self._exclusive = True
+        try:
+            yield
+        finally:
+            with self._condition:
+                self._exclusive = False
+                self._condition.notify_all()
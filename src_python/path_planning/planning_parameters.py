@@ -1,5 +1,6 @@
 import random
 import math
+import numpy
 import util.halton
 import differential_drive
 from . import state
@@ -16,6 +17,8 @@ class PlanningParameters:
         self.max_jerk = limits["jerk"]
         self.max_angular_velocity = limits["angular_velocity"]
         self.min_wheel_speed = limits["min_wheel_speed"]
+        self.robot_radius = limits.get("robot_radius", 0)
+        self.limits = dict(limits)
         self.world_map = world_map
         self._halton = util.halton.HaltonSequence(4)
         self._drive_model = drive_model
@@ -31,6 +34,7 @@ class PlanningParameters:
         if abs(angular_velocity) > self.max_angular_velocity:
             return None
 
+        # Only path iterators have jerk, plain states (roadmap nodes) don't
         try:
             jerk = state.jerk
         except AttributeError:
@@ -48,7 +52,7 @@ class PlanningParameters:
 
         # Map collisions:
 
-        if self.world_map.has_collision(state.x, state.y):
+        if self.world_map.has_collision(state.x, state.y, self.robot_radius):
             return None
 
         cost = 1 / (1 - normalized_acceleration)
@@ -60,14 +64,75 @@ class PlanningParameters:
 
         return cost
 
-    def random_state(self):
-        val = next(self._halton)
-
-        velocity = self.max_velocity * val[0]
-        max_curvature = self.max_angular_velocity / velocity
-        return state.State(30 * val[1] - 10,
-                           30 * val[2] - 10,
-                           2 * math.pi * val[3],
-                           velocity,
-                           0,
-                           0)
+    def roadmap_key_data(self):
+        """ Return JSON serializable description of everything that a roadmap built
+        with these parameters depends on, except for the world map. """
+        return {"limits": self.limits,
+                "drive": {"left_resolution": self._drive_model.left_resolution,
+                          "right_resolution": self._drive_model.right_resolution,
+                          "wheel_base": self._drive_model.wheel_base},
+                "sampler": {"sequence": "halton", "dimension": 4,
+                            "area": self.sampling_area}}
+
+    def state_cost_many(self, x, y, velocity, acceleration, curvature, jerk = None):
+        """ Vectorized state_cost, parameters are arrays of state fields.
+        Returns array of costs, with nan for infeasible states.
+        Jerk is only checked if given. """
+        x = numpy.asarray(x, dtype=numpy.double)
+        y = numpy.asarray(y, dtype=numpy.double)
+        velocity = numpy.asarray(velocity, dtype=numpy.double)
+        acceleration = numpy.asarray(acceleration, dtype=numpy.double)
+        curvature = numpy.asarray(curvature, dtype=numpy.double)
+
+        angular_velocity = curvature * velocity
+        radial_acceleration = angular_velocity * velocity
+        normalized_acceleration = numpy.hypot(acceleration / self.max_tangential_acceleration,
+                                              radial_acceleration / self.max_radial_acceleration)
+
+        with numpy.errstate(invalid="ignore", divide="ignore"):
+            feasible = (numpy.abs(velocity) <= self.max_velocity) & \
+                       (numpy.abs(angular_velocity) <= self.max_angular_velocity) & \
+                       (normalized_acceleration < 1)
+            if jerk is not None:
+                feasible &= numpy.abs(jerk) <= self.max_jerk
+
+            # Map is only checked for states that passed the cheaper tests
+            feasible[feasible] = ~self.world_map.has_collision_many(x[feasible], y[feasible],
+                                                                    self.robot_radius)
+
+            cost = 1 / (1 - normalized_acceleration)
+
+        ticks_left, ticks_right = self._drive_model.velocity_to_ticks(velocity, angular_velocity)
+        slow = (numpy.abs(ticks_left) < self.min_wheel_speed) | (numpy.abs(ticks_right) < self.min_wheel_speed)
+        cost[slow] *= 2
+
+        cost[~feasible] = float("nan")
+        return cost
+
+    def swept_collisions(self, x1, y1, x2, y2):
+        """ Return boolean array telling which of the line segments between positions
+        (x1, y1) and (x2, y2) (arrays) the robot can't move along without collision. """
+        return self.world_map.has_collision_segments(x1, y1, x2, y2, self.robot_radius)
+
+    # Area (x_min, y_min, x_max, y_max) where random states are generated
+    sampling_area = (-10, -10, 20, 20)
+
+    def random_state(self, area = None):
+        """ Return a random state with position inside area (x_min, y_min, x_max, y_max),
+        defaults to sampling_area. """
+        return self.random_states(1, area)[0]
+
+    def random_states(self, count, area = None):
+        """ Return list of count random states, the same as count calls to random_state. """
+        if area is None:
+            area = self.sampling_area
+        x_min, y_min, x_max, y_max = area
+
+        val = self._halton.take(count)
+
+        velocity = self.max_velocity * val[:, 0]
+        return [state.State(*fields, 0, 0)
+                for fields in zip((x_min + (x_max - x_min) * val[:, 1]).tolist(),
+                                  (y_min + (y_max - y_min) * val[:, 2]).tolist(),
+                                  (2 * math.pi * val[:, 3]).tolist(),
+                                  velocity.tolist())]
@@ -1,49 +1,77 @@
 from . import local_planner
 from . import path_iterator
-from . import state
+from . import heuristics
+from . import graph_search
+from . import roadmap
+from . import roadmap_file
+from . import roadmap_cache
+from . import path_cost
+from . import smoothing
 
 import logging
-import heapq
-import collections
-import math
-import random
+import bisect
+import concurrent.futures
 import itertools
+import math
 import os.path
 import sys
-import gzip
-import struct
+import numpy
 
 import kdtree
 
-_Connection = collections.namedtuple("_Connection", ["node", "cost"])
-
-class _Node:
-    __slots__ = ("state", "connections", "index", "cost", "previous")
+# Maximal time step between states checked along paths, path costs are
+# integrals of state cost over time divided by this.
+_path_cost_resolution = 0.1
 
-    def __init__(self, state):
-        self.state = state
-        self.connections = []
-        self.index = -1 # Index is a helper field used during path finding and serialization
-        self.previous = None
-
-    def add_connection(self, node, cost):
-        self.connections.append(_Connection(node, cost))
+class BuildCancelled(Exception):
+    """ Raised from Prm constructor when stop_event got set while building the roadmap. """
+    pass
 
 class Prm:
     """ Probabilistic roadmap """
 
     max_neighbors = 50
     neighbors_examined = 5 * max_neighbors
+    neighbors_max_distance = float("inf")
     roadmap_nodes = 500
     distance_epsilon = 0.1
 
-    _count_struct = struct.Struct("I")
-    _state_struct = struct.Struct("ffffff")
-    _connection_struct = struct.Struct("If")
-
-    def __init__(self, planning_parameters):
+    # Lazy roadmap: edges get an optimistic cost (travel time / _path_cost_resolution)
+    # and are only checked when they are on a path found by the roadmap search.
+    lazy = False
+
+    # Number of processes evaluating connections when building the roadmap,
+    # 1 builds the roadmap in the main process, one state at a time.
+    build_workers = 1
+    build_batch_size = 64
+
+    # Path smoothing evaluates at most smoothing_evaluations shortcuts and stops
+    # after smoothing_time_limit seconds. Random shortcuts are generated from
+    # smoothing_seed, so the same query gives the same path.
+    smoothing_evaluations = 500
+    smoothing_time_limit = 0.5
+    smoothing_seed = 0
+
+    # Directory with cached roadmaps, None means roadmap_cache next to the program.
+    cache_directory = None
+    # Number of roadmaps kept in the cache
+    cache_size = 4
+
+    # Number of states sampled by invalidate_region around the changed area
+    # and how far around it
+    repair_nodes = 20
+    repair_margin = 2
+    # Number of edges whose paths are planned at once when checking them
+    revalidation_chunk_size = 4096
+
+    def __init__(self, planning_parameters, heuristic = heuristics.euclidean, stop_event = None):
+        """ Heuristic is a function from module heuristics (or compatible) used
+        to guide the roadmap search.
+        If stop_event (threading.Event) gets set while building the roadmap,
+        the build stops and BuildCancelled is raised. """
         self._parameters = planning_parameters
-        self._pf_index = 0
+        self._heuristic = heuristic
+        self._stop_event = stop_event
 
         self._logger = logging.getLogger(__name__)
 
@@ -57,112 +85,407 @@ class Prm:
         if node2 is None:
             raise Exception("Target position is unreachable")
 
+        return self.plan_path_between(node1, node2)
+
+    def plan_path_between(self, node1, node2):
+        """ Find path between two roadmap nodes (see add_states).
+        Returns path iterator, or None if there is no path.
+        Unless the roadmap is lazy, this only reads the roadmap. """
         node_sequence = self._a_star(node1, node2)
         if node_sequence is None:
             return None
 
-        node_sequence = self._path_smoothing(list(node_sequence))
+        node_sequence = self._path_smoothing(node_sequence)
 
-        return _PathIterator([node.state for node in node_sequence])
+        return _PathIterator([self._roadmap.state(node) for node in node_sequence])
 
     def _a_star(self, start, target):
+        """ Search the roadmap. Unchecked edges on the found path get checked
+        and the search repeats until it finds a path consisting of checked edges only. """
+        # Edge costs integrate state costs (at least 1) over time and divide
+        # by _path_cost_resolution, the time bound converts to cost like this
+        # and stays admissible.
+        target_state = self._roadmap.state(target)
+        heuristic_cache = {}
         def dist_to_target(node):
-            path = local_planner.plan_path(node.state, target.state)
-            if path is None:
-                return math.hypot(node.state.x - target.state.x,
-                                  node.state.y - target.state.y)
-            else:
-                return path.travel_time
-
-        self._pf_index += 1
-
-        waiting = [(dist_to_target(start), start)]
-        start.previous = None
-        start.cost = 0
-        start.index = self._pf_index
-
-        while len(waiting):
-            _, node = heapq.heappop(waiting)
-
-            if node == target:
-                ret = []
-                while node is not None:
-                    ret.append(node)
-                    node = node.previous
-                return reversed(ret)
-
-            for child, cost in node.connections:
-                if child.index == self._pf_index:
-                    continue
-                child.previous = node
-                child.cost = node.cost + cost
-                child.index = self._pf_index
-
-                heuristic_cost = child.cost + dist_to_target(child)
-
-                heapq.heappush(waiting, (heuristic_cost, child))
+            try:
+                return heuristic_cache[node]
+            except KeyError:
+                value = self._heuristic(self._parameters,
+                                        self._roadmap.state(node),
+                                        target_state) / _path_cost_resolution
+                heuristic_cache[node] = value
+                return value
+
+        while True:
+            path, stats = graph_search.a_star(self._roadmap, start, target, dist_to_target)
+            self._logger.info("Roadmap search expanded %d nodes, pushed %d, path cost %f",
+                              stats.expanded, stats.pushed, stats.cost)
+
+            if path is None or self._check_edges(path):
+                return path
+
+    def _check_edges(self, node_sequence):
+        """ Check unchecked edges along the node sequence.
+        Infeasible edges are removed, feasible ones get their real cost.
+        Checking all of them (not stopping at the first infeasible one) saves
+        searches, most paths on a fresh lazy roadmap have several bad edges.
+        Returns True if all edges were already checked. """
+        all_checked = True
+        for node1, node2 in zip(node_sequence[:-1], node_sequence[1:]):
+            if self._roadmap.edge_checked(node1, node2):
+                continue
+            all_checked = False
 
-        return None
+            path = local_planner.plan_path(self._roadmap.state(node1), self._roadmap.state(node2))
+            cost = None if path is None else self._path_cost(path)
+            self._roadmap.set_edge_cost(node1, node2, float("inf") if cost is None else cost)
 
+        return all_checked
 
     def _obtain_roadmap(self):
-        roadmap_file = os.path.join(os.path.dirname(sys.argv[0]), "roadmap.gz")
-
-        self._roadmap = kdtree.KdTree()
-
-        try:
-            self._logger.info("Loading roadmap from file %s", roadmap_file)
-            self._load_roadmap(roadmap_file)
-        except FileNotFoundError:
-            self._logger.info("Loading roadmap failed, rebuilding")
+        cache = roadmap_cache.RoadmapCache(self._cache_directory(), self.cache_size)
+        polygons = self._parameters.world_map.polygons
+        features = self._parameters.world_map.features
+        base_key = roadmap_cache.key(self._roadmap_key_data())
+        key = roadmap_cache.key([base_key, polygons, features])
+
+        if not self._load_cached_roadmap(cache, key, base_key, polygons, features):
+            self._logger.info("No usable cached roadmap, rebuilding")
+            self._roadmap = roadmap.Roadmap()
+            self._spatial_index = kdtree.IncrementalKdTree()
             self._build_roadmap()
-            self._logger.info("Saving roadmap to file %s", roadmap_file)
-            self._save_roadmap(roadmap_file)
+            self._roadmap.compact()
+
+        if cache.lookup(key) is None:
+            self._logger.info("Saving roadmap to cache %s", cache.filename(key))
+            cache.store(key, base_key, polygons, features, self._save_roadmap)
 
-        self._roadmap.rebuild()
         self._logger.info("Have roadmap with %d nodes and %d connections",
-                          len(self._roadmap), self._get_connection_count())
-
-    def _load_roadmap(self, roadmap_file):
-        with gzip.open(roadmap_file, "rb") as fp:
-            nodes = []
-            count = self._count_struct.unpack(fp.read(self._count_struct.size))[0]
-            for i in range(count):
-                node = _Node(state.State(*self._state_struct.unpack(fp.read(self._state_struct.size))))
-                nodes.append(node)
-                self._roadmap.insert((node.state.x, node.state.y), node)
-
-            for node in nodes:
-                count = self._count_struct.unpack(fp.read(self._count_struct.size))[0]
-                for i in range(count):
-                    index, cost = self._connection_struct.unpack(fp.read(self._connection_struct.size))
-                    node.add_connection(nodes[index], cost)
-
-
-    def _save_roadmap(self, roadmap_file):
-        # Pickle was running into problems with recursion depth, so we serialize it manually
-        with gzip.open(roadmap_file, "wb") as fp:
-            fp.write(self._count_struct.pack(len(self._roadmap)))
-            for i, (_, node) in enumerate(self._roadmap):
-                node.index = i
-                fp.write(self._state_struct.pack(*node.state))
-
-            for _, node in self._roadmap:
-                fp.write(self._count_struct.pack(len(node.connections)))
-                for connection in node.connections:
-                    fp.write(self._connection_struct.pack(connection.node.index,
-                                                          connection.cost))
-
-            for _, node in self._roadmap:
-                node.index = -1
+                          len(self._roadmap), self._roadmap.edge_count())
+
+    def _load_cached_roadmap(self, cache, key, base_key, polygons, features):
+        """ Load roadmap for the current map from the cache, or load a roadmap
+        built for a different map with otherwise the same parameters and revalidate
+        edges around polygons that were added.
+        Returns True if successful. """
+
+        filename = cache.lookup(key)
+        if filename is not None:
+            try:
+                self._logger.info("Loading roadmap from file %s", filename)
+                self._load_roadmap(filename)
+                return True
+            except (FileNotFoundError, ValueError) as e:
+                self._logger.info("Loading roadmap failed (%s)", str(e))
+
+        similar = cache.find_similar(base_key)
+        if similar is None:
+            return False
+        similar_key, similar_polygons, similar_features = similar
+
+        try:
+            self._logger.info("Loading roadmap for a different map from file %s",
+                              cache.filename(similar_key))
+            self._load_roadmap(cache.filename(similar_key))
+        except (FileNotFoundError, ValueError) as e:
+            self._logger.info("Loading roadmap failed (%s)", str(e))
+            return False
+
+        # A point collides if it is inside an odd number of polygons of some feature,
+        # so collision status can only change inside polygons that are in one of
+        # the maps but not in the other, or that are in a different feature.
+        remaining = list(zip(similar_polygons, similar_features))
+        added = []
+        for polygon, feature in zip(polygons, features):
+            item = ([tuple(point) for point in polygon], feature)
+            if item in remaining:
+                remaining.remove(item)
+            else:
+                added.append(item)
+        self._logger.info("Map differs by %d added and %d removed polygons",
+                          len(added), len(remaining))
+
+        for polygon, feature in added + remaining:
+            self.invalidate_region(polygon)
+        self._roadmap.compact()
+        return True
+
+    def invalidate_region(self, polygon):
+        """ Update the roadmap after the map changed inside polygon (list of (x, y)
+        vertices), for example after adding or removing an obstacle.
+
+        Edges whose paths might pass through the polygon (or closer to it than
+        the robot radius) are evaluated again and removed if they became
+        infeasible. Nodes that became infeasible lose all their edges and get
+        marked in the roadmap, so that new states are not connected to them
+        (node indices never change, so they stay in the roadmap and in the
+        spatial index). Then repair_nodes states are sampled in
+        the bounding box of the polygon extended by repair_margin, to reconnect
+        the roadmap around the change. """
+
+        node_count = len(self._roadmap)
+
+        infeasible = self._update_node_feasibility(polygon)
+        checked, removed = self._revalidate_edges(polygon)
+
+        xs, ys = zip(*polygon)
+        area = (min(xs) - self.repair_margin, min(ys) - self.repair_margin,
+                max(xs) + self.repair_margin, max(ys) + self.repair_margin)
+        for sample in self._parameters.random_states(self.repair_nodes, area):
+            self._add_state(sample)
+
+        self._logger.info("Invalidated region: checked %d edges, removed %d, "
+                          "%d infeasible nodes, added %d nodes",
+                          checked, removed, infeasible, len(self._roadmap) - node_count)
+
+    def _update_node_feasibility(self, polygon):
+        """ Check states of nodes that can collide with the polygon again and mark
+        them as feasible or infeasible. Returns number of infeasible nodes found. """
+        radius = self._parameters.robot_radius
+        xs, ys = zip(*polygon)
+        x_min, x_max = min(xs) - radius, max(xs) + radius
+        y_min, y_max = min(ys) - radius, max(ys) + radius
+
+        nodes, _ = self._spatial_index.within_radius(((x_min + x_max) / 2, (y_min + y_max) / 2),
+                                                     math.hypot(x_max - x_min, y_max - y_min) / 2)
+        if not nodes:
+            return 0
+
+        self._roadmap.compact()
+        nodes = numpy.array(nodes, dtype=numpy.int64)
+        states = self._roadmap.states[nodes]
+        costs = self._parameters.state_cost_many(states[:, 0], states[:, 1], states[:, 3],
+                                                 states[:, 4], states[:, 5])
+        feasible = ~numpy.isnan(costs)
+        self._roadmap.set_nodes_feasible(nodes, feasible)
+        return int(numpy.count_nonzero(~feasible))
+
+    def _nearest_nodes(self, x, y):
+        """ Return list of at most neighbors_examined feasible nodes nearest
+        to (x, y) and array of their distances, sorted by distance. """
+        # Infeasible nodes are skipped, the index is asked for a few more
+        # nodes to make up for them.
+        extra = min(self._roadmap.infeasible_count, self.neighbors_examined)
+        nodes, distances = self._spatial_index.nearest((x, y), self.neighbors_examined + extra,
+                                                       self.neighbors_max_distance)
+        if extra:
+            keep = [i for i, node in enumerate(nodes)
+                    if self._roadmap.node_feasible(node)][:self.neighbors_examined]
+            nodes = [nodes[i] for i in keep]
+            distances = distances[keep]
+        return nodes, distances
+
+    def _revalidate_edges(self, polygon):
+        """ Recalculate costs of edges whose paths might pass through the polygon
+        and remove edges that became infeasible.
+        Returns tuple (number of edges checked, number of edges removed). """
+
+        self._roadmap.compact()
+        if not self._roadmap.edge_count():
+            return 0, 0
+
+        # Paths closer than robot radius to the polygon can collide with it,
+        # the bounding box is extended by it for all the tests below.
+        radius = self._parameters.robot_radius
+        xs, ys = zip(*polygon)
+        x_min, x_max = min(xs) - radius, max(xs) + radius
+        y_min, y_max = min(ys) - radius, max(ys) + radius
+
+        # Every state costs at least 1, so edge cost is at least
+        # travel time / _path_cost_resolution. The path can't get further than
+        # max_velocity * travel_time from its start and
+        # max_velocity * travel_time / 2 from the midpoint of its end points.
+        reach = self._parameters.max_velocity * _path_cost_resolution * \
+                (self._roadmap.costs.astype(numpy.double) + 1)
+
+        sources, _ = self._spatial_index.within_radius(((x_min + x_max) / 2, (y_min + y_max) / 2),
+                                                       math.hypot(x_max - x_min, y_max - y_min) / 2 +
+                                                       float(reach.max()))
+        sources = numpy.array(sources, dtype=numpy.int64)
+        sources = sources[sources < len(self._roadmap.indptr) - 1]
+
+        starts = self._roadmap.indptr[sources]
+        counts = self._roadmap.indptr[sources + 1] - starts
+        positions = numpy.repeat(starts - numpy.cumsum(counts) + counts, counts) + \
+                    numpy.arange(counts.sum())
+        sources = numpy.repeat(sources, counts)
+        targets = self._roadmap.indices[positions]
+
+        states = self._roadmap.states
+        midpoints = (states[sources, :2] + states[targets, :2]) / 2
+        dx = numpy.maximum(numpy.maximum(x_min - midpoints[:, 0], midpoints[:, 0] - x_max), 0)
+        dy = numpy.maximum(numpy.maximum(y_min - midpoints[:, 1], midpoints[:, 1] - y_max), 0)
+        # Unchecked edges will be checked when they are used
+        near = (numpy.hypot(dx, dy) <= reach[positions] / 2) & self._roadmap.checked[positions]
+        positions = positions[near]
+        sources = sources[near]
+        targets = targets[near]
+
+        # Check paths that pass through the extended bounding box of the polygon.
+        # Paths are approximated by points at interpolation steps, the box is
+        # extended by the largest step so that the curve between points is covered.
+        affected = []
+        costs = []
+        for chunk in range(0, len(positions), self.revalidation_chunk_size):
+            chunk = slice(chunk, chunk + self.revalidation_chunk_size)
+            paths = local_planner.plan_paths(states[sources[chunk]], states[targets[chunk]])
+            xs, ys = paths.points()
+            step = paths.interpolation_tables.max(axis=1)[:, numpy.newaxis]
+            crossing = ((xs >= x_min - step) & (xs <= x_max + step) &
+                        (ys >= y_min - step) & (ys <= y_max + step)).any(axis=1)
+
+            crossing = numpy.flatnonzero(crossing)
+            affected.extend((chunk.start + crossing).tolist())
+            costs.extend(float("inf") if cost is None else cost
+                         for cost in path_cost.integrate_many(self._parameters, paths, crossing,
+                                                              _path_cost_resolution))
+
+        positions = positions[affected]
+        self._roadmap.update_edge_costs(positions, costs)
+        return len(positions), sum(math.isinf(cost) for cost in costs)
+
+    def _cache_directory(self):
+        if self.cache_directory is not None:
+            return self.cache_directory
+        return os.path.join(os.path.dirname(sys.argv[0]), "roadmap_cache")
+
+    def _roadmap_key_data(self):
+        """ Return description of everything the roadmap depends on, except for the map. """
+        return {"format": roadmap_file.version,
+                "parameters": self._parameters.roadmap_key_data(),
+                "prm": {"roadmap_nodes": self.roadmap_nodes,
+                        "max_neighbors": self.max_neighbors,
+                        "neighbors_examined": self.neighbors_examined,
+                        "neighbors_max_distance": self.neighbors_max_distance,
+                        "distance_epsilon": self.distance_epsilon,
+                        "lazy": self.lazy,
+                        "path_cost": {"method": "adaptive_simpson_trapezoid_end_jerk",
+                                      "resolution": _path_cost_resolution,
+                                      "tolerance": path_cost.default_tolerance}}}
+
+    def _load_roadmap(self, filename):
+        self._roadmap, tree = roadmap_file.load(filename)
+        self._spatial_index = kdtree.IncrementalKdTree.from_static(tree,
+                                                                   self._roadmap.states[:, :2],
+                                                                   range(len(self._roadmap)))
+
+    def _save_roadmap(self, filename):
+        tree = kdtree.StaticKdTree(self._roadmap.states[:, :2])
+        roadmap_file.save(filename, self._roadmap, tree)
 
     def _build_roadmap(self):
-        for i in range(self.roadmap_nodes):
+        if self.build_workers > 1:
+            self._build_roadmap_parallel()
+            return
+
+        for i, sample in enumerate(self._parameters.random_states(self.roadmap_nodes)):
             if i % 50 == 0:
                 self._logger.info("Adding roadmap nodes: %d/%d", i, self.roadmap_nodes)
-            self._add_state(self._parameters.random_state())
+            self._check_stop()
+            self._add_state(sample)
+
+    def _build_roadmap_parallel(self):
+        """ Build the roadmap in batches of states whose connections are evaluated
+        in a process pool.
+        Every state in a batch is connected to the same candidates as it would be
+        when adding states one by one (nodes already in the roadmap and preceding states
+        of the batch), results are merged in the sampling order, so the roadmap
+        doesn't depend on scheduling of the workers. """
+
+        with concurrent.futures.ProcessPoolExecutor(self.build_workers,
+                                                    initializer=_init_worker,
+                                                    initargs=(self._parameters,)) as executor:
+            added = 0
+            while added < self.roadmap_nodes:
+                self._logger.info("Adding roadmap nodes: %d/%d", added, self.roadmap_nodes)
+                self._check_stop()
+
+                batch = self._parameters.random_states(min(self.build_batch_size,
+                                                           self.roadmap_nodes - added))
+                added += len(batch)
+                batch = [s for s in batch if self._parameters.state_cost(s) is not None]
+                self._add_batch(batch, lambda jobs: executor.map(_evaluate_job, jobs))
+
+    def _check_stop(self):
+        if self._stop_event is not None and self._stop_event.is_set():
+            self._logger.info("Roadmap build cancelled")
+            raise BuildCancelled()
+
+    def add_states(self, states):
+        """ Add states to the roadmap in a single batch, return list of their nodes
+        (None for infeasible states). Equal states get the same node, states close
+        to an existing node or to a preceding state get merged into it.
+        States are connected in the same way as when building the roadmap in parallel. """
+        unique = [s for s in dict.fromkeys(states) if self._parameters.state_cost(s) is not None]
+        nodes = self._add_batch(unique,
+                                lambda jobs: (_evaluate_connections(self._parameters, *job)
+                                              for job in jobs))
+        nodes = dict(zip(unique, nodes))
+        return [nodes.get(s) for s in states]
+
+    def _add_batch(self, batch, evaluate_jobs):
+        """ Add feasible states to the roadmap, connecting each of them to nodes
+        already in the roadmap and to preceding states of the batch.
+        evaluate_jobs maps an iterable of argument tuples of _evaluate_connections
+        (without the parameters) to an iterable of its results, in order.
+        Returns list of nodes of the states (existing nodes for merged states). """
+        candidates = [self._batch_candidates(batch, i) for i in range(len(batch))]
+        jobs = [(s, [batch[index] if in_batch else self._roadmap.state(index)
+                     for in_batch, index in candidates[i]],
+                 self.max_neighbors, self.distance_epsilon, self.lazy)
+                for i, s in enumerate(batch)]
+
+        # Nodes created for the batch states, or None where the state
+        # was merged into an already existing node.
+        batch_nodes = []
+        # Nodes representing the batch states, including the merged ones
+        nodes = []
+
+        for i, (duplicate, forward, backward) in enumerate(evaluate_jobs(jobs)):
+            def resolve(candidate):
+                in_batch, index = candidate
+                if in_batch:
+                    return batch_nodes[index]
+                else:
+                    return index
+
+            if duplicate is not None:
+                batch_nodes.append(None)
+                in_batch, index = candidates[i][duplicate]
+                nodes.append(nodes[index] if in_batch else index)
+                continue
 
-        self._roadmap.rebuild()
+            node = self._insert_node(batch[i])
+            for j, cost, checked in forward:
+                neighbor = resolve(candidates[i][j])
+                if neighbor is not None:
+                    self._roadmap.add_edge(node, neighbor, cost, checked)
+            for j, cost, checked in backward:
+                neighbor = resolve(candidates[i][j])
+                if neighbor is not None:
+                    self._roadmap.add_edge(neighbor, node, cost, checked)
+
+            batch_nodes.append(node)
+            nodes.append(node)
+
+        return nodes
+
+    def _batch_candidates(self, batch, i):
+        """ Return list of connection candidates for i-th state of the batch,
+        as tuples (in_batch, index) of either existing nodes, or preceding batch states. """
+        state = batch[i]
+        nodes, distances = self._nearest_nodes(state.x, state.y)
+        candidates = [(distance, j, (False, node))
+                      for j, (distance, node) in enumerate(zip(distances.tolist(), nodes))]
+
+        for j, other in enumerate(batch[:i]):
+            distance = math.hypot(other.x - state.x, other.y - state.y)
+            if distance <= self.neighbors_max_distance:
+                candidates.append((distance, len(candidates), (True, j)))
+
+        candidates.sort()
+        return [c[2] for c in candidates[:self.neighbors_examined]]
 
     def _add_state(self, state):
         cost = self._parameters.state_cost(state)
@@ -170,169 +493,179 @@ class Prm:
         if cost is None:
             return None
 
-        node = _Node(state)
+        neighbors, _ = self._nearest_nodes(state.x, state.y)
 
-        forward_neighbors = []
-        backward_neighbors = []
+        duplicate, forward, backward = _evaluate_connections(self._parameters, state,
+                                                             [self._roadmap.state(neighbor)
+                                                              for neighbor in neighbors],
+                                                             self.max_neighbors, self.distance_epsilon,
+                                                             self.lazy)
+        if duplicate is not None:
+            return neighbors[duplicate] # Close enough node was already in the roadmap
 
-        for _, neighbor in itertools.islice(self._roadmap.nearest_neighbors((state.x, state.y)),
-                                         self.neighbors_examined):
-            neighbor_cost = self._parameters.state_cost(neighbor.state)
+        node = self._insert_node(state)
 
-            path = local_planner.plan_path(state, neighbor.state)
-            if path is not None:
-                forward_neighbors.append((neighbor_cost * path.travel_time, neighbor))
-                if path.travel_time < self.distance_epsilon:
-                    return neighbor # Close enough node was already in the roadmap
+        for i, cost, checked in forward:
+            self._roadmap.add_edge(node, neighbors[i], cost, checked)
 
-            path = local_planner.plan_path(neighbor.state, state)
-            if path is not None:
-                backward_neighbors.append((neighbor_cost * path.travel_time, neighbor))
-                if path.travel_time < self.distance_epsilon:
-                    return neighbor # Close enough node was already in the roadmap
+        for i, cost, checked in backward:
+            self._roadmap.add_edge(neighbors[i], node, cost, checked)
 
-        forward_neighbors.sort()
-        backward_neighbors.sort()
-
-        for distance, neighbor in forward_neighbors[:self.max_neighbors]:
-            self._maybe_connect(node, neighbor)
-
-        for distance, neighbor in backward_neighbors[:self.max_neighbors]:
-            self._maybe_connect(neighbor, node)
-
-        self._roadmap.insert((state.x, state.y), node)
         return node
 
-    def _maybe_connect(self, node1, node2):
-        #if self._a_star(node1, node2) is not None:
-        #    # If there is already a path, we don't need to add another edge
-        #    return
-
-        path = local_planner.plan_path(node1.state, node2.state)
-        assert path is not None
-
-        cost = self._path_cost(path)
-        if cost is None:
-            return
-
-        node1.add_connection(node2, cost)
-
-    def _path_cost(self, path_iterator, resolution = 0.1):
-        """ Estimate integral of self._parameters.state_cost over the states on path_iterator. """
-
-        # TODO: Maybe don't check points one by one, instead try midpoint, quarter points, ....
-        # Halton sequence?
-
-        cost = self._parameters.state_cost(path_iterator)
-        if cost is None:
-            return None
-
-        while not path_iterator.finished():
-            path_iterator.advance(resolution)
-
-            state_cost = self._parameters.state_cost(path_iterator)
-            if state_cost is None:
-                return None
-            else:
-                cost += state_cost
-
-        return cost
+    def _insert_node(self, node_state):
+        """ Add node to the roadmap and to the spatial index, return its index. """
+        node = self._roadmap.add_node(node_state)
+        self._spatial_index.insert((node_state.x, node_state.y), node)
+        return node
 
-    def _get_connection_count(self):
-        return sum(len(node[1].connections) for node in self._roadmap)
+    def _path_cost(self, path_iterator):
+        """ Return cost of a local path, or None if it is infeasible. """
+        return path_cost.integrate(self._parameters, path_iterator, _path_cost_resolution)
 
     def _path_smoothing(self, node_sequence):
-        costs = []
-        for i, (node1, node2) in enumerate(zip(node_sequence[:-1], node_sequence[1:])):
-            for connection in node1.connections:
-                if connection.node == node2:
-                    costs.append(connection.cost)
-                    break
-            assert len(costs) == i + 1
-        assert len(costs) == len(node_sequence) - 1
-
-        for i in range(5 * len(node_sequence)):
-            k = random.randrange(len(node_sequence))
-            l = random.randrange(len(node_sequence))
-            if k == l:
-                continue
-
-            k, l = min(k, l), max(k, l)
-
-            if k + 1 == l:
-                continue
-
-            node1 = node_sequence[k]
-            node2 = node_sequence[l]
-
-            path = local_planner.plan_path(node1.state, node2.state)
-            if path is None:
-                continue
-            cost = self._path_cost(path)
-            if cost is None:
-                continue
-
-            previous_cost = sum(costs[k:l+1])
-            if cost >= previous_cost:
-                continue
-
-            # Now we have a local path that is shorter than what the planner found
-            # Replace it
-
-            self._logger.info("Taking shortcut: skipping %i nodes, cost %d -> %d",
-                              l - k - 1, previous_cost, cost)
-
-            node_sequence = list(node_sequence[:k + 1] + node_sequence[l:])
-            costs = list(costs[:k] + [cost] + costs[l:])
-            assert len(costs) == len(node_sequence) - 1
+        costs = [self._roadmap.edge_cost(node1, node2)
+                 for node1, node2 in zip(node_sequence[:-1], node_sequence[1:])]
+        assert None not in costs
+
+        node_sequence, stats = smoothing.shortcut(node_sequence, costs, self._shortcut_costs,
+                                                  self.smoothing_evaluations,
+                                                  self.smoothing_time_limit,
+                                                  self.smoothing_seed)
+        self._logger.info("Path smoothing evaluated %d shortcuts, took %d, path cost %f",
+                          stats.evaluations, stats.shortcuts, stats.cost)
         return node_sequence
 
+    def _shortcut_costs(self, pairs):
+        """ Return list of costs of local paths between pairs of nodes (None if infeasible). """
+        paths = local_planner.plan_paths([self._roadmap.state(node1) for node1, node2 in pairs],
+                                         [self._roadmap.state(node2) for node1, node2 in pairs])
+        return path_cost.integrate_many(self._parameters, paths, numpy.arange(len(pairs)),
+                                        _path_cost_resolution)
+
 
 class _PathIterator(path_iterator.PathIterator):
+    """ Path through a sequence of states, made of local paths between consecutive
+    states. The local paths are planned once, as a local_planner.PathBatch,
+    states at a time are found by bisection over start times of the local paths. """
+
     def __init__(self, states):
         if len(states) < 2:
             raise ValueError("There must be at least two states.")
         self._states = states
-        self.travel_time = sum(local_planner.plan_path(s1, s2).travel_time
-                               for s1, s2
-                               in zip(states[:-1], states[1:]))
+        self._batch = local_planner.plan_paths(states[:-1], states[1:])
+        self._paths = [self._batch[i] for i in range(len(self._batch))]
+        if None in self._paths:
+            raise ValueError("There is no local path between some of the states.")
+        self._start_times = list(itertools.accumulate(self._batch.travel_time.tolist(), initial=0))
+        self.travel_time = self._start_times[-1]
         super().__init__()
 
     def reset(self):
-        self.time = 0
-        self._i = 0
-        self._load_sub()
-
-    def _load_sub(self):
-        self._sub = local_planner.plan_path(self._states[self._i],
-                                            self._states[self._i + 1])
+        self.jump_to(0)
 
     def advance(self, dt):
-        self.time += dt
-
-        while dt >= self._sub.travel_time - self._sub.time:
-            dt -= self._sub.travel_time - self._sub.time
-            self._i += 1
-
-            if self._i >= len(self._states) - 1:
-                self._i = len(self._states) - 1
-                self._time = self.travel_time
-                self._sub.jump_to(self._sub.travel_time)
-                return
-
-            self._load_sub()
+        self.jump_to(self.time + dt)
 
-        assert(dt >= 0)
-        assert(dt < self._sub.travel_time - self._sub.time)
-
-        if dt == 0:
-            return
-
-        self._sub.advance(dt)
+    def jump_to(self, time):
+        self.time = min(max(time, 0), self.travel_time)
+        self._i = bisect.bisect_right(self._start_times, self.time, 0, len(self._paths)) - 1
+        self._sub = self._paths[self._i]
+        self._sub.jump_to(self.time - self._start_times[self._i])
 
     def finished(self):
-        return self._i == len(self._states) - 1 and self._sub.finished()
-
-    def __getattr__(self, key):
-        """ The rest of values gets taken from the sub iterator """
-        return getattr(self._sub, key)
+        return self.time >= self.travel_time
+
+    def sample(self, times):
+        """ Return states at given times as an array of path_iterator.sample_dtype,
+        evaluated for all local paths at once. """
+        times = numpy.clip(numpy.asarray(times, dtype=numpy.double), 0, self.travel_time)
+        start_times = numpy.array(self._start_times)
+        indices = numpy.minimum(numpy.searchsorted(start_times, times, side="right") - 1,
+                                len(self._paths) - 1)
+        arrays = self._batch.state_arrays(indices, times - start_times[indices])
+
+        ret = numpy.empty(len(times), dtype=path_iterator.sample_dtype)
+        for name, array in zip(path_iterator.sample_dtype.names, arrays):
+            ret[name] = array
+        return ret
+
+    @property
+    def x(self):
+        return self._sub.x
+
+    @property
+    def y(self):
+        return self._sub.y
+
+    @property
+    def heading(self):
+        return self._sub.heading
+
+    @property
+    def velocity(self):
+        return self._sub.velocity
+
+    @property
+    def acceleration(self):
+        return self._sub.acceleration
+
+    @property
+    def curvature(self):
+        return self._sub.curvature
+
+    @property
+    def jerk(self):
+        return self._sub.jerk
+
+
+def _evaluate_connections(parameters, state, neighbor_states, max_neighbors, distance_epsilon,
+                          lazy = False):
+    """ Find edges between state and candidate neighbor states.
+    Returns a tuple (duplicate, forward, backward). Duplicate is index of a neighbor
+    close enough to be used instead of state (forward and backward are empty then),
+    or None. Forward and backward are lists of (neighbor index, cost, checked) of
+    edges from state to neighbors and from neighbors to state.
+    If lazy is true, paths are not checked and costs are just optimistic estimates. """
+
+    if not len(neighbor_states):
+        return None, [], []
+
+    # Neighbors may be infeasible if the map changed after they were added
+    neighbor_costs = numpy.array([parameters.state_cost(neighbor_state)
+                                  for neighbor_state in neighbor_states], dtype=numpy.double)
+
+    forward_paths = local_planner.plan_paths([state] * len(neighbor_states), neighbor_states)
+    backward_paths = local_planner.plan_paths(neighbor_states, [state] * len(neighbor_states))
+
+    close = (forward_paths.travel_time < distance_epsilon) | (backward_paths.travel_time < distance_epsilon)
+    close &= ~numpy.isnan(neighbor_costs)
+    if close.any():
+        return int(numpy.argmax(close)), [], []
+
+    def connect(paths):
+        rank = neighbor_costs * paths.travel_time
+        candidates = numpy.flatnonzero(~numpy.isnan(rank))
+        candidates = candidates[numpy.argsort(rank[candidates], kind="stable")[:max_neighbors]]
+
+        if lazy:
+            return [(i, travel_time / _path_cost_resolution, False)
+                    for i, travel_time in zip(candidates.tolist(),
+                                              paths.travel_time[candidates].tolist())]
+
+        costs = path_cost.integrate_many(parameters, paths, candidates, _path_cost_resolution)
+        return [(i, cost, True) for i, cost in zip(candidates.tolist(), costs) if cost is not None]
+
+    return None, connect(forward_paths), connect(backward_paths)
+
+# Planning parameters of a roadmap building worker process
+_worker_parameters = None
+
+def _init_worker(parameters):
+    global _worker_parameters
+    _worker_parameters = parameters
+
+def _evaluate_job(job):
+    state, neighbor_states, max_neighbors, distance_epsilon, lazy = job
+    return _evaluate_connections(_worker_parameters, state, neighbor_states,
+                                 max_neighbors, distance_epsilon, lazy)
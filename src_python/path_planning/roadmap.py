@@ -0,0 +1,256 @@
+import collections
+import math
+import numpy
+
+from . import state
+
+_Connection = collections.namedtuple("_Connection", ["node", "cost"])
+
+class Roadmap:
+    """ Directed graph of path planning states.
+
+    Nodes are rows of a state matrix (N x 6, fields of State), edges are kept in
+    compressed sparse row format: targets of edges going from node i are
+    indices[indptr[i]:indptr[i + 1]], with costs at the same positions in costs.
+    Edges can be unchecked (array checked), then their cost is only an optimistic
+    estimate (lazy roadmap), infinite cost marks a removed edge.
+    Nodes whose states became infeasible (map changes) are marked in array
+    feasible, new nodes should not be connected to them.
+    Nodes and edges added since the last compact() are kept separately
+    (states in a growable array, edges in per node lists), so that the arrays
+    can be read only, for example memory mapped from a file.
+    compact() merges them into the arrays. Node indices never change. """
+
+    # Pending edges get merged automatically once there is more of them than
+    # this or than edges in the arrays, whichever is larger.
+    compact_threshold = 1 << 16
+
+    def __init__(self, states = None, indptr = None, indices = None, costs = None, checked = None,
+                 feasible = None):
+        if states is None:
+            states = numpy.empty((0, len(state.State._fields)))
+        if indptr is None:
+            indptr = numpy.zeros(len(states) + 1, dtype=numpy.int64)
+            indices = numpy.empty(0, dtype=numpy.int32)
+            costs = numpy.empty(0, dtype=numpy.float32)
+        if checked is None:
+            checked = numpy.ones(len(indices), dtype=bool)
+        if feasible is None:
+            feasible = numpy.ones(len(states), dtype=bool)
+
+        self._states = states
+        self._added_states = numpy.empty((16, len(state.State._fields)))
+        self._added_count = 0
+        self.indptr = indptr
+        self.indices = indices
+        self.costs = costs
+        self.checked = checked
+        self.feasible = feasible
+        self.infeasible_count = int(numpy.count_nonzero(~feasible))
+        self._pending = collections.defaultdict(list)
+        self._pending_count = 0
+        self._removed_count = 0
+
+    def __len__(self):
+        return len(self._states) + self._added_count
+
+    @property
+    def states(self):
+        """ Matrix of states of all nodes. """
+        if self._added_count:
+            return numpy.concatenate((self._states, self._added_states[:self._added_count]))
+        else:
+            return self._states
+
+    def state(self, index):
+        if index < len(self._states):
+            row = self._states[index]
+        else:
+            row = self._added_states[index - len(self._states)]
+        return state.State(*row.tolist())
+
+    def add_node(self, node_state):
+        """ Add a node and return its index. """
+        if self._added_count == len(self._added_states):
+            grown = numpy.empty((2 * self._added_count, self._added_states.shape[1]))
+            grown[:self._added_count] = self._added_states
+            self._added_states = grown
+
+        self._added_states[self._added_count] = node_state
+        self._added_count += 1
+        return len(self) - 1
+
+    def node_feasible(self, index):
+        """ Return False if the node was marked infeasible. """
+        return index >= len(self.feasible) or bool(self.feasible[index])
+
+    def set_nodes_feasible(self, nodes, feasible):
+        """ Mark nodes (array of indices) as feasible or infeasible (array of bools). """
+        self.compact()
+        new_feasible = numpy.array(self.feasible)
+        new_feasible[nodes] = feasible
+        self.feasible = new_feasible
+        self.infeasible_count = int(numpy.count_nonzero(~new_feasible))
+
+    def add_edge(self, source, target, cost, checked = True):
+        self._pending[source].append((target, cost, checked))
+        self._pending_count += 1
+
+        if self._pending_count > max(self.compact_threshold, len(self.indices)):
+            self.compact()
+
+    def __getitem__(self, index):
+        """ Return list of (target, cost) pairs of edges going from node index. """
+        if index < len(self.indptr) - 1:
+            start = self.indptr[index]
+            end = self.indptr[index + 1]
+            ret = list(zip(self.indices[start:end].tolist(), self.costs[start:end].tolist()))
+        else:
+            ret = []
+
+        pending = self._pending.get(index)
+        if pending is not None:
+            ret.extend((target, cost) for target, cost, _ in pending)
+
+        return ret
+
+    def _find_edge(self, source, target):
+        """ Return position of the edge in the arrays, or the pending edge list
+        and position in it, or None if there is no such edge. """
+        if source < len(self.indptr) - 1:
+            start = self.indptr[source]
+            end = self.indptr[source + 1]
+            found = numpy.flatnonzero(self.indices[start:end] == target)
+            if len(found):
+                return None, start + found[0]
+
+        pending = self._pending.get(source, [])
+        for i, (edge_target, _, _) in enumerate(pending):
+            if edge_target == target:
+                return pending, i
+
+        return None
+
+    def edge_checked(self, source, target):
+        """ Return True if cost of the edge is final, False if it is
+        an optimistic estimate, or None if there is no such edge. """
+        found = self._find_edge(source, target)
+        if found is None:
+            return None
+        pending, i = found
+        if pending is None:
+            return bool(self.checked[i])
+        else:
+            return pending[i][2]
+
+    def set_edge_cost(self, source, target, cost):
+        """ Set cost of an existing edge and mark it as checked.
+        Infinite cost removes the edge. """
+        pending, i = self._find_edge(source, target)
+        if math.isinf(cost):
+            self._removed_count += 1
+
+        if pending is None:
+            self.costs[i] = cost
+            self.checked[i] = True
+        else:
+            pending[i] = (target, cost, True)
+
+    def edge_cost(self, source, target):
+        """ Return cost of edge from source to target, or None if there is no such edge. """
+        for edge_target, cost in self[source]:
+            if edge_target == target:
+                return cost
+        return None
+
+    def edge_count(self):
+        return len(self.indices) + self._pending_count - self._removed_count
+
+    def compact(self):
+        """ Merge added nodes and pending edges into the arrays and drop removed edges. """
+        if not self._added_count and not self._pending_count and not self._removed_count:
+            return
+
+        self._states = self.states
+        self.feasible = numpy.concatenate((self.feasible,
+                                           numpy.ones(self._added_count, dtype=bool)))
+        self._added_count = 0
+
+        sources = [self.edge_sources()]
+        targets = [self.indices]
+        costs = [self.costs]
+        checked = [self.checked]
+
+        for source, edges in self._pending.items():
+            sources.append(numpy.full(len(edges), source))
+            edge_targets, edge_costs, edges_checked = zip(*edges)
+            targets.append(numpy.array(edge_targets, dtype=numpy.int32))
+            costs.append(numpy.array(edge_costs, dtype=numpy.float32))
+            checked.append(numpy.array(edges_checked, dtype=bool))
+
+        sources = numpy.concatenate(sources)
+        costs = numpy.concatenate(costs)
+        order = numpy.argsort(sources, kind="stable")
+        order = order[numpy.isfinite(costs[order])] # Drop removed edges
+
+        self.indptr = numpy.zeros(len(self) + 1, dtype=numpy.int64)
+        numpy.cumsum(numpy.bincount(sources[order], minlength=len(self)), out=self.indptr[1:])
+        self.indices = numpy.concatenate(targets)[order]
+        self.costs = costs[order]
+        self.checked = numpy.concatenate(checked)[order]
+
+        self._pending.clear()
+        self._pending_count = 0
+        self._removed_count = 0
+
+    def edge_sources(self):
+        """ Return array of source nodes of edges in the arrays (in the order of indices). """
+        return numpy.repeat(numpy.arange(len(self.indptr) - 1), numpy.diff(self.indptr))
+
+    def update_edge_costs(self, positions, costs):
+        """ Set costs of edges at given positions in the arrays.
+        Edges whose new cost is infinite are removed, this changes positions of edges. """
+        new_costs = numpy.array(self.costs)
+        new_costs[positions] = costs
+        new_checked = numpy.array(self.checked)
+        new_checked[positions] = True
+
+        keep = numpy.isfinite(new_costs)
+        if not keep.all():
+            sources = self.edge_sources()[keep]
+            self.indptr = numpy.zeros(len(self.indptr), dtype=numpy.int64)
+            numpy.cumsum(numpy.bincount(sources, minlength=len(self.indptr) - 1), out=self.indptr[1:])
+            self.indices = self.indices[keep]
+            new_costs = new_costs[keep]
+            new_checked = new_checked[keep]
+        self.costs = new_costs
+        self.checked = new_checked
+
+    def node(self, index):
+        """ Return object representing the node, with attributes state, index and
+        connections (list of (node, cost) named tuples). """
+        return _NodeView(self, index)
+
+class _NodeView:
+    __slots__ = ("_roadmap", "index")
+
+    def __init__(self, roadmap, index):
+        self._roadmap = roadmap
+        self.index = index
+
+    @property
+    def state(self):
+        return self._roadmap.state(self.index)
+
+    @property
+    def connections(self):
+        return [_Connection(_NodeView(self._roadmap, target), cost)
+                for target, cost in self._roadmap[self.index]]
+
+    def __eq__(self, other):
+        return isinstance(other, _NodeView) and \
+               other._roadmap is self._roadmap and \
+               other.index == self.index
+
+    def __hash__(self):
+        return hash(self.index)
@@ -0,0 +1,107 @@
+import hashlib
+import json
+import os
+
+def key(data):
+    """ Return a hex digest identifying JSON serializable data. """
+    serialized = json.dumps(data, sort_keys=True, separators=(",", ":"))
+    return hashlib.sha1(serialized.encode("utf-8")).hexdigest()
+
+def _normalize_polygons(polygons):
+    return [[tuple(point) for point in polygon] for polygon in polygons]
+
+class RoadmapCache:
+    """ Directory of roadmap files named by a hash of everything the roadmap
+    depends on.
+
+    Every roadmap file <key>.bin has a sidecar <key>.json with a base key
+    (hash of everything except the map geometry) and the map polygons with
+    their features (see world_map.WorldMap.features), so that a roadmap built
+    for a different version of the same map can be found and reused after
+    revalidating the changed areas.
+    Modification time of the roadmap file is the time of its last use, least
+    recently used roadmaps are removed when there is more than max_entries of them. """
+
+    def __init__(self, directory, max_entries = 4):
+        self.directory = directory
+        self.max_entries = max_entries
+
+    def filename(self, key):
+        return os.path.join(self.directory, key + ".bin")
+
+    def _sidecar_filename(self, key):
+        return os.path.join(self.directory, key + ".json")
+
+    def lookup(self, key):
+        """ Return filename of a cached roadmap with the key and mark it as
+        recently used, or return None if there is no such roadmap. """
+        filename = self.filename(key)
+        try:
+            os.utime(filename)
+        except FileNotFoundError:
+            return None
+        return filename
+
+    def find_similar(self, base_key):
+        """ Return tuple (key, polygons, features) of the most recently used cached
+        roadmap with the base key, or None if there is none. """
+        best = None
+        for key, mtime in self._entries():
+            if best is not None and mtime <= best[0]:
+                continue
+            try:
+                with open(self._sidecar_filename(key), "r") as fp:
+                    sidecar = json.load(fp)
+            except (FileNotFoundError, ValueError):
+                continue
+            if sidecar.get("base_key") != base_key:
+                continue
+            polygons = _normalize_polygons(sidecar["polygons"])
+            best = (mtime, key, polygons, sidecar.get("features", [0] * len(polygons)))
+
+        if best is None:
+            return None
+        return best[1:]
+
+    def store(self, key, base_key, polygons, features, save):
+        """ Add a roadmap to the cache.
+        save is a function that writes the roadmap to a filename given as its parameter. """
+        os.makedirs(self.directory, exist_ok=True)
+
+        save(self.filename(key))
+
+        tmp_filename = self._sidecar_filename(key) + ".tmp"
+        with open(tmp_filename, "w") as fp:
+            json.dump({"base_key": base_key,
+                       "polygons": _normalize_polygons(polygons),
+                       "features": list(features)}, fp)
+        os.replace(tmp_filename, self._sidecar_filename(key))
+
+        self._evict()
+
+    def _entries(self):
+        """ Return list of (key, mtime) of roadmaps in the cache. """
+        ret = []
+        try:
+            names = os.listdir(self.directory)
+        except FileNotFoundError:
+            return ret
+
+        for name in names:
+            key, extension = os.path.splitext(name)
+            if extension != ".bin":
+                continue
+            try:
+                ret.append((key, os.stat(os.path.join(self.directory, name)).st_mtime))
+            except FileNotFoundError:
+                pass
+        return ret
+
+    def _evict(self):
+        entries = sorted(self._entries(), key=lambda entry: entry[1], reverse=True)
+        for key, _ in entries[self.max_entries:]:
+            for filename in (self.filename(key), self._sidecar_filename(key)):
+                try:
+                    os.remove(filename)
+                except FileNotFoundError:
+                    pass
@@ -0,0 +1,114 @@
+import os
+import struct
+import numpy
+
+import kdtree
+from . import roadmap
+
+# Roadmap file layout:
+# Header (magic, format version, number of nodes, number of edges, number of
+# spatial index tree nodes), followed by uncompressed little endian arrays,
+# each starting at a multiple of _alignment bytes:
+# roadmap states, indptr, indices, costs, checked flags and node feasibility
+# flags, then arrays of a kdtree.StaticKdTree over node positions, whose ids
+# are node indices.
+# Loading just maps the file to memory, so it is fast and processes using
+# the same roadmap file share its pages. Edge costs and checked flags are mapped
+# copy on write, so that lazily checked edges can be updated in memory.
+
+_magic = b"RMAP"
+# Format version, part of roadmap cache keys
+version = 3
+_header_struct = struct.Struct("<4sIQQQ")
+_alignment = 64
+_writable = ("costs", "checked")
+
+def _layout(node_count, edge_count, tree_node_count):
+    """ Return list of (name, dtype, shape) of arrays stored in the file. """
+    return [("states", "<f8", (node_count, 6)),
+            ("indptr", "<i8", (node_count + 1,)),
+            ("indices", "<i4", (edge_count,)),
+            ("costs", "<f4", (edge_count,)),
+            ("checked", "|b1", (edge_count,)),
+            ("feasible", "|b1", (node_count,)),
+            ("coords", "<f8", (node_count, 2)),
+            ("ids", "<i8", (node_count,)),
+            ("axis", "<i1", (tree_node_count,)),
+            ("split", "<f8", (tree_node_count,)),
+            ("right", "<i4", (tree_node_count,)),
+            ("start", "<i4", (tree_node_count,)),
+            ("end", "<i4", (tree_node_count,)),
+            ("bbox", "<f8", (tree_node_count, 4))]
+
+def _aligned(offset):
+    return -(-offset // _alignment) * _alignment
+
+def save(filename, graph, spatial_index):
+    """ Save roadmap graph (compacted roadmap.Roadmap) and its spatial index
+    (kdtree.StaticKdTree with node indices as ids) to a file.
+    The file is written under a temporary name and then renamed, so that
+    processes that have the old version mapped are not affected. """
+
+    assert graph.edge_count() == len(graph.indices), "Roadmap must be compacted before saving"
+    assert len(spatial_index) == len(graph)
+
+    arrays = {"states": graph.states,
+              "indptr": graph.indptr,
+              "indices": graph.indices,
+              "costs": graph.costs,
+              "checked": graph.checked,
+              "feasible": graph.feasible}
+    for name in kdtree.StaticKdTree.array_names:
+        arrays[name] = getattr(spatial_index, name)
+
+    tmp_filename = filename + ".tmp"
+    with open(tmp_filename, "wb") as fp:
+        fp.write(_header_struct.pack(_magic, version,
+                                     len(graph), len(graph.indices), len(spatial_index.axis)))
+
+        for name, dtype, shape in _layout(len(graph), len(graph.indices), len(spatial_index.axis)):
+            fp.write(b"\0" * (_aligned(fp.tell()) - fp.tell()))
+            array = numpy.ascontiguousarray(arrays[name], dtype=dtype)
+            assert array.shape == shape
+            fp.write(array.tobytes())
+
+    os.replace(tmp_filename, filename)
+
+def load(filename):
+    """ Map a roadmap file to memory.
+    Returns tuple (roadmap.Roadmap, kdtree.StaticKdTree) backed by read only
+    memory maps. Raises ValueError if the file is not a roadmap file of the
+    current version. """
+
+    with open(filename, "rb") as fp:
+        header = fp.read(_header_struct.size)
+        file_size = os.fstat(fp.fileno()).st_size
+
+    if len(header) < _header_struct.size:
+        raise ValueError("Roadmap file is truncated")
+    magic, file_version, node_count, edge_count, tree_node_count = _header_struct.unpack(header)
+    if magic != _magic:
+        raise ValueError("Not a roadmap file")
+    if file_version != version:
+        raise ValueError("Unsupported roadmap file version {}".format(file_version))
+
+    arrays = {}
+    offset = _header_struct.size
+    for name, dtype, shape in _layout(node_count, edge_count, tree_node_count):
+        offset = _aligned(offset)
+        size = int(numpy.prod(shape)) * numpy.dtype(dtype).itemsize
+        if offset + size > file_size:
+            raise ValueError("Roadmap file is truncated")
+
+        if size:
+            mode = "c" if name in _writable else "r"
+            arrays[name] = numpy.memmap(filename, dtype=dtype, mode=mode, offset=offset, shape=shape)
+        else:
+            arrays[name] = numpy.empty(shape, dtype=dtype)
+        offset += size
+
+    graph = roadmap.Roadmap(arrays["states"], arrays["indptr"], arrays["indices"],
+                            arrays["costs"], arrays["checked"], arrays["feasible"])
+    spatial_index = kdtree.StaticKdTree.from_arrays(*(arrays[name]
+                                                      for name in kdtree.StaticKdTree.array_names))
+    return graph, spatial_index
@@ -0,0 +1,83 @@
+import collections
+import random
+import time
+
+SmoothingStats = collections.namedtuple("SmoothingStats", ["cost", "evaluations", "shortcuts"])
+
+def shortcut(node_sequence, costs, evaluate, max_evaluations = float("inf"),
+             time_limit = float("inf"), seed = 0, random_tries = None):
+    """ Make a path cheaper by replacing parts of it with direct paths between its nodes.
+
+    costs[i] is cost of the path from node_sequence[i] to node_sequence[i + 1],
+    evaluate(pairs) returns list of costs of direct paths between (node1, node2)
+    pairs from a list, None for pairs without a feasible path.
+
+    First a greedy pass goes from the start of the path and at every node takes
+    a shortcut to the farthest later node that lowers the cost (all candidates
+    for one node are evaluated in a single call). Then random_tries (five times
+    the number of nodes by default) random pairs are tried, generated by
+    random.Random(seed).
+    Every pair is evaluated at most once, evaluating stops after max_evaluations
+    pairs or when time_limit seconds have passed. Unless the time limit is hit,
+    the result only depends on the inputs and the seed.
+    Returns tuple (node_sequence, stats), where stats is SmoothingStats with cost
+    of the new path, number of evaluated pairs and number of shortcuts taken. """
+
+    node_sequence = list(node_sequence)
+    costs = list(costs)
+    if len(costs) != len(node_sequence) - 1:
+        raise ValueError("There must be one cost less than nodes.")
+
+    deadline = time.monotonic() + time_limit
+    memo = {}
+    shortcuts = 0
+
+    def out_of_budget():
+        return len(memo) >= max_evaluations or time.monotonic() >= deadline
+
+    def evaluate_pairs(pairs):
+        pairs = [pair for pair in pairs if pair not in memo]
+        if len(memo) + len(pairs) > max_evaluations:
+            pairs = pairs[:int(max_evaluations - len(memo))]
+        if pairs:
+            memo.update(zip(pairs, evaluate(pairs)))
+
+    def try_shortcut(k, l):
+        """ Replace nodes between k and l by the direct path if it is known and cheaper. """
+        nonlocal node_sequence, costs, shortcuts
+        cost = memo.get((node_sequence[k], node_sequence[l]))
+        if cost is None or cost >= sum(costs[k:l]):
+            return False
+
+        node_sequence = node_sequence[:k + 1] + node_sequence[l:]
+        costs = costs[:k] + [cost] + costs[l:]
+        shortcuts += 1
+        return True
+
+    k = 0
+    while k < len(node_sequence) - 2 and not out_of_budget():
+        # Farthest nodes first, so that these get evaluated if the budget runs out
+        candidates = range(len(node_sequence) - 1, k + 1, -1)
+        evaluate_pairs([(node_sequence[k], node_sequence[l]) for l in candidates])
+        for l in candidates:
+            if try_shortcut(k, l):
+                break
+        k += 1
+
+    generator = random.Random(seed)
+    if random_tries is None:
+        random_tries = 5 * len(node_sequence)
+    for i in range(random_tries):
+        if len(node_sequence) < 3 or out_of_budget():
+            break
+
+        k = generator.randrange(len(node_sequence))
+        l = generator.randrange(len(node_sequence))
+        k, l = min(k, l), max(k, l)
+        if l - k < 2:
+            continue
+
+        evaluate_pairs([(node_sequence[k], node_sequence[l])])
+        try_shortcut(k, l)
+
+    return node_sequence, SmoothingStats(sum(costs), len(memo), shortcuts)
@@ -0,0 +1,63 @@
+from nose.tools import *
+from path_planning import graph_search
+
+def check_search(adjacency, start, goal, expected_path, expected_cost):
+    path, stats = graph_search.a_star(adjacency, start, goal)
+    assert_equal(path, expected_path)
+    assert_almost_equal(stats.cost, expected_cost)
+
+def simple_test():
+    adjacency = [[(1, 1), (2, 5)],
+                 [(2, 1), (3, 10)],
+                 [(3, 1)],
+                 []]
+    yield (check_search, adjacency, 0, 3, [0, 1, 2, 3], 3)
+    yield (check_search, adjacency, 0, 0, [0], 0)
+    yield (check_search, adjacency, 3, 0, None, float("inf"))
+
+def cheaper_path_found_later_test():
+    """ Node 3 is first reached expensively through 1, then cheaply through 2.
+    The search must use the cheaper path. """
+    adjacency = [[(1, 1), (2, 2)],
+                 [(3, 10)],
+                 [(3, 1)],
+                 [(4, 1)],
+                 []]
+    check_search(adjacency, 0, 4, [0, 2, 3, 4], 4)
+
+def ties_test():
+    adjacency = [[(1, 1), (2, 1)],
+                 [(3, 1)],
+                 [(3, 1)],
+                 []]
+    path, stats = graph_search.a_star(adjacency, 0, 3)
+    assert_equal(path[0], 0)
+    assert_equal(path[-1], 3)
+    assert_almost_equal(stats.cost, 2)
+
+def heuristic_test():
+    """ Grid graph, with a good heuristic the search expands only nodes
+    along the straight line. """
+    size = 20
+    def neighbors(index):
+        x, y = divmod(index, size)
+        for dx, dy in [(1, 0), (-1, 0), (0, 1), (0, -1)]:
+            if 0 <= x + dx < size and 0 <= y + dy < size:
+                yield ((x + dx) * size + y + dy, 1)
+
+    class Grid:
+        def __getitem__(self, index):
+            return neighbors(index)
+
+    goal = size * size - 1
+    def heuristic(index):
+        x, y = divmod(index, size)
+        return (size - 1 - x) + (size - 1 - y)
+
+    path, stats = graph_search.a_star(Grid(), 0, goal, heuristic)
+    assert_almost_equal(stats.cost, 2 * (size - 1))
+    assert_equal(len(path), 2 * size - 1)
+
+    path, blind_stats = graph_search.a_star(Grid(), 0, goal)
+    assert_almost_equal(blind_stats.cost, 2 * (size - 1))
+    assert blind_stats.expanded > stats.expanded
@@ -1,6 +1,7 @@
 from nose.tools import *
 
 from util import halton
+import numpy
 
 def uniqueness_test():
     values = set()
@@ -23,3 +24,38 @@ def values_test():
         print("actual = {}, expected = {}".format(str(actual), str(expected)))
         assert_almost_equal(actual[0], expected[0])
         assert_almost_equal(actual[1], expected[1])
+
+def take_test():
+    sequence = halton.HaltonSequence(4)
+    expected = [next(sequence) for i in range(500)]
+
+    sequence = halton.HaltonSequence(4)
+    taken = sequence.take(200)
+    assert_equal(taken.shape, (200, 4))
+    # Bit for bit the same as point by point
+    assert_equal(taken.tolist() + sequence.take(300).tolist(), expected)
+
+def skip_test():
+    sequence = halton.HaltonSequence(3)
+    expected = sequence.take(100)[50:]
+
+    sequence = halton.HaltonSequence(3)
+    sequence.skip(50)
+    assert_equal(sequence.take(50).tolist(), expected.tolist())
+
+def check_scrambled(sequence):
+    values = sequence.take(1000)
+    assert_equal(len(set(map(tuple, values.tolist()))), 1000)
+    assert_true(((values >= 0) & (values < 1)).all())
+
+    # Every elementary interval of the first dimension gets the same number of points
+    assert_equal(numpy.bincount((values[:, 0] * 8).astype(int)).tolist(), [125] * 8)
+
+def scrambling_test():
+    yield check_scrambled, halton.HaltonSequence(7, seed=1)
+    yield check_scrambled, halton.HaltonSequence(7, leap=31)
+
+    plain = halton.HaltonSequence(7).take(100)
+    assert_not_equal(halton.HaltonSequence(7, seed=1).take(100).tolist(), plain.tolist())
+    assert_equal(halton.HaltonSequence(7, seed=1).take(100).tolist(),
+                 halton.HaltonSequence(7, seed=1).take(100).tolist())
@@ -0,0 +1,60 @@
+from nose.tools import *
+from path_planning import heuristics, path_cost, local_planner, State
+from path_planner_util import make_parameters
+import math
+import random
+
+def arc_end(state, radius, angle, velocity):
+    """ State reached from state by driving angle radians along a circle
+    (counterclockwise for positive radius). """
+    sign = math.copysign(1, radius)
+    center_x = state.x - radius * math.sin(state.heading)
+    center_y = state.y + radius * math.cos(state.heading)
+    heading = state.heading + sign * angle
+    return State(center_x + radius * math.sin(heading), center_y - radius * math.cos(heading),
+                 math.remainder(heading, 2 * math.pi), velocity, 0, 0)
+
+def check_admissible(heuristic):
+    parameters = make_parameters()
+    resolution = 0.1
+
+    # Edges roughly following circular arcs are mostly feasible, and the sharper
+    # ones need more time to turn than to cover the distance.
+    random.seed(0)
+    feasible = 0
+    turning_bound = 0
+    for i in range(100):
+        velocity = random.uniform(0.2, 0.5)
+        state1 = State(0, 0, random.uniform(-math.pi, math.pi), velocity, 0, 0)
+        state2 = arc_end(state1, random.choice([-1, 1]) * random.uniform(0.8, 3),
+                         random.uniform(0.2, 2.5), velocity)
+
+        cost = path_cost.integrate(parameters, local_planner.plan_path(state1, state2), resolution)
+        if cost is None:
+            continue
+        feasible += 1
+        if heuristics.turning(parameters, state1, state2) > heuristics.euclidean(parameters, state1, state2):
+            turning_bound += 1
+        assert_less_equal(heuristic(parameters, state1, state2), cost * resolution)
+
+    assert_greater(feasible, 50)
+    assert_greater(turning_bound, 5)
+
+def admissible_test():
+    yield check_admissible, heuristics.euclidean
+    yield check_admissible, heuristics.turning
+
+def check_turning_wrap_around(heading1, heading2, angle):
+    parameters = make_parameters()
+    state1 = State(0, 0, heading1, 0.5, 0, 0)
+    state2 = State(0, 0, heading2, 0.5, 0, 0)
+    expected = angle / parameters.max_angular_velocity
+    assert_almost_equal(heuristics.turning(parameters, state1, state2), expected)
+    assert_almost_equal(heuristics.turning(parameters, state2, state1), expected)
+
+def turning_wrap_around_test():
+    yield check_turning_wrap_around, math.pi - 0.1, -math.pi + 0.1, 0.2
+    yield check_turning_wrap_around, math.pi, -math.pi, 0
+    yield check_turning_wrap_around, 0.1, 2 * math.pi - 0.1, 0.2
+    yield check_turning_wrap_around, -math.pi / 2, math.pi / 2, math.pi
+    yield check_turning_wrap_around, 3 * math.pi, math.pi, 0
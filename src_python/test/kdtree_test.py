@@ -55,3 +55,144 @@ def nearest_neighbor_test():
     check_sequence_increasing(math.hypot(coord[0] - 30, coord[1] - 30)
                               for coord, value
                               in neighbors)
+
+def brute_force_k_nearest(points, coord, k):
+    distances = sorted((math.hypot(x - coord[0], y - coord[1]), i)
+                       for i, (x, y) in enumerate(points))
+    return distances[:k]
+
+def static_query_k_test():
+    random.seed(0)
+    points = [(random.uniform(0, 100), random.uniform(0, 100)) for i in range(1000)]
+    tree = StaticKdTree(points)
+
+    assert_equal(len(tree), len(points))
+    assert_equal(sorted(value for coord, value in tree), list(range(len(points))))
+
+    for k in [0, 1, 5, 100, 2000]:
+        for i in range(20):
+            coord = (random.uniform(-10, 110), random.uniform(-10, 110))
+            ids, distances = tree.query_k(coord, k)
+            expected = brute_force_k_nearest(points, coord, k)
+
+            assert_equal(len(ids), len(expected))
+            for i, d, (expected_d, expected_i) in zip(ids, distances, expected):
+                assert_almost_equal(d, expected_d)
+                assert_almost_equal(math.hypot(points[i][0] - coord[0], points[i][1] - coord[1]), d)
+
+def static_query_k_many_test():
+    random.seed(0)
+    for count in [10, 3000]:
+        points = [(random.uniform(0, 100), random.uniform(0, 100)) for i in range(count)]
+        tree = StaticKdTree(points, [i + 1000 for i in range(count)])
+        coords = [(random.uniform(0, 100), random.uniform(0, 100)) for i in range(50)]
+
+        ids, distances = tree.query_k_many(coords, 20)
+        assert_equal(ids.shape, (len(coords), min(count, 20)))
+
+        for coord, row_ids, row_distances in zip(coords, ids, distances):
+            expected_ids, expected_distances = tree.query_k(coord, 20)
+            assert_equal(list(row_ids), list(expected_ids))
+            for d, expected_d in zip(row_distances, expected_distances):
+                assert_almost_equal(d, expected_d)
+
+def static_empty_test():
+    tree = StaticKdTree([])
+    assert_equal(len(tree), 0)
+    ids, distances = tree.query_k((0, 0), 5)
+    assert_equal(len(ids), 0)
+    ids, distances = tree.query_k_many([(0, 0), (1, 1)], 5)
+    assert_equal(ids.shape, (2, 0))
+
+def incremental_query_k_test():
+    random.seed(0)
+    points = []
+    tree = IncrementalKdTree()
+    for i in range(2000):
+        points.append((random.uniform(0, 100), random.uniform(0, 100)))
+        tree.insert(points[-1], i)
+        assert_equal(len(tree), i + 1)
+
+        if i % 97 == 0:
+            coord = (random.uniform(0, 100), random.uniform(0, 100))
+            values, distances = tree.nearest(coord, 10)
+            expected = brute_force_k_nearest(points, coord, 10)
+            assert_equal(values, [i for d, i in expected])
+            for d, (expected_d, expected_i) in zip(distances, expected):
+                assert_almost_equal(d, expected_d)
+
+    assert_equal(sorted(value for coord, value in tree), list(range(len(points))))
+
+    # Number of static trees is bounded by the number of bits of len(tree) / buffer_size
+    assert tree.depth() <= math.log2(len(tree) / tree.buffer_size) + 1
+
+def incremental_from_static_test():
+    random.seed(1)
+    for count in [0, 5, 100]:
+        points = [(random.uniform(0, 100), random.uniform(0, 100)) for i in range(count)]
+        tree = IncrementalKdTree.from_static(StaticKdTree(points), points, range(count))
+        for i in range(150):
+            points.append((random.uniform(0, 100), random.uniform(0, 100)))
+            tree.insert(points[-1], len(points) - 1)
+        assert_equal(len(tree), len(points))
+
+        coord = (50, 50)
+        values, distances = tree.nearest(coord, 10)
+        assert_equal(values, [i for d, i in brute_force_k_nearest(points, coord, 10)])
+
+def presorted_build_test():
+    random.seed(0)
+    data = [((random.randrange(10), random.uniform(0, 100)), i) for i in range(300)]
+    tree = KdTree()
+    tree.build(data)
+
+    assert_equal(sorted(value for coord, value in tree), list(range(len(data))))
+
+    def check_node(node, low, high):
+        if not isinstance(node, KdTree):
+            for coord, value in node:
+                for axis in range(2):
+                    assert low[axis] <= coord[axis] <= high[axis]
+            return
+        left_high = list(high)
+        left_high[node.axis] = node.coord
+        right_low = list(low)
+        right_low[node.axis] = node.coord
+        check_node(node.left, low, left_high)
+        check_node(node.right, right_low, high)
+
+    check_node(tree, (-math.inf, -math.inf), (math.inf, math.inf))
+
+def bounded_queries_test():
+    random.seed(0)
+    points = [(random.uniform(0, 100), random.uniform(0, 100)) for i in range(700)]
+
+    tree = KdTree()
+    incremental = IncrementalKdTree()
+    for i, point in enumerate(points):
+        tree.insert(point, i)
+        incremental.insert(point, i)
+    tree.rebuild()
+    static = StaticKdTree(points)
+
+    def check(coord, k, max_distance):
+        expected = [(d, i) for d, i in brute_force_k_nearest(points, coord, k) if d <= max_distance]
+
+        assert_equal([value for c, value in tree.nearest(coord, k, max_distance)],
+                     [i for d, i in expected])
+        assert_equal(list(static.nearest(coord, k, max_distance)[0]), [i for d, i in expected])
+        assert_equal(incremental.nearest(coord, k, max_distance)[0], [i for d, i in expected])
+
+        expected = set(i for d, i in brute_force_k_nearest(points, coord, len(points))
+                       if d <= max_distance)
+        assert_equal(set(value for c, value in tree.within_radius(coord, max_distance)), expected)
+        assert_equal(set(static.within_radius(coord, max_distance)[0]), expected)
+        values, distances = incremental.within_radius(coord, max_distance)
+        assert_equal(set(values), expected)
+        for value, distance in zip(values, distances):
+            assert_almost_equal(distance, math.hypot(points[value][0] - coord[0],
+                                                     points[value][1] - coord[1]))
+
+    for k, max_distance in [(1, float("inf")), (10, 5), (50, 10), (1000, 20), (5, 0)]:
+        for i in range(10):
+            yield (check, (random.uniform(-10, 110), random.uniform(-10, 110)), k, max_distance)
@@ -1,8 +1,10 @@
+from nose.tools import *
 from path_planning import local_planner, State
 
 import path_planner_util
 
 import math
+import random
 
 def local_check_path(state1, state2):
     it = local_planner.plan_path(state1, state2)
@@ -14,6 +16,9 @@ def local_check_path(state1, state2):
     it.reset()
     path_planner_util.check_it_equal_to_state(it, state1)
 
+    path_planner_util.check_sample(it)
+    it.reset()
+
     path_planner_util.check_path(it)
 
     assert(it.finished())
@@ -35,3 +40,86 @@ def test():
     yield (local_check_path,
            State(0, 0, 0, 1, 0, 0),
            State(5, 0, 0, 2, 0.7, 1))
+
+def check_batch_equal(states_from, states_to):
+    batch = local_planner.plan_paths(states_from, states_to)
+    assert_equal(len(batch), len(states_from))
+
+    for i, (state1, state2) in enumerate(zip(states_from, states_to)):
+        expected = local_planner.plan_path(state1, state2)
+        actual = batch[i]
+
+        if expected is None:
+            assert(actual is None)
+            continue
+
+        assert_almost_equal(actual.travel_time, expected.travel_time)
+        for t in [0, 0.3 * expected.travel_time, expected.travel_time]:
+            expected.jump_to(t)
+            actual.jump_to(t)
+            path_planner_util.check_it_equal_to_state(actual, expected)
+
+def batch_test():
+    random.seed(0)
+    states = [State(random.uniform(-10, 10), random.uniform(-10, 10),
+                    random.uniform(-math.pi, math.pi), random.uniform(0, 1),
+                    random.uniform(-0.3, 0.3), random.uniform(-1, 1))
+              for i in range(100)]
+    yield (check_batch_equal, states[:50], states[50:])
+    yield (check_batch_equal, [State(0, 0, 0, 0, 0, 0)], [State(1, 0, 0, 0, 0, 0)])
+    yield (check_batch_equal, [], [])
+
+def state_arrays_test():
+    random.seed(1)
+    states = [State(random.uniform(-10, 10), random.uniform(-10, 10),
+                    random.uniform(-math.pi, math.pi), random.uniform(0.1, 1),
+                    0, random.uniform(-0.5, 0.5))
+              for i in range(20)]
+    batch = local_planner.plan_paths(states[:10], states[10:])
+
+    for i in range(len(batch)):
+        path = batch[i]
+        if path is None:
+            continue
+        times = [0, 0.25 * path.travel_time, 0.7 * path.travel_time, path.travel_time]
+        arrays = batch.state_arrays([i] * len(times), times)
+        for j, t in enumerate(times):
+            path.jump_to(t)
+            for name, array in zip(State._fields, arrays):
+                assert_almost_equal(array[j], getattr(path, name), msg="Field " + name)
+
+def jump_test():
+    random.seed(2)
+    path = local_planner.plan_path(State(0, 0, 0, 1, 0, 0), State(5, 1, math.radians(45), 0.5, 0, 0.2))
+    times = [random.uniform(0, path.travel_time) for i in range(50)]
+    times += [0, path.travel_time, -1, path.travel_time + 1]
+
+    for t in times:
+        expected = local_planner.plan_path(State(0, 0, 0, 1, 0, 0), State(5, 1, math.radians(45), 0.5, 0, 0.2))
+        expected.advance(t)
+
+        path.jump_to(t)
+        assert_almost_equal(path.time, min(max(t, 0), path.travel_time))
+        path_planner_util.check_it_equal_to_state(path, expected)
+
+def state_at_test():
+    path = local_planner.plan_path(State(0, 0, 0, 1, 0, 0), State(3, -2, 0, 1, 0, 0))
+    path.jump_to(0.6 * path.travel_time)
+    current = path.as_state()
+
+    state = path.state_at(0.2 * path.travel_time)
+    assert_almost_equal(path.time, 0.6 * path.travel_time)
+    path_planner_util.check_it_equal_to_state(path, current)
+
+    path.jump_to(0.2 * path.travel_time)
+    path_planner_util.check_it_equal_to_state(path, state)
+
+def sample_jerk_test():
+    path = local_planner.plan_path(State(0, 0, 0, 1, 0, 0), State(5, 0, 0, 2, 0.7, 1))
+    dt = 1e-6
+    samples = path.sample([0.5 * path.travel_time, 0.5 * path.travel_time + dt])
+    assert_almost_equal((samples["acceleration"][1] - samples["acceleration"][0]) / dt,
+                        samples["jerk"][0], delta=1e-3)
+
+    path.jump_to(0.5 * path.travel_time)
+    assert_almost_equal(path.jerk, samples["jerk"][0])
@@ -0,0 +1,236 @@
+from nose.tools import *
+import map_import
+import map_file
+import world_map
+import json
+import math
+import os
+import random
+import tempfile
+
+origin = (50.0, 14.0)
+
+def offset(x, y):
+    """ Inverse of the projection around origin, (lat, lon) of a point x, y meters from it """
+    lat = origin[0] + math.degrees(y / map_import.earth_radius)
+    lon = origin[1] + math.degrees(x / (map_import.earth_radius * math.cos(math.radians(origin[0]))))
+    return lat, lon
+
+def geojson_ring(points):
+    ring = [list(reversed(offset(x, y))) for x, y in points]
+    return ring + ring[:1]
+
+square = [(0, 0), (10, 0), (10, 10), (0, 10)]
+hole = [(4, 4), (6, 4), (6, 6), (4, 6)]
+# Circle with many vertices, simplification should remove most of them
+circle = [(20 + 2 * math.cos(a), 2 * math.sin(a)) for a in [2 * math.pi * i / 200 for i in range(200)]]
+
+def write_geojson(filename):
+    data = {"type": "FeatureCollection",
+            "features": [{"type": "Feature",
+                          "properties": {"natural": "wood"},
+                          "geometry": {"type": "Polygon",
+                                       "coordinates": [geojson_ring(square), geojson_ring(hole)]}},
+                         {"type": "Feature",
+                          "properties": {"building": "shed"},
+                          "geometry": {"type": "MultiPolygon",
+                                       "coordinates": [[geojson_ring(circle)]]}},
+                         {"type": "Feature",
+                          "properties": {"landuse": "grass"},
+                          "geometry": {"type": "Polygon",
+                                       "coordinates": [geojson_ring([(-50, -50), (50, -50), (50, 50)])]}},
+                         {"type": "Feature",
+                          "properties": {"natural": "tree"},
+                          "geometry": {"type": "Point", "coordinates": [14, 50]}}]}
+    with open(filename, "w") as fp:
+        json.dump(data, fp)
+
+def write_osm(filename):
+    lines = ['<?xml version="1.0" encoding="UTF-8"?>', '<osm version="0.6">']
+    node_ids = {}
+    def node(x, y):
+        if (x, y) not in node_ids:
+            node_ids[(x, y)] = len(node_ids) + 1
+            lat, lon = offset(x, y)
+            lines.append('<node id="{}" lat="{!r}" lon="{!r}"/>'.format(node_ids[(x, y)], lat, lon))
+        return node_ids[(x, y)]
+    def way(way_id, points, tags):
+        refs = [node(x, y) for x, y in points]
+        lines.append('<way id="{}">'.format(way_id))
+        lines.extend('<nd ref="{}"/>'.format(ref) for ref in refs)
+        lines.extend('<tag k="{}" v="{}"/>'.format(k, v) for k, v in tags.items())
+        lines.append('</way>')
+
+    # Outer ring of the multipolygon split into two ways, one of them reversed
+    way(1, square[:3], {})
+    way(2, [square[0], square[3], square[2]], {})
+    way(3, hole + hole[:1], {})
+    lines.append('<relation id="10">')
+    lines.append('<member type="way" ref="1" role="outer"/>')
+    lines.append('<member type="way" ref="2" role="outer"/>')
+    lines.append('<member type="way" ref="3" role="inner"/>')
+    lines.append('<tag k="type" v="multipolygon"/>')
+    lines.append('<tag k="natural" v="wood"/>')
+    lines.append('</relation>')
+
+    way(4, circle + circle[:1], {"building": "shed"})
+    way(5, [(-50, -50), (50, -50), (50, 50), (-50, -50)], {"landuse": "grass"})
+    way(6, [(30, 0), (40, 0), (40, 10)], {"highway": "footway"})
+    lines.append('</osm>')
+
+    with open(filename, "w") as fp:
+        fp.write("\n".join(lines))
+
+def check_map(test_map):
+    assert_equal(len(test_map.polygons), 3)
+    assert_true(test_map.has_collision(1, 1))
+    assert_true(test_map.has_collision(9, 9))
+    assert_false(test_map.has_collision(5, 5)) # Hole
+    assert_false(test_map.has_collision(11, 5))
+    assert_true(test_map.has_collision(20, 1.5))
+    assert_false(test_map.has_collision(20, 2.5))
+    assert_false(test_map.has_collision(-20, 20)) # Grass
+
+    circle_polygon = max(test_map.polygons, key=len)
+    assert_less(len(circle_polygon), 40)
+
+def check_load(write, extension):
+    with tempfile.TemporaryDirectory() as directory:
+        filename = os.path.join(directory, "map" + extension)
+        write(filename)
+        check_map(map_import.load(filename, origin))
+
+def load_test():
+    yield check_load, write_geojson, ".geojson"
+    yield check_load, write_osm, ".osm"
+
+# Areas of the garden around a house, (x, y, width, height, tags)
+garden = [(0, 0, 20, 20, {"landuse": "residential"}),
+          (2, 2, 6, 6, {"building": "house"}),
+          (10, 10, 6, 6, {"natural": "wood"}),
+          (14, 14, 4, 4, {"landuse": "flowerbed"}),
+          (1, 12, 6, 6, {"highway": "pedestrian"}),
+          (12, 1, 6, 6, {"barrier": "fence"}),
+          (12, 1, 3, 3, {})]
+
+def rectangle(x, y, width, height):
+    return [(x, y), (x + width, y), (x + width, y + height), (x, y + height)]
+
+def write_garden_geojson(filename):
+    data = {"type": "FeatureCollection",
+            "features": [{"type": "Feature",
+                          "properties": tags,
+                          "geometry": {"type": "Polygon",
+                                       "coordinates": [geojson_ring(rectangle(x, y, width, height))]}}
+                         for x, y, width, height, tags in garden]}
+    with open(filename, "w") as fp:
+        json.dump(data, fp)
+
+def write_garden_osm(filename):
+    lines = ['<?xml version="1.0" encoding="UTF-8"?>', '<osm version="0.6">']
+    for i, (x, y, width, height, tags) in enumerate(garden):
+        points = rectangle(x, y, width, height)
+        for j, (px, py) in enumerate(points):
+            lines.append('<node id="{}" lat="{!r}" lon="{!r}"/>'.format(10 * i + j, *offset(px, py)))
+        lines.append('<way id="{}">'.format(i))
+        lines.extend('<nd ref="{}"/>'.format(10 * i + j) for j in [0, 1, 2, 3, 0])
+        lines.extend('<tag k="{}" v="{}"/>'.format(k, v) for k, v in tags.items())
+        lines.append('</way>')
+    lines.append('</osm>')
+    with open(filename, "w") as fp:
+        fp.write("\n".join(lines))
+
+def check_garden(write, extension):
+    with tempfile.TemporaryDirectory() as directory:
+        filename = os.path.join(directory, "garden" + extension)
+        write(filename)
+        test_map = map_import.load(filename, origin)
+
+    assert_true(test_map.has_collision(5, 5)) # House inside residential area
+    assert_false(test_map.has_collision(9, 5)) # Lawn
+    assert_true(test_map.has_collision(12, 12)) # Wood
+    assert_true(test_map.has_collision(15, 15)) # Flowerbed overlapping the wood
+    assert_true(test_map.has_collision(17, 17)) # Flowerbed
+    assert_false(test_map.has_collision(4, 15)) # Pedestrian area
+    assert_false(test_map.has_collision(16, 4)) # Fenced
+    assert_false(test_map.has_collision(13, 2)) # Untagged
+
+    # Obstacle tags can be changed
+    with tempfile.TemporaryDirectory() as directory:
+        filename = os.path.join(directory, "garden" + extension)
+        write(filename)
+        test_map = map_import.load(filename, origin, obstacle_tags={("barrier", None)})
+    assert_false(test_map.has_collision(5, 5))
+    assert_true(test_map.has_collision(16, 4))
+
+def garden_test():
+    yield check_garden, write_garden_geojson, ".geojson"
+    yield check_garden, write_garden_osm, ".osm"
+
+def projection_test():
+    x, y = map_import.project(*offset(100, -30), origin=origin)
+    assert_almost_equal(x, 100)
+    assert_almost_equal(y, -30)
+    # One degree of latitude is about 111 km
+    assert_almost_equal(map_import.project(51, 14, origin)[1], 111195, delta=1)
+
+def default_origin_test():
+    polygons, features = map_import.to_polygons([[[offset(x, y) for x, y in square]]])
+    assert_equal(features, [0])
+    assert_almost_equal(min(x for x, y in polygons[0]), -5, delta=1e-3)
+    assert_almost_equal(max(y for x, y in polygons[0]), 5, delta=1e-3)
+
+def cache_test():
+    with tempfile.TemporaryDirectory() as directory:
+        filename = os.path.join(directory, "map.geojson")
+        cache_directory = os.path.join(directory, "cache")
+        write_geojson(filename)
+
+        test_map = map_import.load(filename, origin, cache_directory=cache_directory)
+        assert_equal(len(os.listdir(cache_directory)), 1)
+
+        cached_map = map_import.load(filename, origin, cache_directory=cache_directory)
+        assert_equal(len(os.listdir(cache_directory)), 1)
+        assert_equal(cached_map.polygons, test_map.polygons)
+        check_map(cached_map)
+
+        # Different parameters get a different cache entry
+        map_import.load(filename, origin, cache_directory=cache_directory, radius=0.3)
+        assert_equal(len(os.listdir(cache_directory)), 2)
+
+def map_file_test():
+    random.seed(0)
+    polygons = [[(x + math.cos(a), y + math.sin(a)) for a in [2 * math.pi * j / 7 for j in range(7)]]
+                for x, y in [(random.uniform(-10, 10), random.uniform(-10, 10)) for i in range(20)]]
+    test_map = world_map.WorldMap(polygons)
+    test_map.prepare(0.35)
+
+    with tempfile.TemporaryDirectory() as directory:
+        filename = os.path.join(directory, "test.map")
+        map_file.save(filename, test_map)
+        loaded = map_file.load(filename)
+
+    assert_equal(loaded.polygons, test_map.polygons)
+    assert_equal(loaded._get_grid().limit, test_map._get_grid().limit)
+    assert_equal(loaded._get_grid().distances.tolist(), test_map._get_grid().distances.tolist())
+
+    points = [(random.uniform(-12, 12), random.uniform(-12, 12)) for i in range(2000)]
+    xs, ys = zip(*points)
+    for radius in (0, 0.35):
+        assert_equal(loaded.has_collision_many(xs, ys, radius).tolist(),
+                     test_map.has_collision_many(xs, ys, radius).tolist())
+
+def map_file_empty_test():
+    with tempfile.TemporaryDirectory() as directory:
+        filename = os.path.join(directory, "test.map")
+        map_file.save(filename, world_map.WorldMap([]))
+        loaded = map_file.load(filename)
+    assert_equal(loaded.polygons, [])
+    assert_false(loaded.has_collision(0, 0))
+
+def map_file_invalid_test():
+    with tempfile.TemporaryDirectory() as directory:
+        filename = os.path.join(directory, "test.map")
+        with open(filename, "wb") as fp:
+            fp.write(b"not a map file, just some bytes to fill the header........")
+        assert_raises(ValueError, map_file.load, filename)
@@ -0,0 +1,135 @@
+from nose.tools import *
+from path_planning import path_cost, local_planner, State
+import path_planner_util
+import world_map
+import math
+import numpy
+import random
+
+class MockParameters:
+    """ State cost is a function of time only, states after infeasible_after are infeasible """
+    def __init__(self, function, infeasible_after = float("inf")):
+        self.function = function
+        self.infeasible_after = infeasible_after
+        self.evaluations = 0
+
+    def state_cost(self, state):
+        self.evaluations += 1
+        if state.time > self.infeasible_after:
+            return None
+        return self.function(state.time)
+
+    def swept_collisions(self, x1, y1, x2, y2):
+        return numpy.zeros(len(x1), dtype=bool)
+
+def make_path():
+    return local_planner.plan_path(State(0, 0, 0, 1, 0, 0), State(5, 0, 0, 1, 0, 0))
+
+def coarse_to_fine_test():
+    for n in range(10):
+        order = list(path_cost._coarse_to_fine(n))
+        assert_equal(sorted(order), list(range(n)))
+    assert_equal(list(path_cost._coarse_to_fine(9)), [0, 8, 4, 2, 6, 1, 3, 5, 7])
+
+def check_integral(function, integral):
+    path = make_path()
+    parameters = MockParameters(function)
+    cost = path_cost.integrate(parameters, path, 0.1)
+    assert_almost_equal(cost, integral(path.travel_time) / 0.1, delta=1e-3 * cost)
+
+def integral_test():
+    yield check_integral, lambda t: 1, lambda t: t
+    yield check_integral, lambda t: 1 + t * t, lambda t: t + t**3 / 3
+    yield check_integral, lambda t: 2 + math.sin(t), lambda t: 2 * t + 1 - math.cos(t)
+
+def early_rejection_test():
+    path = make_path()
+    parameters = MockParameters(lambda t: 1, path.travel_time / 2)
+    assert_equal(path_cost.integrate(parameters, path, 0.1), None)
+    assert_less(parameters.evaluations, 5)
+
+def short_last_interval_test():
+    # Travel time is just above a multiple of the resolution
+    path = local_planner.plan_path(State(0, 0, 0, 0.4446, -0.1588, 0),
+                                   State(0.8086, 0, 0, 0.1093, -0.1659, 0))
+    travel_time = path.travel_time
+    last = travel_time - (path_cost._grid_size(travel_time, 0.1) - 1) * 0.1
+    assert_less(last, 0.01)
+
+    # Cost steps up in the last interval
+    parameters = MockParameters(lambda t: 1 if t < travel_time - last / 2 else 50)
+    cost = path_cost.integrate(parameters, path, 0.1)
+    assert_almost_equal(cost, (travel_time - last + 25.5 * last) / 0.1)
+
+    parameters = path_planner_util.make_parameters()
+    cost = path_cost.integrate(parameters, path)
+    assert_greater_equal(cost, travel_time / 0.1)
+
+    # Fine trapezoid rule
+    n = 5000
+    states = []
+    for i in range(n + 1):
+        path.jump_to(travel_time * i / n)
+        states.append(parameters.state_cost(path))
+    expected = sum(states[1:-1]) + (states[0] + states[-1]) / 2
+    assert_almost_equal(cost, expected * travel_time / n / 0.1, delta=0.01 * cost)
+
+def minimal_cost_test():
+    # Result is clamped to the integral of the minimal state cost (1)
+    path = make_path()
+    parameters = MockParameters(lambda t: 0.5)
+    assert_almost_equal(path_cost.integrate(parameters, path, 0.1), path.travel_time / 0.1)
+
+def integrate_many_test():
+    parameters = path_planner_util.make_parameters()
+
+    random.seed(0)
+    states = [parameters.random_state() for i in range(60)]
+    states_to = [State(s.x + random.uniform(-3, 3), s.y + random.uniform(-3, 3), s.heading,
+                       s.velocity, 0, 0)
+                 for s in states]
+    paths = local_planner.plan_paths(states, states_to)
+
+    indices = list(range(0, len(paths), 2))
+    costs = path_cost.integrate_many(parameters, paths, indices)
+    assert_equal(len(costs), len(indices))
+    for i, cost in zip(indices, costs):
+        expected = None if paths[i] is None else path_cost.integrate(parameters, paths[i])
+        if expected is None:
+            assert_equal(cost, None)
+        else:
+            assert_almost_equal(cost, expected)
+    assert_greater(costs.count(None), 0)
+    assert_less(costs.count(None), len(costs))
+
+def jerk_limit_test():
+    # Acceleration within limits, but it changes too fast
+    start = State(0, 0, 0, 0.5, 0.25, 0)
+    goal = State(2, 0, 0, 0.5, -0.25, 0)
+    for jerk, feasible in [(0.1, False), (1, True)]:
+        parameters = path_planner_util.make_parameters(jerk=jerk)
+
+        cost = path_cost.integrate(parameters, local_planner.plan_path(start, goal))
+        assert_equal(cost is not None, feasible)
+        costs = path_cost.integrate_many(parameters, local_planner.plan_paths([start], [goal]), [0])
+        assert_equal(costs[0] is not None, feasible)
+
+def swept_collision_test():
+    # Wall too thin to contain any of the states sampled along the path
+    test_map = world_map.WorldMap([[(2.52, -1), (2.54, -1), (2.54, 1), (2.52, 1)]])
+    parameters = path_planner_util.make_parameters(test_map)
+
+    path = make_path()
+    assert_equal(path_cost.integrate(parameters, path), None)
+
+    paths = local_planner.plan_paths([State(0, 0, 0, 1, 0, 0)], [State(5, 0, 0, 1, 0, 0)])
+    assert_equal(path_cost.integrate_many(parameters, paths, [0]), [None])
+
+    # Wall along the path, closer than the robot radius
+    test_map.polygons = [[(0, 0.45), (5, 0.45), (5, 1), (0, 1)]]
+    parameters = path_planner_util.make_parameters(test_map, robot_radius=0.5)
+    assert_equal(path_cost.integrate(parameters, make_path()), None)
+    assert_equal(path_cost.integrate_many(parameters, paths, [0]), [None])
+    parameters.robot_radius = 0.4
+    assert_not_equal(path_cost.integrate(parameters, make_path()), None)
+    assert_not_equal(path_cost.integrate_many(parameters, paths, [0]), [None])
@@ -1,10 +1,43 @@
 from nose.tools import *
 
 import path_planning
+from path_planning import prm, planning_parameters
+import world_map
+import differential_drive
 
 import math
 import collections
 
+limits = {"velocity": 1,
+          "angular_velocity": 0.8,
+          "acceleration": 0.3,
+          "jerk": 0.1,
+          "radial_acceleration": 0.3,
+          "min_wheel_speed": 300}
+
+def make_parameters(test_map = None, **limit_overrides):
+    """ Planning parameters with the test limits (overridden by keyword arguments)
+    and the mower's drive model. The default map is world_map.WorldMap(),
+    with its placeholder obstacles. """
+    if test_map is None:
+        test_map = world_map.WorldMap()
+    drive_model = differential_drive.DifferentialDriveModel(364.8872e-6, 364.8872e-6, 0, 0, 460e-3)
+    return planning_parameters.PlanningParameters(dict(limits, **limit_overrides),
+                                                  test_map, drive_model)
+
+def small_prm_class(directory, **attributes):
+    """ Prm subclass with a small roadmap cached in directory,
+    keyword arguments override its class attributes. """
+    attributes = dict({"roadmap_nodes": 30,
+                       "repair_nodes": 5,
+                       "cache_directory": directory}, **attributes)
+    return type("SmallPrm", (prm.Prm,), attributes)
+
+def make_planner(directory, test_map = None, robot_radius = 0, **attributes):
+    """ Small Prm (see small_prm_class) for test_map. """
+    return small_prm_class(directory, **attributes)(make_parameters(test_map,
+                                                                    robot_radius=robot_radius))
+
 def check_it_equal_to_state(it, state):
     for fieldname in path_planning.State._fields:
         assert_almost_equal(getattr(it, fieldname), getattr(state, fieldname), msg="Field " + fieldname)
@@ -51,3 +84,28 @@ def check_path(it):
 
         it.advance(dt)
 
+
+def check_sample(it):
+    """ Check that states returned by it.sample equal states after jumping to the times. """
+    times = [-1, 0, 0.1 * it.travel_time, 0.5 * it.travel_time, 0.75 * it.travel_time,
+             it.travel_time, 0.3 * it.travel_time, it.travel_time + 1]
+    it.jump_to(0.4 * it.travel_time)
+    current = it.as_state()
+
+    samples = it.sample(times)
+    assert_equal(len(samples), len(times))
+    check_it_equal_to_state(it, current)
+
+    for t, sample in zip(times, samples):
+        it.jump_to(min(max(t, 0), it.travel_time))
+        for fieldname in path_planning.State._fields:
+            assert_almost_equal(sample[fieldname], getattr(it, fieldname), msg="Field " + fieldname)
+
+    dt = it.travel_time / 7.5
+    uniform = it.sample_uniform(dt)
+    assert_equal(len(uniform), 9)
+    it.reset()
+    check_it_equal_to_state(it, path_planning.State(*(uniform[0][name] for name in path_planning.State._fields)))
+    it.jump_to(it.travel_time)
+    check_it_equal_to_state(it, path_planning.State(*(uniform[-1][name] for name in path_planning.State._fields)))
+    assert_equal(list(it.sample_intervals(dt)), list(zip(uniform["x"], uniform["y"])))
@@ -0,0 +1,76 @@
+from nose.tools import *
+from path_planning import planner_service, prm, State
+import path_planner_util
+import world_map
+import tempfile
+import time
+
+obstacle = [(5, 5), (6, 5), (6, 6), (5, 6)]
+
+def make_service(directory, lazy = False):
+    parameters = path_planner_util.make_parameters(world_map.WorldMap([obstacle]))
+    return planner_service.PlannerService(parameters,
+                                          path_planner_util.small_prm_class(directory, lazy = lazy))
+
+def check_queries(lazy):
+    states = [State(0, 0, 0, 0.5, 0, 0),
+              State(12, 15, 0, 0.5, 0, 0),
+              State(2, 10, 0, 0.5, 0, 0),
+              State(0, 0, 0, 0.5, 0, 0)]
+    with tempfile.TemporaryDirectory() as directory:
+        service = make_service(directory, lazy)
+        try:
+            futures = service.submit_many(zip(states[:-1], states[1:]))
+            paths = [future.result(timeout=120) for future in futures]
+            assert_true(service.ready())
+
+            for path, start, goal in zip(paths, states[:-1], states[1:]):
+                assert_is_not_none(path)
+                assert_almost_equal(path.x, start.x, delta=0.2)
+                assert_almost_equal(path.y, start.y, delta=0.2)
+                path.jump_to(path.travel_time)
+                assert_almost_equal(path.x, goal.x, delta=0.2)
+                assert_almost_equal(path.y, goal.y, delta=0.2)
+        finally:
+            service.shutdown()
+
+def queries_test():
+    yield check_queries, False
+    yield check_queries, True
+
+def unreachable_test():
+    with tempfile.TemporaryDirectory() as directory:
+        service = make_service(directory)
+        try:
+            future = service.submit(State(5.5, 5.5, 0, 0.5, 0, 0), State(12, 15, 0, 0.5, 0, 0))
+            assert_is_not_none(future.exception(timeout=120))
+            future = service.submit(State(0, 0, 0, 0.5, 0, 0), State(5.5, 5.5, 0, 0.5, 0, 0))
+            assert_is_not_none(future.exception(timeout=120))
+        finally:
+            service.shutdown()
+
+def invalidate_region_test():
+    polygon = [(0, 8), (4, 8), (4, 12), (0, 12)]
+    with tempfile.TemporaryDirectory() as directory:
+        service = make_service(directory)
+        try:
+            invalidated = service.invalidate_region(polygon)
+            future = service.submit(State(0, 0, 0, 0.5, 0, 0), State(2, 10, 0, 0.5, 0, 0))
+            invalidated.result(timeout=120)
+            assert_is_not_none(future.result(timeout=120))
+        finally:
+            service.shutdown()
+
+def shutdown_during_build_test():
+    with tempfile.TemporaryDirectory() as directory:
+        parameters = path_planner_util.make_parameters()
+        prm_class = path_planner_util.small_prm_class(directory, roadmap_nodes = 100000)
+        service = planner_service.PlannerService(parameters, prm_class)
+        future = service.submit(State(0, 0, 0, 0.5, 0, 0), State(12, 15, 0, 0.5, 0, 0))
+        time.sleep(0.5)
+
+        start = time.monotonic()
+        service.shutdown()
+        assert_less(time.monotonic() - start, 10)
+        assert_raises(prm.BuildCancelled, service._planner.result)
+        assert_true(future.done())
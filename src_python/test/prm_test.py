@@ -1,7 +1,12 @@
 from nose.tools import *
-from path_planning import prm, local_planner, State
+from path_planning import prm, local_planner, path_cost, State
 import path_planner_util
+import world_map
 import math
+import numpy
+import numpy.testing
+import random
+import tempfile
 
 def check_path(states):
     times = [local_planner.plan_path(s1, s2).travel_time
@@ -14,6 +19,8 @@ def check_path(states):
         it.advance(time)
         path_planner_util.check_it_equal_to_state(it, state)
 
+    path_planner_util.check_sample(it)
+
     it.reset()
 
     path_planner_util.check_path(it)
@@ -34,3 +41,179 @@ def path_iterator_test():
            State(0, 0, 0, 1, 0, 0),
            State(1, 0, 0, 0.5, 0, 1),
            State(5, 2, math.radians(90), 1, 0, 0)])
+
+def path_iterator_jump_test():
+    states = [State(0, 0, 0, 1, 0, 0),
+              State(1, 0, 0, 0.5, 0, 1),
+              State(5, 2, math.radians(90), 1, 0, 0)]
+    paths = [local_planner.plan_path(s1, s2) for s1, s2 in zip(states[:-1], states[1:])]
+    it = prm._PathIterator(states)
+    assert_almost_equal(it.travel_time, paths[0].travel_time + paths[1].travel_time)
+
+    random.seed(0)
+    for i in range(20):
+        t = random.uniform(0, it.travel_time)
+        it.jump_to(t)
+        if t < paths[0].travel_time:
+            paths[0].jump_to(t)
+            path_planner_util.check_it_equal_to_state(it, paths[0])
+        else:
+            paths[1].jump_to(t - paths[0].travel_time)
+            path_planner_util.check_it_equal_to_state(it, paths[1])
+
+    it.jump_to(it.travel_time + 1)
+    assert(it.finished())
+    path_planner_util.check_it_equal_to_state(it, states[-1])
+
+def path_iterator_jerk_test():
+    states = [State(0, 0, 0, 1, 0, 0),
+              State(1, 0, 0, 0.5, 0, 1),
+              State(5, 2, math.radians(90), 1, 0, 0)]
+    paths = [local_planner.plan_path(s1, s2) for s1, s2 in zip(states[:-1], states[1:])]
+    it = prm._PathIterator(states)
+    parameters = path_planner_util.make_parameters(world_map.WorldMap([]))
+
+    for t in [0.3 * paths[0].travel_time, paths[0].travel_time + 0.5 * paths[1].travel_time]:
+        it.jump_to(t)
+        path = paths[0] if t < paths[0].travel_time else paths[1]
+        path.jump_to(t if path is paths[0] else t - paths[0].travel_time)
+        assert_almost_equal(it.jerk, path.jerk)
+        assert_almost_equal(it.jerk, it.sample([t])["jerk"][0])
+
+    # The jerk limit applies to the composite path too
+    it.jump_to(0.3 * paths[0].travel_time)
+    assert_greater(abs(it.jerk), parameters.max_jerk)
+    assert_is_none(parameters.state_cost(it))
+
+def check_edges_feasible(planner):
+    graph = planner._roadmap
+    graph.compact()
+    for source, target in zip(graph.edge_sources().tolist(), graph.indices.tolist()):
+        path = local_planner.plan_path(graph.state(source), graph.state(target))
+        assert_not_equal(path_cost.integrate(planner._parameters, path), None)
+
+def empty_roadmap_test():
+    with tempfile.TemporaryDirectory() as directory:
+        start = State(0, 0, 0, 0.5, 0, 0)
+        goal = State(3, 1, 0, 0.5, 0, 0)
+
+        path_planner_util.make_planner(directory, roadmap_nodes = 0).plan_path(start, goal)
+        # Second planner loads the empty roadmap from the cache and inserts into it
+        path = path_planner_util.make_planner(directory, roadmap_nodes = 0).plan_path(start, goal)
+        assert_is_not_none(path)
+
+def parallel_build_test():
+    roadmaps = []
+    for workers in [1, 2]:
+        with tempfile.TemporaryDirectory() as directory:
+            test_map = world_map.WorldMap([[(5, 5), (8, 5), (8, 8), (5, 8)]])
+            planner = path_planner_util.make_planner(directory, test_map,
+                                                     build_workers = workers, build_batch_size = 7)
+            planner._roadmap.compact()
+            roadmaps.append(planner._roadmap)
+
+    serial, parallel = roadmaps
+    assert_greater(serial.edge_count(), 0)
+    for name in ["states", "indptr", "indices", "costs"]:
+        numpy.testing.assert_array_equal(getattr(parallel, name), getattr(serial, name))
+
+def check_infeasible_nodes(planner):
+    graph = planner._roadmap
+    infeasible = set(node for node in range(len(graph))
+                     if planner._parameters.state_cost(graph.state(node)) is None)
+    assert_greater(len(infeasible), 0)
+    assert_equal(set(node for node in range(len(graph)) if not graph.node_feasible(node)),
+                 infeasible)
+
+    # Infeasible nodes are not offered as neighbors of new states
+    nodes, distances = planner._nearest_nodes(2, 10)
+    assert_equal(len(nodes), len(distances))
+    assert_false(infeasible & set(nodes))
+
+def check_invalidate_region(robot_radius, roadmap_nodes):
+    polygon = [(0, 8), (4, 8), (4, 12), (0, 12)]
+    with tempfile.TemporaryDirectory() as directory:
+        test_map = world_map.WorldMap()
+        planner = path_planner_util.make_planner(directory, test_map, robot_radius = robot_radius,
+                                                 roadmap_nodes = roadmap_nodes)
+        edge_count = planner._roadmap.edge_count()
+
+        test_map.add_polygon(polygon)
+        planner.invalidate_region(polygon)
+        check_edges_feasible(planner)
+        check_infeasible_nodes(planner)
+
+        # A new planner reuses the cached roadmap for the old map
+        planner = path_planner_util.make_planner(directory, test_map, robot_radius = robot_radius,
+                                                 roadmap_nodes = roadmap_nodes)
+        check_edges_feasible(planner)
+        check_infeasible_nodes(planner)
+        assert_less(planner._roadmap.edge_count(), edge_count)
+
+def invalidate_region_test():
+    yield check_invalidate_region, 0, 30
+    # Edges passing outside of the polygon, but closer than the radius
+    yield check_invalidate_region, 1, 60
+
+def features_test():
+    outer = [(2, 2), (14, 2), (14, 14), (2, 14)]
+    inner = [(4, 4), (12, 4), (12, 12), (4, 12)]
+    with tempfile.TemporaryDirectory() as directory:
+        # Inner polygon is a hole in the outer one
+        holed_map = world_map.WorldMap([outer, inner], features=[0, 0])
+        planner = path_planner_util.make_planner(directory, holed_map)
+        states = planner._roadmap.states
+        in_hole = numpy.flatnonzero((states[:, 0] > 4) & (states[:, 0] < 12) &
+                                    (states[:, 1] > 4) & (states[:, 1] < 12)).tolist()
+        assert_greater(len(in_hole), 0)
+
+        # Same polygons as two separate obstacles, the roadmap for the holed
+        # map gets reused, but not as if the map was the same
+        separate_map = world_map.WorldMap([outer, inner], features=[0, 1])
+        planner = path_planner_util.make_planner(directory, separate_map)
+        for node in in_hole:
+            assert_false(planner._roadmap.node_feasible(node))
+        check_edges_feasible(planner)
+
+def lazy_test():
+    with tempfile.TemporaryDirectory() as directory:
+        eager_planner = path_planner_util.make_planner(directory, world_map.WorldMap())
+        lazy_planner = path_planner_util.make_planner(directory, world_map.WorldMap(), lazy = True)
+
+        start = State(0, 0, 0, 0.5, 0, 0)
+        goal = State(12, 15, 0, 0.5, 0, 0)
+        node1 = lazy_planner._add_state(start)
+        node2 = lazy_planner._add_state(goal)
+        node_sequence = lazy_planner._a_star(node1, node2)
+
+        # All edges on the path got checked and have real costs
+        for n1, n2 in zip(node_sequence[:-1], node_sequence[1:]):
+            assert_true(lazy_planner._roadmap.edge_checked(n1, n2))
+            path = local_planner.plan_path(lazy_planner._roadmap.state(n1),
+                                           lazy_planner._roadmap.state(n2))
+            assert_almost_equal(lazy_planner._roadmap.edge_cost(n1, n2),
+                                path_cost.integrate(lazy_planner._parameters, path), places=2)
+
+        # Once checked, the lazy roadmap is the same as the eager one
+        assert_equal(eager_planner._a_star(eager_planner._add_state(start),
+                                           eager_planner._add_state(goal)),
+                     node_sequence)
+
+def add_states_test():
+    with tempfile.TemporaryDirectory() as directory:
+        test_map = world_map.WorldMap([[(5, 5), (6, 5), (6, 6), (5, 6)]])
+        planner = path_planner_util.make_planner(directory, test_map)
+        node_count = len(planner._roadmap)
+
+        a = State(0.5, 0.5, 0, 0.5, 0, 0)
+        b = State(12, 15, 0, 0.5, 0, 0)
+        nodes = planner.add_states([a, b, State(5.5, 5.5, 0, 0.5, 0, 0), a])
+
+        assert_equal(nodes[0], nodes[3])
+        assert_is_none(nodes[2])
+        assert_less_equal(len(planner._roadmap), node_count + 2)
+
+        path = planner.plan_path_between(nodes[0], nodes[1])
+        path_planner_util.check_it_equal_to_state(path, planner._roadmap.state(nodes[0]))
+        path.jump_to(path.travel_time)
+        path_planner_util.check_it_equal_to_state(path, planner._roadmap.state(nodes[1]))
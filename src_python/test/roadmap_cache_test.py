@@ -0,0 +1,54 @@
+from nose.tools import *
+from path_planning import roadmap_cache
+import tempfile
+import os
+
+def save_text(text):
+    def save(filename):
+        with open(filename, "w") as fp:
+            fp.write(text)
+    return save
+
+def key_test():
+    assert_equal(roadmap_cache.key({"a": 1, "b": [1, 2]}), roadmap_cache.key({"b": [1, 2], "a": 1}))
+    assert_not_equal(roadmap_cache.key({"a": 1}), roadmap_cache.key({"a": 2}))
+
+def lookup_test():
+    with tempfile.TemporaryDirectory() as directory:
+        cache = roadmap_cache.RoadmapCache(os.path.join(directory, "cache"))
+        assert_equal(cache.lookup("k1"), None)
+        assert_equal(cache.find_similar("base"), None)
+
+        cache.store("k1", "base", [[(0, 0), (1, 0), (0, 1)]], [3], save_text("roadmap 1"))
+        with open(cache.lookup("k1"), "r") as fp:
+            assert_equal(fp.read(), "roadmap 1")
+
+        assert_equal(cache.find_similar("base"), ("k1", [[(0, 0), (1, 0), (0, 1)]], [3]))
+        assert_equal(cache.find_similar("other base"), None)
+
+def find_similar_most_recent_test():
+    with tempfile.TemporaryDirectory() as directory:
+        cache = roadmap_cache.RoadmapCache(directory)
+        cache.store("k1", "base", [], [], save_text("roadmap 1"))
+        cache.store("k2", "base", [], [], save_text("roadmap 2"))
+        os.utime(cache.filename("k1"), (1, 1))
+        assert_equal(cache.find_similar("base")[0], "k2")
+
+        cache.lookup("k1")
+        os.utime(cache.filename("k2"), (1, 1))
+        assert_equal(cache.find_similar("base")[0], "k1")
+
+def eviction_test():
+    with tempfile.TemporaryDirectory() as directory:
+        cache = roadmap_cache.RoadmapCache(directory, max_entries = 2)
+        for i in range(2):
+            cache.store("k{}".format(i), "base", [], [], save_text(str(i)))
+            os.utime(cache.filename("k{}".format(i)), (i, i))
+
+        cache.lookup("k0") # Mark k0 as recently used
+        cache.store("k2", "base", [], [], save_text("2"))
+
+        assert_not_equal(cache.lookup("k0"), None)
+        assert_equal(cache.lookup("k1"), None)
+        assert_not_equal(cache.lookup("k2"), None)
+        assert_equal(sorted(os.listdir(directory)), ["k0.bin", "k0.json", "k2.bin", "k2.json"])
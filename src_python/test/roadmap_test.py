@@ -0,0 +1,139 @@
+from nose.tools import *
+from path_planning import roadmap, roadmap_file, graph_search, State
+import kdtree
+import tempfile
+import os.path
+
+def make_roadmap():
+    r = roadmap.Roadmap()
+    for i in range(5):
+        assert_equal(r.add_node(State(i, 0, 0, 1, 0, 0)), i)
+    r.add_edge(0, 1, 1)
+    r.add_edge(1, 2, 1)
+    r.add_edge(0, 2, 5)
+    r.add_edge(2, 3, 1)
+    return r
+
+def check_edges(r):
+    assert_equal(len(r), 5)
+    assert_equal(r.edge_count(), 4)
+    assert_equal(sorted(r[0]), [(1, 1), (2, 5)])
+    assert_equal(r[3], [])
+    assert_equal(r[4], [])
+    assert_equal(r.edge_cost(0, 2), 5)
+    assert_equal(r.edge_cost(2, 0), None)
+    assert_equal(r.state(3), State(3, 0, 0, 1, 0, 0))
+
+    path, stats = graph_search.a_star(r, 0, 3)
+    assert_equal(path, [0, 1, 2, 3])
+
+def edges_test():
+    r = make_roadmap()
+    check_edges(r)
+
+    r.compact()
+    assert_equal(list(r.indptr), [0, 2, 3, 4, 4, 4])
+    check_edges(r)
+
+def compact_after_adding_nodes_test():
+    r = make_roadmap()
+    r.compact()
+    node = r.add_node(State(10, 0, 0, 1, 0, 0))
+    r.add_edge(node, 0, 2)
+    r.add_edge(3, node, 2)
+
+    assert_equal(r[node], [(0, 2)])
+    assert_equal(r[3], [(node, 2)])
+    r.compact()
+    assert_equal(r[node], [(0, 2)])
+    assert_equal(r[3], [(node, 2)])
+    assert_equal(r.edge_count(), 6)
+    assert_equal(r.states.shape, (6, 6))
+
+def update_edge_costs_test():
+    r = make_roadmap()
+    r.compact()
+    r.update_edge_costs([1, 2], [2, float("inf")])
+    assert_equal(r.edge_count(), 3)
+    assert_equal(sorted(r[0]), [(1, 1), (2, 2)])
+    assert_equal(r[1], [])
+    assert_equal(r[2], [(3, 1)])
+    assert_equal(list(r.edge_sources()), [0, 0, 2])
+
+def lazy_edges_test():
+    r = make_roadmap()
+    r.add_edge(3, 4, 0.5, False)
+    assert_equal(r.edge_checked(2, 3), True)
+    assert_equal(r.edge_checked(3, 4), False)
+    assert_equal(r.edge_checked(4, 3), None)
+
+    r.compact()
+    assert_equal(r.edge_checked(3, 4), False)
+    r.set_edge_cost(3, 4, 2)
+    assert_equal(r.edge_checked(3, 4), True)
+    assert_equal(r.edge_cost(3, 4), 2)
+
+    r.set_edge_cost(0, 1, float("inf"))
+    assert_equal(r.edge_count(), 4)
+    path, stats = graph_search.a_star(r, 0, 4)
+    assert_equal(path, [0, 2, 3, 4])
+
+    r.compact()
+    assert_equal(r.edge_count(), 4)
+    assert_equal(r[0], [(2, 5)])
+    assert_equal(list(r.checked), [True] * 4)
+
+def feasible_test():
+    r = make_roadmap()
+    assert_true(r.node_feasible(2))
+    r.set_nodes_feasible([1, 2], [False, True])
+    assert_equal(list(r.feasible), [True, False, True, True, True])
+    assert_equal(r.infeasible_count, 1)
+
+    # Added nodes are feasible
+    node = r.add_node(State(10, 0, 0, 1, 0, 0))
+    assert_true(r.node_feasible(node))
+    r.compact()
+    assert_equal(len(r.feasible), 6)
+    assert_false(r.node_feasible(1))
+
+    r.set_nodes_feasible([1], [True])
+    assert_equal(r.infeasible_count, 0)
+
+def node_view_test():
+    r = make_roadmap()
+    node = r.node(0)
+    assert_equal(node.state, r.state(0))
+    assert_equal(sorted((connection.node.index, connection.cost) for connection in node.connections),
+                 [(1, 1), (2, 5)])
+    assert_equal(node.connections[0].node, r.node(node.connections[0].node.index))
+
+def file_test():
+    r = make_roadmap()
+    r.set_nodes_feasible([4], [False])
+    tree = kdtree.StaticKdTree(r.states[:, :2])
+
+    with tempfile.TemporaryDirectory() as directory:
+        filename = os.path.join(directory, "roadmap.bin")
+        roadmap_file.save(filename, r, tree)
+
+        loaded, loaded_tree = roadmap_file.load(filename)
+        check_edges(loaded)
+        assert_equal(list(loaded.feasible), [True] * 4 + [False])
+        assert_equal(loaded.edge_checked(0, 1), True)
+
+        # Edge costs can be changed in memory without touching the file
+        loaded.set_edge_cost(0, 1, 3)
+        assert_equal(loaded.edge_cost(0, 1), 3)
+        assert_equal(roadmap_file.load(filename)[0].edge_cost(0, 1), 1)
+        assert_equal(list(loaded_tree.nearest((2.2, 0), 2)[0]), [2, 3])
+
+        # Loaded roadmap is read only, but nodes and edges can still be added
+        node = loaded.add_node(State(10, 0, 0, 1, 0, 0))
+        loaded.add_edge(3, node, 1)
+        assert_equal(loaded[3], [(node, 1)])
+        assert_equal(loaded.state(node), State(10, 0, 0, 1, 0, 0))
+
+        with open(filename, "r+b") as fp:
+            fp.write(b"XXXX")
+        assert_raises(ValueError, roadmap_file.load, filename)
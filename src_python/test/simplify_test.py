@@ -0,0 +1,38 @@
+from nose.tools import *
+from util import simplify
+import numpy
+import math
+
+def douglas_peucker_test():
+    points = [(0, 0), (1, 0.01), (2, -0.01), (3, 0), (3, 1), (3, 2)]
+    assert_equal(simplify.douglas_peucker(points, 0.05).tolist(), [[0, 0], [3, 0], [3, 2]])
+    # Collinear points are removed even with small tolerance
+    assert_equal(simplify.douglas_peucker(points, 0.001).tolist(),
+                 [list(p) for p in points if p != (3, 1)])
+    assert_equal(simplify.douglas_peucker([(0, 0), (1, 1)], 1).tolist(), [[0, 0], [1, 1]])
+
+def tolerance_test():
+    angles = numpy.linspace(0, math.pi, 200)
+    points = numpy.column_stack((numpy.cos(angles), numpy.sin(angles)))
+    simplified = simplify.douglas_peucker(points, 0.01)
+    assert_less(len(simplified), 20)
+
+    # All original points are within tolerance of the simplified polyline
+    for x, y in points:
+        distance = min(simplify._distances(numpy.array([[x, y]]), a, b)[0]
+                       for a, b in zip(simplified[:-1], simplified[1:]))
+        assert_less_equal(distance, 0.01)
+
+def simplify_polygon_test():
+    angles = numpy.linspace(0, 2 * math.pi, 100, endpoint=False)
+    circle = numpy.column_stack((numpy.cos(angles), numpy.sin(angles)))
+    simplified = simplify.simplify_polygon(circle, 0.01)
+    assert_less(len(simplified), 40)
+    assert_greater(len(simplified), 8)
+    assert_equal(simplified[0].tolist(), circle[0].tolist())
+
+    square = [(0, 0), (0.5, 0), (1, 0), (1, 1), (0, 1)]
+    assert_equal(simplify.simplify_polygon(square, 0.01).tolist(), [[0, 0], [1, 0], [1, 1], [0, 1]])
+
+    # Polygon smaller than the tolerance
+    assert_less(len(simplify.simplify_polygon([(0, 0), (0.01, 0), (0.01, 0.01), (0, 0.01)], 0.1)), 3)
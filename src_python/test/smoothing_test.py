@@ -0,0 +1,79 @@
+from nose.tools import *
+from path_planning import smoothing
+
+import math
+
+class MockEvaluator:
+    """ Nodes are indices into points, cost of a direct path is the distance,
+    paths crossing the wall (x = 0, -1 < y < 1) are infeasible. """
+    def __init__(self, points):
+        self.points = points
+        self.pairs = []
+        self.calls = 0
+
+    def __call__(self, pairs):
+        self.calls += 1
+        self.pairs.extend(pairs)
+        return [self.cost(node1, node2) for node1, node2 in pairs]
+
+    def cost(self, node1, node2):
+        (x1, y1), (x2, y2) = self.points[node1], self.points[node2]
+        if (x1 < 0) != (x2 < 0):
+            y = y1 + (y2 - y1) * -x1 / (x2 - x1)
+            if -1 < y < 1:
+                return None
+        return math.hypot(x2 - x1, y2 - y1)
+
+def zigzag(n):
+    points = [(i - n // 2, (i % 2) * 4 - 2) for i in range(n)]
+    evaluator = MockEvaluator(points)
+    nodes = list(range(n))
+    costs = [evaluator.cost(a, b) for a, b in zip(nodes[:-1], nodes[1:])]
+    return evaluator, nodes, costs
+
+def straight_test():
+    evaluator, nodes, costs = zigzag(6)
+    evaluator.points = [(i, 0) for i in range(6)]
+    result, stats = smoothing.shortcut(nodes, [2] * 5, evaluator)
+    assert_equal(result, [0, 5])
+    assert_equal(evaluator.calls, 1)
+    assert_equal(stats.shortcuts, 1)
+    assert_almost_equal(stats.cost, 5)
+
+def obstacle_test():
+    evaluator, nodes, costs = zigzag(11)
+    result, stats = smoothing.shortcut(nodes, costs, evaluator)
+
+    assert_equal(result[0], 0)
+    assert_equal(result[-1], 10)
+    new_costs = [evaluator.cost(a, b) for a, b in zip(result[:-1], result[1:])]
+    assert None not in new_costs
+    assert_almost_equal(stats.cost, sum(new_costs))
+    assert_less(stats.cost, sum(costs))
+
+def memo_test():
+    evaluator, nodes, costs = zigzag(15)
+    result, stats = smoothing.shortcut(nodes, costs, evaluator, random_tries=1000)
+    assert_equal(len(evaluator.pairs), len(set(evaluator.pairs)))
+    assert_equal(stats.evaluations, len(evaluator.pairs))
+
+def budget_test():
+    evaluator, nodes, costs = zigzag(30)
+    result, stats = smoothing.shortcut(nodes, costs, evaluator, max_evaluations=10)
+    assert_equal(len(evaluator.pairs), 10)
+    assert_equal(stats.evaluations, 10)
+
+    evaluator, nodes, costs = zigzag(30)
+    result, stats = smoothing.shortcut(nodes, costs, evaluator, time_limit=0)
+    assert_equal(result, nodes)
+    assert_equal(evaluator.calls, 0)
+
+def repeatable_test():
+    results = []
+    for i in range(2):
+        evaluator, nodes, costs = zigzag(20)
+        results.append(smoothing.shortcut(nodes, costs, evaluator, max_evaluations=40, seed=5))
+    assert_equal(results[0], results[1])
+
+def invalid_test():
+    assert_raises(ValueError, smoothing.shortcut, [0, 1, 2], [1], MockEvaluator([]))
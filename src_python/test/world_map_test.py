@@ -0,0 +1,186 @@
+from nose.tools import *
+import world_map
+import random
+import math
+import numpy
+
+def has_collision_many_test():
+    test_map = world_map.WorldMap()
+    random.seed(0)
+    points = [(random.uniform(-10, 20), random.uniform(-10, 20)) for i in range(1000)]
+    # Points on vertices and horizontal edges
+    points += [(x, y) for polygon in test_map.polygons for x, y in polygon]
+    points += [(7, 5), (4, 5), (11, 5), (7, 10)]
+
+    xs, ys = zip(*points)
+    assert_equal(test_map.has_collision_many(xs, ys).tolist(),
+                 [test_map.has_collision(x, y) for x, y in points])
+
+def add_polygon_test():
+    test_map = world_map.WorldMap()
+    assert_false(test_map.has_collision(1, 10))
+    test_map.add_polygon([(0, 8), (4, 8), (4, 12), (0, 12)])
+    assert_true(test_map.has_collision(1, 10))
+
+def random_polygons(count):
+    polygons = []
+    for i in range(count):
+        x = random.uniform(-10, 20)
+        y = random.uniform(-10, 20)
+        r = random.uniform(0.2, 2)
+        polygons.append([(x + r * math.cos(a), y + r * math.sin(a))
+                         for a in [2 * math.pi * j / 7 for j in range(7)]])
+    return polygons
+
+def brute_force_collision(polygons, x, y, radius = 0, features = None):
+    """ Even-odd test in every feature and distance to all edges of all polygons """
+    if features is None:
+        features = [0] * len(polygons)
+    inside = set()
+    for polygon, feature in zip(polygons, features):
+        for i in range(len(polygon)):
+            x1, y1 = polygon[i - 1]
+            x2, y2 = polygon[i]
+            if radius > 0:
+                length_squared = (x2 - x1)**2 + (y2 - y1)**2
+                t = min(max(((x - x1) * (x2 - x1) + (y - y1) * (y2 - y1)) / length_squared, 0), 1)
+                if math.hypot(x - x1 - t * (x2 - x1), y - y1 - t * (y2 - y1)) < radius:
+                    return True
+            if (y1 > y) != (y2 > y) and x1 + (y - y1) / (y2 - y1) * (x2 - x1) <= x:
+                inside ^= {feature}
+    return bool(inside)
+
+def check_grid_equals_exact(test_map):
+    points = [(random.uniform(-12, 22), random.uniform(-12, 22)) for i in range(2000)]
+    xs, ys = zip(*points)
+    expected = [brute_force_collision(test_map.polygons, x, y, features=test_map.features)
+                for x, y in points]
+    assert_equal([test_map.has_collision(x, y) for x, y in points], expected)
+    assert_equal(test_map.has_collision_many(xs, ys).tolist(), expected)
+
+def grid_test():
+    random.seed(1)
+    yield check_grid_equals_exact, world_map.WorldMap()
+    yield check_grid_equals_exact, world_map.WorldMap(random_polygons(50))
+    yield check_grid_equals_exact, world_map.WorldMap(random_polygons(50), resolution = 0.5)
+    yield check_grid_equals_exact, world_map.WorldMap([])
+
+    # Many small buckets
+    test_map = world_map.WorldMap(random_polygons(50))
+    test_map.bucket_size = 0.3
+    yield check_grid_equals_exact, test_map
+
+    # Overlapping polygons of several features
+    yield check_grid_equals_exact, world_map.WorldMap(random_polygons(50),
+                                                      features=[random.randrange(5) for i in range(50)])
+
+def features_test():
+    wood = [(0, 0), (10, 0), (10, 10), (0, 10)]
+    clearing = [(1, 1), (4, 1), (4, 4), (1, 4)]
+    building = [(2, 2), (3, 2), (3, 3), (2, 3)] # Inside the clearing
+    flowerbed = [(8, 8), (12, 8), (12, 12), (8, 12)] # Overlapping the wood
+    test_map = world_map.WorldMap([wood, clearing, building, flowerbed], features=[0, 0, 1, 2])
+
+    points = [(5, 5), (1.5, 1.5), (2.5, 2.5), (9, 9), (11, 11), (13, 13)]
+    expected = [True, False, True, True, True, False]
+    xs, ys = zip(*points)
+    assert_equal([test_map.has_collision(x, y) for x, y in points], expected)
+    assert_equal(test_map.has_collision_many(xs, ys).tolist(), expected)
+    assert_equal(test_map.has_collision_segments([1.5, 1.5], [1.5, 1.5], [3.9, 2.5], [1.5, 2.5]).tolist(),
+                 [False, True])
+
+    # Without features polygons make holes in each other
+    test_map.features = [0, 0, 0, 0]
+    assert_false(test_map.has_collision(9, 9))
+    assert_true(test_map.has_collision(2.5, 2.5)) # Inside three polygons
+
+    # Polygon added later is a new feature
+    test_map.add_polygon([(4.5, 4.5), (5.5, 4.5), (5.5, 5.5), (4.5, 5.5)])
+    assert_true(test_map.has_collision(5, 5))
+
+    assert_raises(ValueError, world_map.WorldMap, [wood], features=[0, 1])
+
+def polygons_change_test():
+    test_map = world_map.WorldMap()
+    assert_true(test_map.has_collision(7, 7))
+    test_map.polygons = [[(0, 8), (4, 8), (4, 12), (0, 12)]]
+    assert_false(test_map.has_collision(7, 7))
+    assert_true(test_map.has_collision(1, 10))
+
+def vertex_test():
+    # Horizontal line through the top vertex (6, 2) of the triangle only touches it
+    test_map = world_map.WorldMap()
+    assert_false(test_map.has_collision(10, 2))
+    assert_false(test_map._has_collision_exact(10, 2))
+    assert_false(test_map.has_collision_many([10], [2])[0])
+    assert_true(test_map.has_collision(6, 1.9))
+
+def check_radius_equals_exact(test_map, radius):
+    points = [(random.uniform(-12, 22), random.uniform(-12, 22)) for i in range(2000)]
+    xs, ys = zip(*points)
+    expected = [brute_force_collision(test_map.polygons, x, y, radius) for x, y in points]
+    assert_equal([test_map.has_collision(x, y, radius) for x, y in points], expected)
+    assert_equal(test_map.has_collision_many(xs, ys, radius).tolist(), expected)
+
+def radius_test():
+    random.seed(0)
+    test_map = world_map.WorldMap(random_polygons(30))
+    yield check_radius_equals_exact, test_map, 0.3
+    # Larger than distance limit
+    yield check_radius_equals_exact, test_map, 1.5
+    yield check_radius_equals_exact, world_map.WorldMap(), 0.3
+
+    test_map = world_map.WorldMap(random_polygons(30))
+    test_map.bucket_size = 0.3
+    yield check_radius_equals_exact, test_map, 0.3
+
+def check_segments(test_map, radius):
+    segments = []
+    for i in range(300):
+        x = random.uniform(-12, 22)
+        y = random.uniform(-12, 22)
+        length = random.uniform(0, 1)
+        angle = random.uniform(0, 2 * math.pi)
+        segments.append((x, y, x + length * math.cos(angle), y + length * math.sin(angle)))
+    x1, y1, x2, y2 = zip(*segments)
+    collisions = test_map.has_collision_segments(x1, y1, x2, y2, radius).tolist()
+
+    for (sx1, sy1, sx2, sy2), collision in zip(segments, collisions):
+        t = [i / 200 for i in range(201)]
+        sampled = test_map.has_collision_many([sx1 + (sx2 - sx1) * s for s in t],
+                                              [sy1 + (sy2 - sy1) * s for s in t],
+                                              radius).any()
+        # Dense sampling can only miss collisions, never find extra ones
+        if sampled:
+            assert_true(collision)
+    assert_equal(collisions, test_map._has_collision_segments_exact(*(numpy.array(a) for a in (x1, y1, x2, y2)),
+                                                                     radius = radius).tolist())
+
+def segments_test():
+    random.seed(1)
+    test_map = world_map.WorldMap(random_polygons(30))
+    yield check_segments, test_map, 0
+    yield check_segments, test_map, 0.3
+    test_map = world_map.WorldMap(random_polygons(30))
+    test_map.bucket_size = 0.3
+    yield check_segments, test_map, 0.3
+
+def bucket_test():
+    test_map = world_map.WorldMap([[(0, 0), (10, 0), (10, 1), (0, 1)],
+                                   [(20, 20), (21, 20), (21, 21)]])
+    buckets = test_map._get_grid().buckets
+    x = numpy.array([5, 20.5, 5, 20.5])
+    y = numpy.array([0.5, 20.2, 5, 5])
+    # Each point only sees edges of the polygon near it
+    seen = {int(group[0]): len(edges[0])
+            for group, edges, _ in buckets._groups(buckets._bucket(x, y),
+                                                buckets.bucket_indptr, buckets.bucket_indices)}
+    # Short sides of the rectangle are too far from the bucket of (5, 0.5)
+    assert_equal(seen, {0: 2, 1: 3})
+    assert_equal(buckets.inside(x, y).tolist(), [True, True, False, False])
+
+def thin_wall_test():
+    test_map = world_map.WorldMap([[(0.52, -1), (0.54, -1), (0.54, 1), (0.52, 1)]])
+    assert_false(test_map.has_collision_many([0.5, 0.6], [0, 0]).any())
+    assert_equal(test_map.has_collision_segments([0, 0], [0, 0], [1, 0.4], [0, 0]).tolist(), [True, False])
+    assert_true(test_map.has_collision_segments([0], [0], [0.4], [0], 0.15)[0])
@@ -1,33 +1,65 @@
+import random
+import numpy
+
 class HaltonSequence:
-    """ Iterator over n-dimensional halton sequence """
+    """ Iterator over n-dimensional halton sequence.
+
+    Point number i (starting from 1) has coordinates equal to radical inverses
+    of i * leap in the first n prime bases.
+    If seed is given, digits are scrambled by a random permutation for each
+    base (fixing zero), which breaks correlations between higher dimensions
+    while keeping the low discrepancy. """
     primes = [2, 3, 5, 7, 11, 13, 17]
 
-    def __init__(self, dimension):
+    def __init__(self, dimension, seed = None, leap = 1):
         if dimension < 1 or dimension > len(self.primes):
             raise ValueError("Dimension must be between 1 and " + str(len(self.primes)))
+        if leap < 1:
+            raise ValueError("Leap must be positive")
         self._dimension = dimension
+        self._leap = leap
         self._i = 0
 
+        if seed is None:
+            self._permutations = None
+        else:
+            generator = random.Random(seed)
+            self._permutations = []
+            for prime in self.primes[:dimension]:
+                permutation = list(range(1, prime))
+                generator.shuffle(permutation)
+                self._permutations.append(numpy.array([0] + permutation, dtype=numpy.double))
+
     def __iter__(self):
         return self
 
     def __next__(self):
-        self._i += 1
+        return self.take(1)[0].tolist()
+
+    def skip(self, count):
+        """ Skip count points of the sequence. """
+        self._i += count
 
-        ret = []
-        for prime in self.primes[:self._dimension]:
-            # This takes the number i in a number base prime and reverses the digits
-            # and decimal dot.
-            # Mostly copied from wikipedia
+    def take(self, count):
+        """ Return the next count points as a count x dimension array. """
+        indices = numpy.arange(self._i + 1, self._i + count + 1, dtype=numpy.int64) * self._leap
+        self._i += count
 
-            i = self._i
-            value = 0
+        ret = numpy.empty((count, self._dimension))
+        for j, prime in enumerate(self.primes[:self._dimension]):
+            # This takes the numbers in a number base prime and reverses the digits
+            # and decimal dot, all digit positions of all numbers at once.
+            i = indices.copy()
+            value = numpy.zeros(count)
             factor = 1
-            while i > 0:
+            while i.any():
                 factor /= prime
-                value += factor * (i % prime)
+                digits = i % prime
+                if self._permutations is not None:
+                    digits = self._permutations[j][digits]
+                value += factor * digits
                 i //= prime
 
-            ret.append(value)
+            ret[:, j] = value
 
         return ret
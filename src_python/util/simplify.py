@@ -0,0 +1,55 @@
+import numpy
+
+def _distances(points, start, end):
+    """ Distances of points (N x 2 array) from line segment start, end. """
+    direction = end - start
+    length_squared = direction.dot(direction)
+    if length_squared == 0:
+        return numpy.hypot(*(points - start).T)
+    t = numpy.clip((points - start).dot(direction) / length_squared, 0, 1)
+    return numpy.hypot(*(points - start - t[:, numpy.newaxis] * direction).T)
+
+def douglas_peucker(points, tolerance):
+    """ Simplify a polyline (sequence of (x, y) points) by Douglas-Peucker algorithm.
+    Returns N x 2 array of the kept points, every removed point is at most
+    tolerance away from the simplified polyline. End points are always kept. """
+    points = numpy.asarray(points, dtype=numpy.double).reshape(-1, 2)
+    if len(points) < 3:
+        return points
+
+    keep = numpy.zeros(len(points), dtype=bool)
+    keep[0] = keep[-1] = True
+
+    stack = [(0, len(points) - 1)]
+    while stack:
+        a, b = stack.pop()
+        if b - a < 2:
+            continue
+        distances = _distances(points[a + 1:b], points[a], points[b])
+        i = int(numpy.argmax(distances))
+        if distances[i] > tolerance:
+            i += a + 1
+            keep[i] = True
+            stack.append((a, i))
+            stack.append((i, b))
+
+    return points[keep]
+
+def simplify_polygon(points, tolerance):
+    """ Simplify a closed polygon (sequence of (x, y) vertices, without repeating
+    the first one at the end) by Douglas-Peucker algorithm.
+    The polygon is split to two polylines at its first vertex and the vertex
+    farthest from it, which are simplified separately.
+    Returns N x 2 array of vertices, can have less than three of them
+    if the polygon is smaller than tolerance. """
+    points = numpy.asarray(points, dtype=numpy.double).reshape(-1, 2)
+    if len(points) < 4:
+        return points
+
+    far = int(numpy.argmax(numpy.hypot(*(points - points[0]).T)))
+    if far == 0:
+        return points[:1]
+
+    first = douglas_peucker(points[:far + 1], tolerance)
+    second = douglas_peucker(numpy.concatenate((points[far:], points[:1])), tolerance)
+    return numpy.concatenate((first, second[1:-1]))
@@ -1,36 +1,522 @@
+import math
+import numpy
+
 class WorldMap:
     """ This is a map of working area.
-    The current implementation is just a placeholder to start testing the path planner,
-    later this will probably interface with openstreetmap. """
+    Without polygons it contains a placeholder map for testing the path planner,
+    real maps are loaded from GeoJSON or OpenStreetMap files by map_import.
+
+    Obstacles are polygons grouped to features (given by an integer id of each
+    polygon), a point collides if it is inside an odd number of polygons of any
+    feature. Polygons of one feature can make holes in each other, obstacles
+    of different features overlap. By default all polygons are one feature.
+    The robot is a disc, collision queries take its radius and report a collision
+    if the disc overlaps an obstacle (clearance of its center is less than the radius).
+    Collision queries are answered from a precomputed grid of signed distances
+    from cell centers to the nearest polygon edge (negative inside obstacles),
+    only points whose clearance is closer to the radius than the grid can resolve
+    are tested exactly, against edges near them found in a bucket grid.
+    The grid is rebuilt after the polygons change (assigning polygons or add_polygon). """
+
+    # Distances in the grid are clamped to the largest queried radius plus this value
+    distance_limit = 1
+
+    # Size of buckets of the edge index used by exact queries
+    bucket_size = 1
+
+    def __init__(self, polygons = None, resolution = 0.1, features = None):
+        if polygons is None:
+            polygons = [[(5, 5), (10, 5), (10, 10), (5, 10)],
+                        [(6, 2), (10, -4), (2, -5)]]
+        self.resolution = resolution
+        self.polygons = polygons
+        if features is not None:
+            self.features = features
+
+    @property
+    def polygons(self):
+        return self._polygons
+
+    @polygons.setter
+    def polygons(self, polygons):
+        """ Set the polygons, all of them become a single feature. """
+        self._polygons = [list(polygon) for polygon in polygons]
+        self._features = [0] * len(self._polygons)
+        self._grid = None
+
+    @property
+    def features(self):
+        return self._features
+
+    @features.setter
+    def features(self, features):
+        features = [int(feature) for feature in features]
+        if len(features) != len(self._polygons):
+            raise ValueError("There must be one feature for every polygon.")
+        self._features = features
+        self._grid = None
+
+    def add_polygon(self, polygon, feature = None):
+        """ Add an obstacle polygon (list of (x, y) vertices), as a part of
+        feature, or as a new feature if it is None.
+        Path planners using the map need to be told about the change
+        (Prm.invalidate_region). """
+        if feature is None:
+            feature = max(self._features, default=-1) + 1
+        self._polygons.append(list(polygon))
+        self._features.append(int(feature))
+        self._grid = None
+
+    def prepare(self, radius = 0):
+        """ Build the collision checking structures for queries with radius up to
+        radius now, instead of on the first query. """
+        self._get_grid(radius)
+
+    def has_collision(self, x, y, radius = 0):
+        grid = self._get_grid(radius)
+
+        i = (x - grid.x_min) / self.resolution
+        j = (y - grid.y_min) / self.resolution
+        if not (0 <= i < grid.distances.shape[1] and 0 <= j < grid.distances.shape[0]):
+            return False # Outside of bounding box of all polygons
+
+        distance = grid.distances[int(j), int(i)]
+        if distance - grid.exact_distance > radius:
+            return False
+        elif distance + grid.exact_distance < radius:
+            return True
+        else:
+            return self._has_collision_exact(x, y, radius)
+
+    def has_collision_many(self, x, y, radius = 0):
+        """ Vectorized has_collision, x and y are arrays of coordinates.
+        Returns boolean array. """
+        x, y = numpy.broadcast_arrays(numpy.asarray(x, dtype=numpy.double),
+                                      numpy.asarray(y, dtype=numpy.double))
+        grid = self._get_grid(radius)
+        distances = grid.lookup(x, y, self.resolution)
+
+        ret = distances + grid.exact_distance < radius
+        uncertain = numpy.abs(distances - radius) <= grid.exact_distance
+        if uncertain.any():
+            ret[uncertain] = self._has_collision_many_exact(x[uncertain], y[uncertain], radius)
+
+        return ret
+
+    def has_collision_segments(self, x1, y1, x2, y2, radius = 0):
+        """ Swept collision query, returns boolean array telling for each line
+        segment from (x1, y1) to (x2, y2) (arrays) if the robot moving along it
+        collides. Consecutive segments of a polyline through sampled states
+        check the whole local path, not just the samples. """
+        x1, y1, x2, y2 = numpy.broadcast_arrays(*(numpy.asarray(a, dtype=numpy.double)
+                                                  for a in (x1, y1, x2, y2)))
+        grid = self._get_grid(radius)
+        distances1 = grid.lookup(x1, y1, self.resolution)
+        distances2 = grid.lookup(x2, y2, self.resolution)
+        length = numpy.hypot(x2 - x1, y2 - y1)
+
+        # Clearance can't change faster than the position, a point at distance t
+        # from the first end point has clearance at least max(d1 - t, d2 - length + t).
+        with numpy.errstate(invalid="ignore"):
+            lower_bound = numpy.maximum((distances1 + distances2 - length) / 2,
+                                        numpy.maximum(distances1, distances2) - length)
+        lower_bound -= grid.exact_distance
+
+        ret = numpy.minimum(distances1, distances2) + grid.exact_distance < radius
+        uncertain = ~ret & ~(lower_bound > radius)
+        if uncertain.any():
+            ret[uncertain] = self._has_collision_segments_exact(x1[uncertain], y1[uncertain],
+                                                                x2[uncertain], y2[uncertain],
+                                                                radius)
+
+        return ret
+
+    def _has_collision_exact(self, x, y, radius = 0):
+        return bool(self._has_collision_many_exact(numpy.array([x], dtype=numpy.double),
+                                                   numpy.array([y], dtype=numpy.double),
+                                                   radius)[0])
+
+    def _has_collision_many_exact(self, x, y, radius = 0):
+        buckets = self._get_grid(radius).buckets
+        ret = buckets.inside(x, y)
+        if radius > 0:
+            ret |= buckets.near(x, y, radius)
+        return ret
+
+    def _has_collision_segments_exact(self, x1, y1, x2, y2, radius):
+        buckets = self._get_grid(radius).buckets
+        inside = buckets.inside(numpy.concatenate((x1, x2)), numpy.concatenate((y1, y2)))
+        return inside[:len(x1)] | inside[len(x1):] | buckets.segments_near(x1, y1, x2, y2, radius)
+
+    def _edges(self):
+        """ Return arrays x1, y1, x2, y2 of all polygon edges. """
+        edges = [polygon[i - 1] + polygon[i]
+                 for polygon in self._polygons
+                 for i in range(len(polygon))]
+        edges = numpy.array(edges, dtype=numpy.double).reshape(-1, 4)
+        return edges.T
+
+    def _edge_features(self):
+        """ Return array of features of all polygon edges, in the order of _edges. """
+        return numpy.repeat(numpy.array(self._features, dtype=numpy.int64),
+                            [len(polygon) for polygon in self._polygons])
+
+    def _get_grid(self, radius = 0):
+        limit = radius + self.distance_limit
+        if self._grid is None:
+            self._grid = _DistanceGrid(self._edges(), self._edge_features(), self.resolution,
+                                       limit, self.bucket_size)
+        elif self._grid.limit < limit:
+            # Only grow the limit, so that queries alternating between different
+            # radii don't keep rebuilding the grid
+            self._grid = _DistanceGrid(self._edges(), self._edge_features(), self.resolution,
+                                       limit, self.bucket_size)
+        return self._grid
+
+class _DistanceGrid:
+    """ Signed distances from cell centers to the nearest polygon edge,
+    clamped to limit, over the bounding box of the polygons extended
+    by limit. Cell [j, i] has its lower left corner at
+    (x_min + i * resolution, y_min + j * resolution).
+    Also holds an index of the edges (_EdgeBuckets) over the same area. """
+
+    def __init__(self, edges, edge_features, resolution, limit, bucket_size):
+        x1, y1, x2, y2 = edges
+        rows, columns = self._set_area(edges, resolution, limit)
+        margin = self.limit
+
+        # Buckets contain edges up to margin away, so exact queries with radius
+        # up to limit can be answered from the bucket of the point
+        self.buckets = _EdgeBuckets(edges, edge_features, self.x_min, self.y_min,
+                                    columns * resolution, rows * resolution,
+                                    bucket_size, margin)
+
+        center_x = self.x_min + (numpy.arange(columns) + 0.5) * resolution
+        center_y = self.y_min + (numpy.arange(rows) + 0.5) * resolution
+
+        # Every edge only updates cells up to margin away from it, so the work
+        # is proportional to total length of the edges, not to their number times
+        # the number of cells.
+        distances = numpy.full((rows, columns), float(margin))
+        for ex1, ey1, ex2, ey2 in zip(x1.tolist(), y1.tolist(), x2.tolist(), y2.tolist()):
+            i1 = max(int((min(ex1, ex2) - margin - self.x_min) / resolution), 0)
+            i2 = min(int((max(ex1, ex2) + margin - self.x_min) / resolution) + 1, columns)
+            j1 = max(int((min(ey1, ey2) - margin - self.y_min) / resolution), 0)
+            j2 = min(int((max(ey1, ey2) + margin - self.y_min) / resolution) + 1, rows)
+
+            block = distances[j1:j2, i1:i2]
+            numpy.minimum(block,
+                          _segment_distance(center_x[numpy.newaxis, i1:i2],
+                                            center_y[j1:j2, numpy.newaxis],
+                                            ex1, ey1, ex2, ey2),
+                          out=block)
+
+        inside = self.buckets.inside_grid(center_x, center_y)
+        self.distances = numpy.where(inside, -distances, distances)
+
+    @classmethod
+    def from_arrays(cls, edges, edge_features, resolution, limit, bucket_size, distances, bucket_arrays):
+        """ Create the grid from distances and arrays of _EdgeBuckets (listed in
+        _EdgeBuckets.array_names) of a grid previously built with the same
+        edges and parameters, for example loaded from a file. """
+        grid = cls.__new__(cls)
+        rows, columns = grid._set_area(edges, resolution, limit)
+        if distances.shape != (rows, columns):
+            raise ValueError("Distance grid doesn't match the edges")
+        grid.distances = distances
+        grid.buckets = _EdgeBuckets.from_arrays(edges, edge_features, grid.x_min, grid.y_min,
+                                                columns * resolution, rows * resolution,
+                                                bucket_size, grid.limit, bucket_arrays)
+        return grid
+
+    def _set_area(self, edges, resolution, limit):
+        """ Set limit and extent of the grid, return its shape. """
+        x1, y1, x2, y2 = edges
 
-    def __init__(self):
-        self.polygons = [[(5, 5), (10, 5), (10, 10), (5, 10)],
-                         [(6, 2), (10, -4), (2, -5)]]
+        # Every point of a cell is at most this far from its center, cells with
+        # larger distance don't contain any polygon edge.
+        self.exact_distance = resolution * math.sqrt(2) / 2
+        self.limit = max(limit, 2 * self.exact_distance)
 
-    def has_collision(self, x, y):
-        # TODO: The robot is definitely not just a point
+        margin = self.limit
+        if len(x1):
+            self.x_min = min(x1.min(), x2.min()) - margin
+            self.y_min = min(y1.min(), y2.min()) - margin
+            columns = int(math.ceil((max(x1.max(), x2.max()) + margin - self.x_min) / resolution))
+            rows = int(math.ceil((max(y1.max(), y2.max()) + margin - self.y_min) / resolution))
+        else:
+            self.x_min = self.y_min = 0
+            columns = rows = 0
+        return rows, columns
 
-        inside = False
+    def lookup(self, x, y, resolution):
+        """ Return array of distances of cells containing points x, y (arrays).
+        Points outside of the grid are at least limit away from all edges,
+        they get limit. """
+        with numpy.errstate(invalid="ignore"):
+            i = numpy.floor((x - self.x_min) / resolution)
+            j = numpy.floor((y - self.y_min) / resolution)
+            inside_grid = (i >= 0) & (i < self.distances.shape[1]) & \
+                          (j >= 0) & (j < self.distances.shape[0])
 
-        for polygon in self.polygons:
-            for i in range(len(polygon)):
-                x1, y1 = polygon[i - 1]
-                x2, y2 = polygon[i]
+        distances = numpy.full(x.shape, float(self.limit))
+        distances[inside_grid] = self.distances[j[inside_grid].astype(numpy.intp),
+                                                i[inside_grid].astype(numpy.intp)]
+        return distances
 
-                if y2 != y1:
-                    t = (y - y1) / (y2 - y1)
+class _EdgeBuckets:
+    """ Polygon edges sorted into a uniform grid of square buckets, so that
+    exact queries only test edges near the queried points.
 
-                    if t <= 0 or t > 1:
-                        continue
+    A bucket lists edges whose bounding box extended by margin overlaps it,
+    that is all edges closer than margin to any point in the bucket.
+    A horizontal band (row of buckets) lists edges whose vertical extent
+    overlaps it, these are the edges that can cross a horizontal line
+    in the band for the even-odd test.
+    Edges come with array of their features, the even-odd test is done for every
+    feature separately.
+    Queries outside of the area or reaching further than margin test all edges. """
 
-                    if x1 + t * (x2 - x1) > x:
-                        continue
+    array_names = ("bucket_indptr", "bucket_indices", "band_indptr", "band_indices")
+
+    def __init__(self, edges, features, x_min, y_min, width, height, size, margin):
+        self._set_area(edges, features, x_min, y_min, width, height, size, margin)
+
+        x1, y1, x2, y2 = edges
+        i1 = self._index(numpy.minimum(x1, x2) - margin, x_min, self.columns)
+        i2 = self._index(numpy.maximum(x1, x2) + margin, x_min, self.columns)
+        j1 = self._index(numpy.minimum(y1, y2) - margin, y_min, self.rows)
+        j2 = self._index(numpy.maximum(y1, y2) + margin, y_min, self.rows)
+        self.bucket_indptr, self.bucket_indices = _bucket_lists(i1, i2, j1, j2, self.columns,
+                                                                self.columns * self.rows)
+
+        j1 = self._index(numpy.minimum(y1, y2), y_min, self.rows)
+        j2 = self._index(numpy.maximum(y1, y2), y_min, self.rows)
+        self.band_indptr, self.band_indices = _bucket_lists(numpy.zeros_like(j1), numpy.zeros_like(j1),
+                                                            j1, j2, 1, self.rows)
+
+    @classmethod
+    def from_arrays(cls, edges, features, x_min, y_min, width, height, size, margin, arrays):
+        """ Create the index from arrays (listed in array_names) of a previously
+        built one with the same parameters. """
+        buckets = cls.__new__(cls)
+        buckets._set_area(edges, features, x_min, y_min, width, height, size, margin)
+        for name, array in zip(cls.array_names, arrays):
+            setattr(buckets, name, array)
+        if len(buckets.bucket_indptr) != buckets.columns * buckets.rows + 1 or \
+           len(buckets.band_indptr) != buckets.rows + 1:
+            raise ValueError("Edge buckets don't match the area")
+        return buckets
+
+    def _set_area(self, edges, features, x_min, y_min, width, height, size, margin):
+        self.edges = edges
+        self.features = features
+        # With a single feature the even-odd test just counts all crossings
+        self.single_feature = len(features) == 0 or bool((features == features[0]).all())
+        self.x_min = x_min
+        self.y_min = y_min
+        self.size = size
+        self.margin = margin
+        self.columns = max(int(math.ceil(width / size)), 1)
+        self.rows = max(int(math.ceil(height / size)), 1)
+
+    def _index(self, coordinate, origin, count):
+        """ Bucket index along one axis, clamped to the valid range. """
+        return numpy.clip(numpy.floor((coordinate - origin) / self.size), 0, count - 1).astype(numpy.intp)
+
+    def _bucket(self, x, y):
+        """ Return array of bucket numbers of points, -1 for points outside. """
+        with numpy.errstate(invalid="ignore"):
+            i = numpy.floor((x - self.x_min) / self.size)
+            j = numpy.floor((y - self.y_min) / self.size)
+            valid = (i >= 0) & (i < self.columns) & (j >= 0) & (j < self.rows)
+        return numpy.where(valid, j * self.columns + i, -1).astype(numpy.intp)
+
+    def _band(self, y):
+        with numpy.errstate(invalid="ignore"):
+            j = numpy.floor((y - self.y_min) / self.size)
+            valid = (j >= 0) & (j < self.rows)
+        return numpy.where(valid, j, -1).astype(numpy.intp)
+
+    def _groups(self, keys, indptr, indices):
+        """ Iterate over tuples (positions of queries, edges to test, features of
+        the edges) for queries grouped by bucket keys, key -1 tests all edges. """
+        order = numpy.argsort(keys, kind="stable")
+        sorted_keys = keys[order]
+        boundaries = numpy.flatnonzero(numpy.diff(sorted_keys)) + 1
+        for group in numpy.split(order, boundaries):
+            if not len(group):
+                continue
+            key = keys[group[0]]
+            if key < 0:
+                edges = self.edges
+                features = self.features
+            else:
+                edge_indices = indices[indptr[key]:indptr[key + 1]]
+                if not len(edge_indices):
+                    continue
+                edges = [edge[edge_indices] for edge in self.edges]
+                features = self.features[edge_indices]
+            yield group, edges, features
+
+    def inside_grid(self, x, y):
+        """ Even-odd test of a grid of points, x and y are increasing arrays of
+        coordinates of columns and rows. Returns boolean matrix (rows x columns).
+        Each row is a scanline, crossings of edges with it are sorted once
+        and points are inside if there is an odd number of crossings of some
+        feature left of them. """
+        ret = numpy.zeros((len(y), len(x)), dtype=bool)
+        bands = self._band(y)
+
+        with numpy.errstate(invalid="ignore", divide="ignore"):
+            for j, (row_y, band) in enumerate(zip(y.tolist(), bands.tolist())):
+                if band < 0:
+                    x1, y1, x2, y2 = self.edges
+                    features = self.features
+                else:
+                    edge_indices = self.band_indices[self.band_indptr[band]:self.band_indptr[band + 1]]
+                    x1, y1, x2, y2 = (edge[edge_indices] for edge in self.edges)
+                    features = self.features[edge_indices]
+
+                # Same rule as in inside()
+                crossing = (y1 > row_y) != (y2 > row_y)
+                crossings = x1[crossing] + (row_y - y1[crossing]) / (y2[crossing] - y1[crossing]) * \
+                            (x2[crossing] - x1[crossing])
+                order = numpy.argsort(crossings, kind="stable")
+                counts = numpy.searchsorted(crossings[order], x, side="right")
+                if self.single_feature:
+                    ret[j] = counts % 2 == 1
+                else:
+                    # Number of features with odd number of crossings so far
+                    # changes by one at every crossing
+                    ranks = _feature_ranks(features[crossing][order])
+                    odd = numpy.cumsum(numpy.where(ranks % 2 == 0, 1, -1)) > 0
+                    ret[j] = numpy.concatenate(([False], odd))[counts]
+
+        return ret
+
+    def inside(self, x, y):
+        """ Even-odd test, returns boolean array telling which points are inside polygons. """
+        shape = x.shape
+        x = x.ravel()
+        y = y.ravel()
+        ret = numpy.zeros(x.shape, dtype=bool)
+
+        bands = self._band(y)
+
+        with numpy.errstate(invalid="ignore", divide="ignore"):
+            for group, (x1, y1, x2, y2), features in self._groups(bands, self.band_indptr, self.band_indices):
+                px = x[group, numpy.newaxis]
+                py = y[group, numpy.newaxis]
+
+                # Edges crossing the horizontal line through the point on its left.
+                # End points at the height of the line count as below it, so
+                # that a line going through a vertex crosses either both
+                # or none of its edges if it only touches the polygon.
+                crossings = ((y1 > py) != (y2 > py)) & \
+                            (x1 + (py - y1) / (y2 - y1) * (x2 - x1) <= px)
+                if self.single_feature:
+                    ret[group] = crossings.sum(axis=1) % 2 == 1
                 else:
-                    if y1 != y:
-                        continue
-                    if min(x1, x2) >= x:
-                        continue
+                    ret[group] = _odd_feature_crossings(crossings, features)
+
+        return ret.reshape(shape)
+
+    def near(self, x, y, radius):
+        """ Return boolean array telling which points are closer than radius to an edge. """
+        ret = numpy.zeros(x.shape, dtype=bool)
+
+        keys = self._bucket(x, y)
+        if radius > self.margin:
+            keys[:] = -1
+
+        for group, (x1, y1, x2, y2), _ in self._groups(keys, self.bucket_indptr, self.bucket_indices):
+            ret[group] = (_segment_distance(x[group, numpy.newaxis], y[group, numpy.newaxis],
+                                            x1, y1, x2, y2) < radius).any(axis=1)
+
+        return ret
+
+    def segments_near(self, x1, y1, x2, y2, radius):
+        """ Return boolean array telling which segments x1, y1, x2, y2 (arrays)
+        properly cross an edge or come closer than radius to it. """
+        ret = numpy.zeros(x1.shape, dtype=bool)
+
+        # Edges that matter are within radius + length of the first end point
+        keys = self._bucket(x1, y1)
+        keys[numpy.hypot(x2 - x1, y2 - y1) + radius > self.margin] = -1
+
+        for group, (ex1, ey1, ex2, ey2), _ in self._groups(keys, self.bucket_indptr, self.bucket_indices):
+            sx1 = x1[group, numpy.newaxis]
+            sy1 = y1[group, numpy.newaxis]
+            sx2 = x2[group, numpy.newaxis]
+            sy2 = y2[group, numpy.newaxis]
+
+            # A segment entering an obstacle without ending inside it properly
+            # crosses its edges
+            hit = _segments_cross(sx1, sy1, sx2, sy2, ex1, ey1, ex2, ey2)
+
+            if radius > 0:
+                # If the segments don't cross, their distance is reached at an end point
+                distance = numpy.minimum(numpy.minimum(_segment_distance(sx1, sy1, ex1, ey1, ex2, ey2),
+                                                       _segment_distance(sx2, sy2, ex1, ey1, ex2, ey2)),
+                                         numpy.minimum(_segment_distance(ex1, ey1, sx1, sy1, sx2, sy2),
+                                                       _segment_distance(ex2, ey2, sx1, sy1, sx2, sy2)))
+                hit |= distance < radius
+
+            ret[group] = hit.any(axis=1)
+
+        return ret
+
+def _bucket_lists(i1, i2, j1, j2, columns, count):
+    """ Return compressed lists (indptr, indices) of edges in buckets, edge k
+    is in buckets with column i1[k] .. i2[k] and row j1[k] .. j2[k]. """
+    widths = i2 - i1 + 1
+    sizes = widths * (j2 - j1 + 1)
+    edges = numpy.repeat(numpy.arange(len(sizes)), sizes)
+    offsets = numpy.arange(sizes.sum()) - numpy.repeat(numpy.cumsum(sizes) - sizes, sizes)
+    buckets = (j1[edges] + offsets // widths[edges]) * columns + i1[edges] + offsets % widths[edges]
+
+    order = numpy.argsort(buckets, kind="stable")
+    indptr = numpy.zeros(count + 1, dtype=numpy.intp)
+    numpy.cumsum(numpy.bincount(buckets, minlength=count), out=indptr[1:])
+    return indptr, edges[order]
+
+def _feature_ranks(features):
+    """ Return array telling for every element of features how many
+    preceding elements are equal to it. """
+    order = numpy.argsort(features, kind="stable")
+    sorted_features = features[order]
+    starts = numpy.flatnonzero(numpy.concatenate(([True], sorted_features[1:] != sorted_features[:-1])))
+    ranks = numpy.empty(len(features), dtype=numpy.intp)
+    ranks[order] = numpy.arange(len(features)) - numpy.repeat(starts, numpy.diff(numpy.append(starts, len(features))))
+    return ranks
+
+def _odd_feature_crossings(crossings, features):
+    """ Return boolean array telling which rows of crossings (boolean matrix with
+    a column for every edge) have an odd number of crossings of edges of some feature. """
+    if not len(features):
+        return numpy.zeros(len(crossings), dtype=bool)
+    order = numpy.argsort(features, kind="stable")
+    sorted_features = features[order]
+    starts = numpy.flatnonzero(numpy.concatenate(([True], sorted_features[1:] != sorted_features[:-1])))
+    # Overflow of the counts doesn't change their parity
+    counts = numpy.add.reduceat(crossings[:, order].astype(numpy.uint8), starts, axis=1)
+    return (counts % 2 == 1).any(axis=1)
+
+def _segment_distance(x, y, x1, y1, x2, y2):
+    """ Distance of points x, y from segments x1, y1, x2, y2 (all can be arrays). """
+    dx = x2 - x1
+    dy = y2 - y1
+    length_squared = dx * dx + dy * dy
+    # Dot product is zero for degenerate segments too
+    t = numpy.clip(((x - x1) * dx + (y - y1) * dy) / numpy.maximum(length_squared, 1e-300), 0, 1)
+    return numpy.hypot(x - x1 - t * dx, y - y1 - t * dy)
 
-                inside = not inside
+def _segments_cross(x1, y1, x2, y2, x3, y3, x4, y4):
+    """ Return True where segment x1, y1, x2, y2 properly crosses segment x3, y3, x4, y4
+    (they have a common point that is not an end point of either). """
+    def side(ax, ay, bx, by, px, py):
+        return numpy.sign((bx - ax) * (py - ay) - (by - ay) * (px - ax))
 
-        return inside
+    return (side(x1, y1, x2, y2, x3, y3) * side(x1, y1, x2, y2, x4, y4) < 0) & \
+           (side(x3, y3, x4, y4, x1, y1) * side(x3, y3, x4, y4, x2, y2) < 0)